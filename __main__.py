@@ -1,13 +1,49 @@
-print("Бот запускается...")
+from app import importtime
+
+# Замер ставится до всех остальных импортов (в том числе app.config и dotenv) и снимается сразу
+# после чтения настроек, если отчет не нужен: IMPORT_TIME_REPORT может прийти и из .env
+importtime.install()
+
 import asyncio
-from app.bot import bot, dp, startup
+import logging
+import sys
+from app.config import Config
+
+if not Config.IMPORT_TIME_REPORT:
+    importtime.uninstall()
+
+from app.log import configure_from_env
+
+configure_from_env()
+logger = logging.getLogger('app')
+logger.info("Бот запускается...")
+
+try:
+    Config.validate()
+except ValueError as e:
+    logger.error("Некорректная настройка: %s", e)
+    sys.exit(1)
+
+from app.bot import bot, dp, startup, shutdown
+
+if Config.IMPORT_TIME_REPORT:
+    importtime.uninstall()
+    logger.info(importtime.report())
 
 async def main():
     try:
         await startup()
-        await dp.start_polling(bot)
-    except Exception as e:
-        print(f"Ошибка при запуске бота: {e}")
+        if Config.BOT_MODE == "webhook":
+            from app.webhook import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            # Если раньше был установлен вебхук, polling не получит апдейты
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    except Exception:
+        logger.exception("Ошибка при запуске бота")
+    finally:
+        await shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
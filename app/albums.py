@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import List, NamedTuple, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.types import InputMediaVideo
+
+# Отправка нескольких видео альбомами sendMediaGroup (до 10 видео в альбоме) вместо
+# отдельного sendVideo на каждое. Альбомы отправляются параллельно: темп и порядок сообщений
+# в чате держит планировщик отправок (app/ratelimit.py). Если альбом не ушел целиком
+# (например, один file_id недействителен), его видео досылаются по одному, чтобы узнать,
+# какие именно не отправились
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на число элементов в sendMediaGroup
+ALBUM_SIZE = 10
+
+
+class AlbumResult(NamedTuple):
+    sent: List[str]
+    # (подпись, текст ошибки)
+    failed: List[Tuple[str, str]]
+
+
+def split_albums(items: Sequence[Tuple[str, str]], size: int = ALBUM_SIZE) -> List[Sequence[Tuple[str, str]]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _send_one_by_one(bot: Bot, chat_id: int, album: Sequence[Tuple[str, str]]) -> AlbumResult:
+    sent, failed = [], []
+    for caption, file_id in album:
+        try:
+            await bot.send_video(chat_id, file_id, caption=caption)
+            sent.append(caption)
+        except Exception as e:
+            failed.append((caption, str(e)))
+    return AlbumResult(sent, failed)
+
+
+async def _send_album(bot: Bot, chat_id: int, album: Sequence[Tuple[str, str]]) -> AlbumResult:
+    # В альбоме должно быть минимум 2 элемента - одиночное видео уходит обычным sendVideo
+    if len(album) == 1:
+        return await _send_one_by_one(bot, chat_id, album)
+    try:
+        await bot.send_media_group(chat_id, [InputMediaVideo(media=file_id, caption=caption) for caption, file_id in album])
+        return AlbumResult([caption for caption, _ in album], [])
+    except Exception as e:
+        logger.warning('Альбом из %s видео не отправлен (%s), отправляю по одному', len(album), e)
+        return await _send_one_by_one(bot, chat_id, album)
+
+
+async def send_videos(bot: Bot, chat_id: int, items: Sequence[Tuple[str, str]]) -> AlbumResult:
+    # items: (подпись, file_id) в нужном порядке
+    results = await asyncio.gather(*(_send_album(bot, chat_id, album) for album in split_albums(list(items))))
+    sent, failed = [], []
+    for result in results:
+        sent.extend(result.sent)
+        failed.extend(result.failed)
+    return AlbumResult(sent, failed)
@@ -1,7 +1,19 @@
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from app.handlers import router, on_startup
+from app.handlers import router, on_startup, on_shutdown
+from app.config import Config
+from app.database import db
+from app.storage import SQLiteStorage
+from app.log import UpdateContextMiddleware
+from app.ratelimit import send_scheduler
+from app.notifications import notification_worker
+from app.metrics import CACHES, setup_metrics, start_metrics_server, stop_metrics_server
+from app.keyboards import keyboard_cache
+from app.pagination import page_cache
+from app.series_cache import series_cache
+from app.inline import inline_search
 import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -9,8 +21,50 @@ load_dotenv()
 
 TOKEN = os.getenv('BOT_TOKEN')
 bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# Все отправки в чаты проходят через общие лимиты Telegram (очередь с приоритетами, повтор после 429)
+bot.session.middleware(send_scheduler)
+logger = logging.getLogger(__name__)
+
+def create_storage():
+    if Config.FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if Config.FSM_STORAGE == 'redis':
+        if Config.REDIS_URL:
+            try:
+                from aiogram.fsm.storage.redis import RedisStorage
+                return RedisStorage.from_url(Config.REDIS_URL)
+            except ImportError:
+                logger.warning("Пакет redis не установлен, FSM-состояния будут храниться в SQLite")
+        else:
+            logger.warning("REDIS_URL не задан, FSM-состояния будут храниться в SQLite")
+    return SQLiteStorage(db, flush_interval=Config.FSM_FLUSH_INTERVAL, ttl=Config.FSM_STATE_TTL)
+
+storage = create_storage()
+dp = Dispatcher(storage=storage)
+# Контекст апдейта (update_id, user_id) для всех записей лога, сделанных при его обработке
+dp.update.outer_middleware(UpdateContextMiddleware())
 dp.include_router(router)
+# Время обработчиков, апдейтов и вызовов Bot API, попадания в кэши - на /metrics
+setup_metrics(dp, bot)
+CACHES.register('series', series_cache.stats)
+CACHES.register('keyboards', keyboard_cache.stats)
+CACHES.register('pages', page_cache.stats)
+CACHES.register('inline', inline_search.stats)
 
 async def startup():
-    await on_startup() 
\ No newline at end of file
+    await on_startup()
+    if isinstance(storage, SQLiteStorage):
+        await storage.start()
+    # Рассылки о новых сериях (в том числе недоделанные до перезапуска)
+    notification_worker.start(bot)
+    if Config.METRICS_ENABLED:
+        await start_metrics_server()
+
+async def shutdown():
+    # Сначала останавливаем рассылку и сбрасываем FSM-состояния, пока пул соединений еще открыт
+    await notification_worker.stop()
+    await inline_search.close()
+    await storage.close()
+    await on_shutdown()
+    await send_scheduler.close()
+    await stop_metrics_server() 
\ No newline at end of file
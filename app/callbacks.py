@@ -0,0 +1,175 @@
+import string
+from typing import Annotated, Any, Callable, Dict, NamedTuple, Optional, Tuple, Type, Union
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+from pydantic import BeforeValidator, PlainSerializer
+
+# Данные inline-кнопок и их маршрутизация. Каждая кнопка с параметрами описывается
+# классом CallbackData с коротким префиксом, id упаковываются в base36 - так callback_data
+# укладывается в лимит Telegram 64 байта даже для больших id.
+# Все callback-запросы проходят через одну таблицу маршрутов (CallbackRoutes): точное совпадение
+# строки или префикс до ":" ищутся в словаре, поэтому стоимость выбора обработчика не растет
+# с числом кнопок, в отличие от цепочки фильтров F.data == ... / F.data.startswith(...)
+
+_DIGITS = string.digits + string.ascii_lowercase
+
+
+def to_base36(value: int) -> str:
+    if value < 0:
+        return '-' + to_base36(-value)
+    encoded = ''
+    while True:
+        value, remainder = divmod(value, 36)
+        encoded = _DIGITS[remainder] + encoded
+        if not value:
+            return encoded
+
+
+def _from_base36(value: Any) -> Any:
+    # Значения из callback_data приходят строками, из кода - уже числами
+    return int(value, 36) if isinstance(value, str) else value
+
+
+# Целое число, которое в callback_data записывается в base36
+Id = Annotated[int, BeforeValidator(_from_base36), PlainSerializer(to_base36, return_type=str)]
+
+
+# --- Сериалы ---
+class ViewSeries(CallbackData, prefix='vs'):
+    series_id: Id
+
+
+class FoundSeries(CallbackData, prefix='fs'):
+    series_id: Id
+
+
+class SubscribeSeries(CallbackData, prefix='sb'):
+    series_id: Id
+
+
+class UnsubscribeSeries(CallbackData, prefix='us'):
+    series_id: Id
+
+
+# --- Сезоны и серии ---
+class SelectSeason(CallbackData, prefix='ss'):
+    season_id: Id
+
+
+class SendSeason(CallbackData, prefix='sa'):
+    season_id: Id
+
+
+class EpisodesPage(CallbackData, prefix='ep'):
+    season_id: Id
+    page: Id
+
+
+class SelectEpisode(CallbackData, prefix='se'):
+    episode_id: Id
+
+
+class PrevEpisode(CallbackData, prefix='pe'):
+    episode_id: Id
+
+
+class NextEpisode(CallbackData, prefix='ne'):
+    episode_id: Id
+
+
+# --- Постраничные списки ---
+class ListPage(CallbackData, prefix='pg'):
+    # Страница списка kind после (forward) или перед записью cursor
+    kind: str
+    forward: bool
+    cursor: Id
+
+
+# Старые форматы кнопок ("view_series:12"), которые остались в уже отправленных сообщениях
+LEGACY_PREFIXES: Dict[str, Type[CallbackData]] = {
+    'view_series': ViewSeries,
+    'found_series': FoundSeries,
+    'subscribe_series': SubscribeSeries,
+    'unsubscribe_series': UnsubscribeSeries,
+    'select_season': SelectSeason,
+    'send_season': SendSeason,
+    'episodes_page': EpisodesPage,
+    'select_episode': SelectEpisode,
+    'prev_episode': PrevEpisode,
+    'next_episode': NextEpisode,
+}
+
+
+class Route(NamedTuple):
+    handler: CallableObject
+    callback_data: Optional[CallbackData]
+
+
+class CallbackRoutes:
+    def __init__(self):
+        self._exact: Dict[str, CallableObject] = {}
+        self._prefixed: Dict[str, Tuple[Type[CallbackData], CallableObject]] = {}
+        self._legacy: Dict[str, Type[CallbackData]] = {}
+
+    def exact(self, data: str) -> Callable:
+        # Кнопка без параметров: callback_data == data
+        def decorator(handler):
+            self._exact[data] = CallableObject(handler)
+            return handler
+        return decorator
+
+    def on(self, callback_cls: Type[CallbackData]) -> Callable:
+        # Кнопка с параметрами: обработчик получает распакованный callback_data
+        def decorator(handler):
+            if callback_cls.__prefix__ in self._prefixed or callback_cls.__prefix__ in self._exact:
+                raise ValueError(f'Префикс callback_data {callback_cls.__prefix__!r} уже занят')
+            self._prefixed[callback_cls.__prefix__] = (callback_cls, CallableObject(handler))
+            return handler
+        return decorator
+
+    def legacy(self, prefixes: Dict[str, Type[CallbackData]]):
+        # Старые префиксы с десятичными числами разбираются в новые классы
+        self._legacy.update(prefixes)
+
+    def _unpack_legacy(self, callback_cls: Type[CallbackData], parts: str) -> CallbackData:
+        values = parts.split(':')
+        if len(values) != len(callback_cls.model_fields):
+            raise ValueError(f'Ожидалось {len(callback_cls.model_fields)} значений')
+        return callback_cls(**{name: int(value) for name, value in zip(callback_cls.model_fields, values)})
+
+    def resolve(self, data: str) -> Optional[Route]:
+        handler = self._exact.get(data)
+        if handler is not None:
+            return Route(handler, None)
+        prefix, separator, parts = data.partition(':')
+        if not separator:
+            return None
+        entry = self._prefixed.get(prefix)
+        try:
+            if entry is not None:
+                return Route(entry[1], entry[0].unpack(data))
+            callback_cls = self._legacy.get(prefix)
+            if callback_cls is not None and callback_cls.__prefix__ in self._prefixed:
+                return Route(self._prefixed[callback_cls.__prefix__][1], self._unpack_legacy(callback_cls, parts))
+        except (TypeError, ValueError):
+            # Поврежденные или чужие данные - такой кнопки у бота нет
+            return None
+        return None
+
+    def __call__(self, callback: CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        # Фильтр aiogram: найденный маршрут и callback_data попадают в аргументы обработчика
+        route = self.resolve(callback.data or '')
+        if route is None:
+            return False
+        return {'callback_route': route.handler, 'callback_data': route.callback_data}
+
+    def setup(self, router: Router):
+        router.callback_query(self)(dispatch_callback)
+
+
+async def dispatch_callback(callback: CallbackQuery, callback_route: CallableObject, **kwargs):
+    # Обработчику передаются только те аргументы (state, callback_data, bot ...), которые он объявил
+    return await callback_route.call(callback, **kwargs)
@@ -1,12 +1,92 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class Config:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
+    # Настройки базы данных
+    DB_PATH: str = os.getenv("DB_PATH", "app/films.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "4"))
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    # Нечеткий поиск сериалов: функция сходства rapidfuzz (WRatio, token_set_ratio, ratio ...),
+    # порог сходства, количество кандидатов и число потоков (-1 - все ядра)
+    SERIES_SEARCH_SCORER: str = os.getenv("SERIES_SEARCH_SCORER", "WRatio")
+    SERIES_SEARCH_CUTOFF: float = float(os.getenv("SERIES_SEARCH_CUTOFF", "70"))
+    SERIES_SEARCH_LIMIT: int = int(os.getenv("SERIES_SEARCH_LIMIT", "8"))
+    SEARCH_WORKERS: int = int(os.getenv("SEARCH_WORKERS", "-1"))
+    # Начиная с какого размера каталога кандидаты для нечеткого поиска отбираются через FTS5
+    SEARCH_PREFILTER_MIN_TITLES: int = int(os.getenv("SEARCH_PREFILTER_MIN_TITLES", "5000"))
+    SEARCH_PREFILTER_CANDIDATES: int = int(os.getenv("SEARCH_PREFILTER_CANDIDATES", "200"))
+    # Постраничные списки каталога
+    LIST_PAGE_SIZE: int = int(os.getenv("LIST_PAGE_SIZE", "30"))
+    CHECK_PAGE_SIZE: int = int(os.getenv("CHECK_PAGE_SIZE", "10"))
+    PAGE_CACHE_SIZE: int = int(os.getenv("PAGE_CACHE_SIZE", "256"))
+    # Сколько сериалов (со всеми сезонами и сериями) держать в кэше навигации
+    SERIES_CACHE_SIZE: int = int(os.getenv("SERIES_CACHE_SIZE", "256"))
+    # Кэш готовых клавиатур и число серий на странице выбора серии (у Telegram до 100 кнопок в сообщении)
+    KEYBOARD_CACHE_SIZE: int = int(os.getenv("KEYBOARD_CACHE_SIZE", "512"))
+    EPISODES_PER_PAGE: int = int(os.getenv("EPISODES_PER_PAGE", "90"))
+    # FSM-хранилище: sqlite (по умолчанию), redis (если задан REDIS_URL и установлен пакет redis) или memory
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "sqlite")
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    FSM_FLUSH_INTERVAL: float = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+    FSM_STATE_TTL: float = float(os.getenv("FSM_STATE_TTL", str(7 * 24 * 3600)))
+    # Массовый импорт каталога: строк манифеста на одну транзакцию
+    IMPORT_CHUNK_SIZE: int = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+    # Логирование: уровень, формат (json или text) и уровни отдельных логгеров ("app.handlers=DEBUG,aiogram=WARNING")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "aiogram.event=WARNING")
+    # Отчет о времени импорта модулей при запуске
+    IMPORT_TIME_REPORT: bool = os.getenv("IMPORT_TIME_REPORT", "0") == "1"
+    # Режим получения апдейтов: polling (по умолчанию) или webhook.
+    # WEBHOOK_URL - внешний адрес сервера; если пуст, вебхук в Telegram не регистрируется (локальная проверка)
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    # Число одновременно обрабатываемых апдейтов и общий размер очереди
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "8"))
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    # Лимиты исходящих сообщений Telegram: всего в секунду, в секунду на личный чат (и запас на короткую серию),
+    # в секунду на группу; сколько раз повторять запрос после 429 Too Many Requests
+    SEND_GLOBAL_RATE: float = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+    SEND_CHAT_RATE: float = float(os.getenv("SEND_CHAT_RATE", "1"))
+    SEND_CHAT_BURST: float = float(os.getenv("SEND_CHAT_BURST", "3"))
+    SEND_GROUP_RATE: float = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))
+    SEND_MAX_RETRIES: int = int(os.getenv("SEND_MAX_RETRIES", "3"))
+    # Рассылка о новых сериях: подписчиков в одной порции, как часто проверять очередь рассылок (секунды)
+    # и сколько раз повторять падающую рассылку, прежде чем пометить ее 'failed'
+    NOTIFY_CHUNK_SIZE: int = int(os.getenv("NOTIFY_CHUNK_SIZE", "100"))
+    NOTIFY_POLL_INTERVAL: float = float(os.getenv("NOTIFY_POLL_INTERVAL", "30"))
+    NOTIFY_MAX_ATTEMPTS: int = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+    # Inline-режим (@бот запрос): время кэша ответа в Telegram и в самом боте (секунды), размер кэша запросов,
+    # пауза в наборе перед поиском (секунды), сколько результатов искать, функция сходства и порог
+    INLINE_CACHE_TIME: int = int(os.getenv("INLINE_CACHE_TIME", "300"))
+    INLINE_CACHE_TTL: float = float(os.getenv("INLINE_CACHE_TTL", "60"))
+    INLINE_CACHE_SIZE: int = int(os.getenv("INLINE_CACHE_SIZE", "1024"))
+    INLINE_DEBOUNCE: float = float(os.getenv("INLINE_DEBOUNCE", "0.3"))
+    INLINE_MAX_RESULTS: int = int(os.getenv("INLINE_MAX_RESULTS", "200"))
+    INLINE_SEARCH_SCORER: str = os.getenv("INLINE_SEARCH_SCORER", "WRatio")
+    INLINE_SEARCH_CUTOFF: float = float(os.getenv("INLINE_SEARCH_CUTOFF", "60"))
+    # Метрики в формате Prometheus на локальном HTTP-эндпоинте /metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
 
     @classmethod
     def validate(cls):
         if not cls.BOT_TOKEN:
-            raise ValueError("BOT_TOKEN не найден в переменных окружения или .env файле") 
\ No newline at end of file
+            raise ValueError("BOT_TOKEN не найден в переменных окружения или .env файле")
+        if cls.BOT_MODE not in ("polling", "webhook"):
+            raise ValueError(f"Неизвестный BOT_MODE: {cls.BOT_MODE} (ожидается polling или webhook)")
+        if cls.BOT_MODE == "webhook":
+            # Без секрета любой, кто знает адрес сервера, может присылать боту поддельные апдейты
+            if not cls.WEBHOOK_SECRET:
+                raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET")
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", cls.WEBHOOK_SECRET):
+                raise ValueError("WEBHOOK_SECRET: от 1 до 256 символов A-Z, a-z, 0-9, _ и -")
@@ -0,0 +1,507 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import aiosqlite
+
+from app.config import Config
+from app.metrics import observe_db
+from app import queries
+from app.migrations import migrate, register_functions, explain_hot_queries, find_table_scans
+from app.queries import PAGE_SOURCES
+from app.text import normalize_title
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных триграмм запроса использовать в MATCH
+MAX_QUERY_TRIGRAMS = 64
+
+
+def fts_phrase(text: str) -> str:
+    # Строка как одна фраза FTS5 (кавычки внутри экранируются удвоением)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def trigram_match_query(text: str) -> Optional[str]:
+    # Триграммы берутся из того же нормализованного вида, что хранится в индексе
+    text = normalize_title(text)
+    trigrams = []
+    for i in range(len(text) - 2):
+        trigram = text[i:i + 3]
+        if trigram not in trigrams:
+            trigrams.append(trigram)
+        if len(trigrams) >= MAX_QUERY_TRIGRAMS:
+            break
+    if not trigrams:
+        return None
+    return ' OR '.join(fts_phrase(trigram) for trigram in trigrams)
+
+
+def validate_seasons_data(seasons_data: dict) -> List[Tuple[int, List[Tuple[int, str]]]]:
+    # Проверяет собранное в FSM дерево сезонов до записи в базу и приводит номера к int
+    # (хранилища на JSON превращают ключи словаря в строки). Возвращает [(сезон, [(эпизод, file_id), ...]), ...]
+    seasons = []
+    for season_number, season_data_item in seasons_data.items():
+        try:
+            season_number = int(season_number)
+            episodes = [(int(number), file_id) for number, file_id in season_data_item['episodes'].items()]
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f'Некорректные данные сезона {season_number}')
+        for episode_number, file_id in episodes:
+            if not isinstance(file_id, str) or not file_id.strip():
+                raise ValueError(f'Пустой file_id: сезон {season_number}, эпизод {episode_number}')
+        episodes.sort()
+        seasons.append((season_number, episodes))
+    if not seasons:
+        raise ValueError('Нет ни одного сезона')
+    seasons.sort()
+    return seasons
+
+
+# SQLite-сравнение COLLATE NOCASE приводит к нижнему регистру только латиницу A-Z
+_NOCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def nocase(text: str) -> str:
+    return text.translate(_NOCASE)
+
+
+def placeholders(count: int) -> str:
+    return ', '.join('?' * count)
+
+
+class IngestStats(NamedTuple):
+    series_id: int
+    seasons: int
+    episodes: int
+    seconds: float
+
+    @property
+    def rows(self) -> int:
+        return 1 + self.seasons + self.episodes
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float('inf')
+
+
+class Page(NamedTuple):
+    rows: list
+    has_prev: bool
+    has_next: bool
+
+
+class EpisodeView(NamedTuple):
+    file_id: str
+    episode_number: int
+    season_number: int
+    series_title: str
+    season_id: int
+    series_id: int
+    total_episodes: int
+    prev_id: Optional[int]
+    next_id: Optional[int]
+
+
+class Database:
+    # Пул долгоживущих соединений aiosqlite. Каждое соединение - это отдельный поток,
+    # поэтому открываем их один раз при старте, а не на каждый апдейт.
+    def __init__(self, path: str, pool_size: int = 4, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._connections: List[aiosqlite.Connection] = []
+        self._pool: Optional[asyncio.Queue] = None
+        self._schema_checked = False
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        # cached_statements: sqlite3 держит подготовленные выражения для одинаковых строк SQL,
+        # поэтому все запросы ниже - константы с параметрами "?"
+        conn = await aiosqlite.connect(self.path, cached_statements=256)
+        await conn.execute('PRAGMA journal_mode=WAL')
+        await conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        await conn.execute('PRAGMA synchronous=NORMAL')
+        await register_functions(conn)
+        return conn
+
+    async def connect(self):
+        if self._pool is not None:
+            return
+        self._pool = asyncio.Queue()
+        for _ in range(self.pool_size):
+            conn = await self._open_connection()
+            self._connections.append(conn)
+            self._pool.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._connections:
+            await conn.close()
+        self._connections = []
+        self._pool = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._pool is None:
+            await self.connect()
+        conn = await self._pool.get()
+        started = time.perf_counter()
+        try:
+            yield conn
+        except BaseException:
+            # Не возвращаем в пул соединение с незавершенной транзакцией
+            await conn.rollback()
+            raise
+        finally:
+            self._pool.put_nowait(conn)
+            observe_db(time.perf_counter() - started)
+
+    async def fetchone(self, sql: str, params: tuple = ()):
+        async with self.acquire() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: tuple = ()):
+        async with self.acquire() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def iter_rows(self, sql: str, params: tuple = (), chunk_size: int = 500):
+        # Построчная выборка порциями по chunk_size без загрузки всей таблицы в память.
+        # Первым элементом отдаются названия колонок
+        async with self.acquire() as conn:
+            async with conn.execute(sql, params) as cursor:
+                yield [column[0] for column in cursor.description]
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+
+    # --- Схема ---
+    async def init_db(self):
+        # Схема создается и обновляется миграциями (app/migrations.py, версия в PRAGMA user_version)
+        async with self.acquire() as conn:
+            for version, description in await migrate(conn):
+                logger.info('Применена миграция схемы %s: %s', version, description)
+            scans = find_table_scans(await explain_hot_queries(conn))
+        for name, details in scans.items():
+            logger.warning('Запрос %s читает таблицу целиком (%s)', name, '; '.join(details))
+        self._schema_checked = True
+
+    async def ensure_schema(self):
+        # Схема проверяется один раз за время жизни процесса (обычно уже в init_db при старте)
+        if not self._schema_checked:
+            await self.init_db()
+
+    async def match_title_trigrams(self, table: str, query: str, limit: int) -> Optional[List[int]]:
+        # Кандидаты для нечеткого поиска: ID записей, у которых больше всего общих триграмм
+        # с запросом (по рейтингу bm25). None - если в запросе нет ни одной триграммы
+        match = trigram_match_query(query)
+        if match is None:
+            return None
+        rows = await self.fetchall(queries.MATCH_TITLE_TRIGRAMS.format(fts=f'{table}_fts'), (match, limit))
+        return [row[0] for row in rows]
+
+    # --- Фильмы ---
+    async def add_film(self, title: str, file_id: str, user_id: int) -> int:
+        async with self.acquire() as conn:
+            cursor = await conn.execute('INSERT INTO films (title, file_id, user_id) VALUES (?, ?, ?)', (title, file_id, user_id))
+            await conn.commit()
+            return cursor.lastrowid
+
+    async def find_film_exact(self, title: str) -> Optional[Tuple[str, str]]:
+        # Поиск по точному совпадению (нечувствительный к регистру), возвращает (file_id, title)
+        return await self.fetchone(queries.FIND_FILM_EXACT, (title,))
+
+    async def list_films_full(self) -> List[Tuple[int, str, str, int]]:
+        return await self.fetchall(queries.LIST_FILMS_FULL)
+
+    async def find_film_titles_like(self, term: str) -> List[str]:
+        # Поиск подстроки по триграммному индексу вместо полного сканирования LIKE '%term%'.
+        # Триграммы есть только у строк от 3 символов, для коротких оставляем LIKE
+        normalized = normalize_title(term)
+        if len(normalized) < 3:
+            rows = await self.fetchall(queries.FIND_FILM_TITLES_SHORT, (f'%{term}%',))
+        else:
+            rows = await self.fetchall(queries.FIND_FILM_TITLES_FTS, (fts_phrase(normalized),))
+        return [row[0] for row in rows]
+
+    async def delete_films_by_title(self, title: str) -> List[int]:
+        # Возвращает ID удаленных фильмов, чтобы можно было обновить индекс поиска
+        async with self.acquire() as conn:
+            async with conn.execute(queries.FILM_IDS_BY_TITLE, (title, title)) as cursor:
+                film_ids = [row[0] for row in await cursor.fetchall()]
+            if film_ids:
+                await conn.execute(queries.DELETE_FILMS_BY_TITLE, (title, title))
+                await conn.commit()
+        return film_ids
+
+    async def delete_films_by_titles(self, titles: List[str]) -> List[Tuple[int, str]]:
+        # Удаляет фильмы по списку названий одной транзакцией, возвращает удаленные пары (id, title)
+        deleted = []
+        async with self.acquire() as conn:
+            for title in titles:
+                async with conn.execute(queries.FILM_IDS_BY_TITLE, (title, title)) as cursor:
+                    deleted.extend((row[0], title) for row in await cursor.fetchall())
+                await conn.execute(queries.DELETE_FILMS_BY_TITLE, (title, title))
+            await conn.commit()
+        return deleted
+
+    # --- Постраничные списки ---
+    async def fetch_page(self, kind: str, cursor: int, forward: bool, limit: int) -> Page:
+        # Keyset-пагинация по id: forward - записи после cursor, иначе - записи перед cursor.
+        # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+        page_queries = queries.PAGE_QUERIES[kind]
+        async with self.acquire() as conn:
+            sql = page_queries.after if forward else page_queries.before
+            async with conn.execute(sql, (cursor, limit + 1)) as cur:
+                rows = list(await cur.fetchall())
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if not forward:
+                rows.reverse()
+            if not rows:
+                return Page([], False, False)
+
+            # Есть ли записи с другой стороны страницы
+            if forward:
+                sql = page_queries.exists_before
+                edge_id = rows[0][0]
+            else:
+                sql = page_queries.exists_after
+                edge_id = rows[-1][0]
+            async with conn.execute(sql, (edge_id,)) as cur:
+                has_other_side = bool((await cur.fetchone())[0])
+
+        if forward:
+            return Page(rows, has_other_side, has_more)
+        return Page(rows, has_more, has_other_side)
+
+    # --- Сериалы ---
+    async def list_series(self) -> List[Tuple[int, str]]:
+        return await self.fetchall(queries.LIST_SERIES)
+
+    async def find_series_exact(self, title: str) -> Optional[Tuple[int, str]]:
+        return await self.fetchone(queries.FIND_SERIES_EXACT, (title,))
+
+    async def get_series_title(self, series_id: int) -> Optional[str]:
+        row = await self.fetchone(queries.GET_SERIES_TITLE, (series_id,))
+        return row[0] if row else None
+
+    async def list_seasons(self, series_id: int) -> List[Tuple[int, int]]:
+        return await self.fetchall(queries.LIST_SEASONS, (series_id,))
+
+    async def get_season(self, season_id: int) -> Optional[Tuple[int, int, str]]:
+        # (season_number, series_id, series_title) одним запросом
+        return await self.fetchone(queries.GET_SEASON, (season_id,))
+
+    async def load_series_tree(self, series_id: int):
+        # Сериал целиком одним запросом: (название, season_id, номер сезона, episode_id, номер серии, file_id).
+        # Сезоны без серий приходят с episode_id = NULL, сериал без сезонов - одной строкой с season_id = NULL
+        return await self.fetchall(queries.LOAD_SERIES_TREE, (series_id,))
+
+    async def list_episodes(self, season_id: int) -> List[Tuple[int, int]]:
+        return await self.fetchall(queries.LIST_EPISODES, (season_id,))
+
+    async def add_series(self, title: str, user_id: int, seasons_data: dict) -> IngestStats:
+        # Весь сериал (сериал, сезоны, эпизоды) пишется одной транзакцией: один commit
+        # вместо commit на каждый сезон, эпизоды сезона - одним executemany
+        seasons = validate_seasons_data(seasons_data)
+        await self.ensure_schema()
+        started = time.perf_counter()
+        episodes_count = 0
+        async with self.acquire() as conn:
+            cursor = await conn.execute('INSERT INTO series (title, user_id) VALUES (?, ?)', (title, user_id))
+            series_id = cursor.lastrowid
+            for season_number, episodes in seasons:
+                cursor = await conn.execute('INSERT INTO seasons (series_id, season_number) VALUES (?, ?)', (series_id, season_number))
+                season_id = cursor.lastrowid
+                await conn.executemany(
+                    'INSERT INTO episodes (season_id, episode_number, file_id, user_id) VALUES (?, ?, ?, ?)',
+                    [(season_id, episode_number, file_id, user_id) for episode_number, file_id in episodes],
+                )
+                episodes_count += len(episodes)
+            await conn.commit()
+        return IngestStats(series_id, len(seasons), episodes_count, time.perf_counter() - started)
+
+    async def upsert_catalogue(self, films: List[Tuple[str, str]], episodes: List[Tuple[str, int, int, str]], user_id: int) -> Tuple[int, int, int]:
+        # Порция массового импорта одной транзакцией. films: (название, file_id),
+        # episodes: (сериал, сезон, эпизод, file_id). Фильм, сериал, сезон и эпизод ищутся по названию
+        # (NOCASE) и номерам: найденный обновляется, иначе создается. Существующие записи выбираются
+        # несколькими запросами IN (...) на всю порцию, а вставки и обновления идут через executemany.
+        # Возвращает (добавлено, обновлено, без изменений)
+        await self.ensure_schema()
+        inserted = updated = unchanged = 0
+        async with self.acquire() as conn:
+            if films:
+                # Повтор названия внутри порции: побеждает последняя строка, остальные считаются без изменений
+                latest = {nocase(title): (title, file_id) for title, file_id in films}
+                unchanged += len(films) - len(latest)
+                existing: Dict[str, List[Tuple[int, str]]] = {}
+                keys = list(latest)
+                async with conn.execute(f'SELECT id, title, file_id FROM films WHERE title COLLATE NOCASE IN ({placeholders(len(keys))})', keys) as cursor:
+                    for film_id, title, file_id in await cursor.fetchall():
+                        existing.setdefault(nocase(title), []).append((film_id, file_id))
+                new_rows, changed = [], []
+                for key, (title, file_id) in latest.items():
+                    if key not in existing:
+                        new_rows.append((title, file_id, user_id))
+                        inserted += 1
+                    elif any(old_file_id != file_id for _, old_file_id in existing[key]):
+                        changed.extend((file_id, film_id) for film_id, _ in existing[key])
+                        updated += 1
+                    else:
+                        unchanged += 1
+                await conn.executemany('INSERT INTO films (title, file_id, user_id) VALUES (?, ?, ?)', new_rows)
+                await conn.executemany('UPDATE films SET file_id = ? WHERE id = ?', changed)
+
+            if episodes:
+                # Сериалы: при дублях названия в базе берем самый ранний
+                titles = {nocase(series): series for series, _, _, _ in episodes}
+                series_ids: Dict[str, int] = {}
+                keys = list(titles)
+                async with conn.execute(f'SELECT id, title FROM series WHERE title COLLATE NOCASE IN ({placeholders(len(keys))}) ORDER BY id', keys) as cursor:
+                    for series_id, title in await cursor.fetchall():
+                        series_ids.setdefault(nocase(title), series_id)
+                # Сериалы, которые уже были в базе: о новых сериях в них узнают подписчики
+                existing_series = set(series_ids.values())
+                for key, title in titles.items():
+                    if key not in series_ids:
+                        cursor = await conn.execute('INSERT INTO series (title, user_id) VALUES (?, ?)', (title, user_id))
+                        series_ids[key] = cursor.lastrowid
+
+                season_ids: Dict[Tuple[int, int], int] = {}
+                ids = list(set(series_ids.values()))
+                async with conn.execute(f'SELECT id, series_id, season_number FROM seasons WHERE series_id IN ({placeholders(len(ids))}) ORDER BY id', ids) as cursor:
+                    for season_id, series_id, season_number in await cursor.fetchall():
+                        season_ids.setdefault((series_id, season_number), season_id)
+                for series, season_number, _, _ in episodes:
+                    key = (series_ids[nocase(series)], season_number)
+                    if key not in season_ids:
+                        cursor = await conn.execute('INSERT INTO seasons (series_id, season_number) VALUES (?, ?)', key)
+                        season_ids[key] = cursor.lastrowid
+
+                latest_episodes = {}
+                for series, season_number, episode_number, file_id in episodes:
+                    latest_episodes[(season_ids[(series_ids[nocase(series)], season_number)], episode_number)] = file_id
+                unchanged += len(episodes) - len(latest_episodes)
+                existing_episodes: Dict[Tuple[int, int], Tuple[int, str]] = {}
+                ids = list({season_id for season_id, _ in latest_episodes})
+                async with conn.execute(f'SELECT id, season_id, episode_number, file_id FROM episodes WHERE season_id IN ({placeholders(len(ids))}) ORDER BY id', ids) as cursor:
+                    for episode_id, season_id, episode_number, file_id in await cursor.fetchall():
+                        existing_episodes.setdefault((season_id, episode_number), (episode_id, file_id))
+                season_series = {season_id: series_id for (series_id, _), season_id in season_ids.items()}
+                new_episodes: Dict[int, int] = {}
+                new_rows, changed = [], []
+                for (season_id, episode_number), file_id in latest_episodes.items():
+                    found = existing_episodes.get((season_id, episode_number))
+                    if found is None:
+                        new_rows.append((season_id, episode_number, file_id, user_id))
+                        inserted += 1
+                        series_id = season_series[season_id]
+                        if series_id in existing_series:
+                            new_episodes[series_id] = new_episodes.get(series_id, 0) + 1
+                    elif found[1] != file_id:
+                        changed.append((file_id, found[0]))
+                        updated += 1
+                    else:
+                        unchanged += 1
+                await conn.executemany('INSERT INTO episodes (season_id, episode_number, file_id, user_id) VALUES (?, ?, ?, ?)', new_rows)
+                await conn.executemany('UPDATE episodes SET file_id = ? WHERE id = ?', changed)
+                # Рассылка ставится в очередь в той же транзакции, что и сами серии
+                await self._queue_notifications(conn, new_episodes)
+            await conn.commit()
+        return inserted, updated, unchanged
+
+    # --- Эпизоды ---
+    async def get_episode_view(self, episode_id: int) -> Optional[EpisodeView]:
+        # Все данные для экрана просмотра серии одним запросом: количество серий в сезоне
+        # и соседние серии считаются оконными функциями по порядку номеров, поэтому
+        # пропуски в нумерации (1, 2, 4) не ломают навигацию
+        row = await self.fetchone(queries.GET_EPISODE_VIEW, (episode_id, episode_id))
+        return EpisodeView(*row) if row else None
+
+    # --- Подписки ---
+    async def subscribe(self, series_id: int, user_id: int) -> bool:
+        # True, если подписка новая
+        async with self.acquire() as conn:
+            cursor = await conn.execute('INSERT OR IGNORE INTO subscriptions (series_id, user_id, created_at) VALUES (?, ?, ?)',
+                                        (series_id, user_id, int(time.time())))
+            await conn.commit()
+            return cursor.rowcount == 1
+
+    async def unsubscribe(self, series_id: int, user_id: int) -> bool:
+        async with self.acquire() as conn:
+            cursor = await conn.execute(queries.DELETE_SUBSCRIPTION, (series_id, user_id))
+            await conn.commit()
+            return cursor.rowcount == 1
+
+    async def is_subscribed(self, series_id: int, user_id: int) -> bool:
+        return await self.fetchone(queries.IS_SUBSCRIBED, (series_id, user_id)) is not None
+
+    async def subscribers_after(self, series_id: int, after_user_id: int, limit: int) -> List[int]:
+        # Следующая порция подписчиков по порядку user_id (keyset-пагинация по первичному ключу)
+        rows = await self.fetchall(queries.SUBSCRIBERS_AFTER, (series_id, after_user_id, limit))
+        return [row[0] for row in rows]
+
+    async def remove_subscribers(self, series_id: int, user_ids: List[int]):
+        # Пользователи, заблокировавшие бота
+        async with self.acquire() as conn:
+            await conn.executemany(queries.DELETE_SUBSCRIPTION, [(series_id, user_id) for user_id in user_ids])
+            await conn.commit()
+
+    # --- Рассылки о новых сериях ---
+    async def _queue_notifications(self, conn, new_episodes: Dict[int, int]):
+        # new_episodes: series_id -> число новых серий. Пока рассылка не началась, новые серии
+        # того же сериала добавляются в нее же, а не создают вторую. Сериалы без подписчиков пропускаются
+        now = int(time.time())
+        for series_id, count in new_episodes.items():
+            cursor = await conn.execute(queries.MERGE_PENDING_NOTIFICATION, (count, series_id))
+            if cursor.rowcount == 0:
+                await conn.execute('''
+                    INSERT INTO notification_jobs (series_id, episodes, created_at)
+                    SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM subscriptions WHERE series_id = ?)
+                ''', (series_id, count, now, series_id))
+
+    async def claim_notification_job(self) -> Optional[Tuple[int, int, int, int, int]]:
+        # Сначала незаконченная рассылка (бот перезапустился посреди нее), затем самая старая из очереди.
+        # Возвращает (id, series_id, episodes, last_user_id, sent)
+        async with self.acquire() as conn:
+            async with conn.execute(queries.CLAIM_NOTIFICATION_JOB) as cursor:
+                job = await cursor.fetchone()
+            if job is not None:
+                await conn.execute("UPDATE notification_jobs SET status = 'running' WHERE id = ?", (job[0],))
+                await conn.commit()
+            return job
+
+    async def advance_notification_job(self, job_id: int, last_user_id: int, sent: int):
+        async with self.acquire() as conn:
+            await conn.execute('UPDATE notification_jobs SET last_user_id = ?, sent = ? WHERE id = ?', (last_user_id, sent, job_id))
+            await conn.commit()
+
+    async def fail_notification_job(self, job_id: int, max_attempts: int) -> bool:
+        # Учитывает неудачную попытку; True - попытки исчерпаны и задание помечено 'failed'.
+        # Иначе задание остается 'running' и продолжится с last_user_id при следующей выборке
+        async with self.acquire() as conn:
+            async with conn.execute('SELECT attempts FROM notification_jobs WHERE id = ?', (job_id,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return True
+            attempts = row[0] + 1
+            failed = attempts >= max_attempts
+            await conn.execute(
+                "UPDATE notification_jobs SET attempts = ?, status = CASE WHEN ? THEN 'failed' ELSE status END, finished_at = CASE WHEN ? THEN ? ELSE finished_at END WHERE id = ?",
+                (attempts, failed, failed, int(time.time()), job_id),
+            )
+            await conn.commit()
+            return failed
+
+    async def finish_notification_job(self, job_id: int):
+        async with self.acquire() as conn:
+            await conn.execute("UPDATE notification_jobs SET status = 'done', finished_at = ? WHERE id = ?", (int(time.time()), job_id))
+            await conn.commit()
+
+db = Database(Config.DB_PATH, pool_size=Config.DB_POOL_SIZE, busy_timeout_ms=Config.DB_BUSY_TIMEOUT_MS)
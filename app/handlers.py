@@ -1,56 +1,44 @@
 import asyncio
+import logging
 from aiogram import types, Router, F
 from aiogram.filters import Command, CommandObject
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaVideo
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
-import aiosqlite
-import os
-import pandas as pd
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from rapidfuzz import process, fuzz # Импортируем process и fuzz из rapidfuzz
+from app.config import Config
+from app.database import db, PAGE_SOURCES
+from app.search import film_index, series_index, load_indexes, get_scorer
+from app.pagination import page_cache, get_page, render_page
+from app.export import build_export, EXPORT_FORMATS
+from app.manifest import import_manifest, manifest_format, MANIFEST_FORMATS
+from app.series_cache import series_cache
+from app.notifications import notification_worker
+from app.albums import send_videos
+from app.ratelimit import bulk_sends
+from app.inline import inline_search, answer_page, parse_series_start_parameter
+from app.log import set_level
+from app.keyboards import (
+    get_main_menu, get_series_actions_keyboard, seasons_keyboard, episodes_keyboard,
+    episode_navigation_keyboard,
+)
+from app.callbacks import (
+    CallbackRoutes, LEGACY_PREFIXES, ViewSeries, FoundSeries, SubscribeSeries, UnsubscribeSeries,
+    SelectSeason, SendSeason, EpisodesPage, SelectEpisode, PrevEpisode, NextEpisode, ListPage,
+)
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+# Все inline-кнопки маршрутизируются одной таблицей (app/callbacks.py), а не цепочкой фильтров
+callbacks = CallbackRoutes()
+callbacks.legacy(LEGACY_PREFIXES)
+callbacks.setup(router)
 
-DB_PATH = 'app/films.db'
 ADMIN_IDS = {307631283}  # Замените на реальные Telegram ID админов
 SEARCH_THRESHOLD = 60 # Порог сходства для нечеткого поиска (можно настроить)
-
-# --- Инициализация базы данных ---
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''CREATE TABLE IF NOT EXISTS films (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            file_id TEXT NOT NULL,
-            user_id INTEGER NOT NULL
-        )''')
-        # Таблицы для сериалов
-        await db.execute('''CREATE TABLE IF NOT EXISTS series (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL
-        )''')
-        # Проверяем наличие колонки user_id в таблице series и добавляем, если отсутствует
-        cursor = await db.execute("PRAGMA table_info(series)")
-        columns = await cursor.fetchall()
-        column_names = [col[1] for col in columns]
-        if 'user_id' not in column_names:
-            await db.execute('ALTER TABLE series ADD COLUMN user_id INTEGER') # Добавляем колонку user_id
-            await db.commit()
-        await db.execute('''CREATE TABLE IF NOT EXISTS seasons (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            series_id INTEGER NOT NULL,
-            season_number INTEGER NOT NULL,
-            FOREIGN KEY (series_id) REFERENCES series(id)
-        )''')
-        await db.execute('''CREATE TABLE IF NOT EXISTS episodes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            season_id INTEGER NOT NULL,
-            episode_number INTEGER NOT NULL,
-            file_id TEXT NOT NULL,
-            FOREIGN KEY (season_id) REFERENCES seasons(id)
-        )''')
-        await db.commit()
+SERIES_SEARCH_SCORER = get_scorer(Config.SERIES_SEARCH_SCORER)
 
 # --- Состояния FSM ---
 class UploadFilm(StatesGroup):
@@ -76,11 +64,13 @@ class UploadFilm(StatesGroup):
     waiting_for_season_selection = State() # Ожидание выбора сезона
     # Состояние для выбора эпизода
     waiting_for_episode_selection = State()
+    # Ожидание файла для массового импорта
+    waiting_for_import_file = State()
 
 # --- FSM обработчики для текстового ввода (перемещены выше) ---
 @router.message(UploadFilm.waiting_for_title, F.text)
 async def handle_title(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод названия фильма в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод названия фильма в FSM: %s", message.text)
     data = await state.get_data()
     title = message.text.strip()
     file_id = data.get('file_id')
@@ -89,10 +79,9 @@ async def handle_title(message: types.Message, state: FSMContext):
         await message.answer('Ошибка. Попробуйте загрузить видео заново.')
         await state.clear()
         return
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('CREATE TABLE IF NOT EXISTS films (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, file_id TEXT NOT NULL, user_id INTEGER NOT NULL)')
-        await db.execute('INSERT INTO films (title, file_id, user_id) VALUES (?, ?, ?)', (title, file_id, user_id))
-        await db.commit()
+    film_id = await db.add_film(title, file_id, user_id)
+    film_index.add(film_id, title, (title, file_id))
+    page_cache.invalidate('films')
     await message.answer(f'Фильм "{title}" успешно добавлен!')
     await state.clear()
     is_admin = int(message.from_user.id) in ADMIN_IDS
@@ -100,18 +89,15 @@ async def handle_title(message: types.Message, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_find_title, F.text)
 async def process_find_title(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод для поиска фильма в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод для поиска фильма в FSM: %s", message.text)
     title_to_find = message.text.strip()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Поиск по точному совпадению (нечувствительный к регистру)
-        async with db.execute('SELECT file_id, title FROM films WHERE title = ? COLLATE NOCASE', (title_to_find,)) as cursor:
-            exact_match = await cursor.fetchone()
+    # Поиск по точному совпадению нормализованного названия (без обращения к базе)
+    exact_match = film_index.find_exact(title_to_find)
 
     if exact_match:
-        file_id_to_send = exact_match[0]
-        found_title = exact_match[1]
-        print(f'[ТЕСТ] Фильм "{found_title}" найден, пытаюсь отправить video с file_id: {file_id_to_send}') # Отладочное сообщение
+        found_title, file_id_to_send = exact_match
+        logger.debug('Фильм "%s" найден, пытаюсь отправить video с file_id: %s', found_title, file_id_to_send)
         try:
             await message.answer_video(file_id_to_send)
             await message.answer(f'Отправляю фильм "{found_title}".')
@@ -121,24 +107,20 @@ async def process_find_title(message: types.Message, state: FSMContext):
         is_admin = int(message.from_user.id) in ADMIN_IDS
         await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
     else:
-        # Если точное совпадение не найдено, ищем похожие названия с rapidfuzz
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute('SELECT title, file_id FROM films') as cursor:
-                all_films = await cursor.fetchall()
+        # Если точное совпадение не найдено, предлагаем названия, начинающиеся с введенного текста,
+        # и добираем похожие с rapidfuzz (кандидаты из FTS5 для большого каталога)
+        # results формат: [((title, file_id), score), ...], уже отфильтрован по порогу сходства
+        similar_results_with_scores = await film_index.suggest(title_to_find, limit=10, score_cutoff=SEARCH_THRESHOLD)
 
-        # Используем rapidfuzz для нечеткого поиска
-        # results формат: [(найденное_название, score, index_в_all_films), ...]
-        similar_results_with_scores = process.extract(title_to_find, [film[0] for film in all_films], scorer=fuzz.ratio, limit=10) # Используем fuzz.ratio и ограничиваем 10 результатами
-
-        # Фильтруем результаты по порогу сходства и получаем уникальные названия
+        # Оставляем только уникальные названия
         similar_results = []
         seen_titles = set()
-        for result, score, index in similar_results_with_scores:
-            if score >= SEARCH_THRESHOLD and result not in seen_titles:
-                similar_results.append(all_films[index]) # Сохраняем пару (title, file_id)
-                seen_titles.add(result)
+        for (title, file_id), score in similar_results_with_scores:
+            if title not in seen_titles:
+                similar_results.append((title, file_id)) # Сохраняем пару (title, file_id)
+                seen_titles.add(title)
 
-        print(f"[ТЕСТ] Результаты нечеткого поиска rapidfuzz для '{title_to_find}' (порог {SEARCH_THRESHOLD}): {similar_results}") # Отладочный вывод
+        logger.debug("Результаты нечеткого поиска rapidfuzz для '%s' (порог %s): %s", title_to_find, SEARCH_THRESHOLD, similar_results)
 
         if similar_results:
             # Сохраняем найденные результаты для выбора в следующем состоянии
@@ -158,7 +140,7 @@ async def process_find_title(message: types.Message, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_send_fileid, F.text)
 async def process_send_fileid(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод для отправки по file_id в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод для отправки по file_id в FSM: %s", message.text)
     uid = int(message.from_user.id)
     if uid not in ADMIN_IDS:
         await message.answer('Нет доступа.')
@@ -168,7 +150,7 @@ async def process_send_fileid(message: types.Message, state: FSMContext):
         return
 
     file_id = message.text.strip()
-    print(f'[ТЕСТ] Пытаюсь отправить video с file_id: {file_id}')
+    logger.debug("Пытаюсь отправить video с file_id: %s", file_id)
     try:
         await message.answer_video(file_id)
     except Exception as e:
@@ -195,9 +177,7 @@ async def find_film(message: types.Message):
         await message.answer('Укажите название фильма: /find <название>')
         return
     title = parts[1].strip()
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT file_id FROM films WHERE title = ?', (title,)) as cursor:
-            row = await cursor.fetchone()
+    row = await db.find_film_exact(title)
     if row:
         await message.answer(f'[ТЕСТ] Фильм найден, file_id: {row[0]}')
         await message.answer_video(row[0])
@@ -212,7 +192,7 @@ async def send_video_by_file_id(message: types.Message):
         await message.answer('Укажите file_id: /send <file_id>')
         return
     file_id = parts[1].strip()
-    print(f'[ТЕСТ] Отправляю видео по file_id: {file_id}')
+    logger.debug("Отправляю видео по file_id: %s", file_id)
     await message.answer_video(file_id)
 
 # --- Экспорт в Excel (только для админов) ---
@@ -223,14 +203,85 @@ async def export_db(message: types.Message):
     if uid not in ADMIN_IDS:
         await message.answer('Нет доступа. Ваш user_id не в списке админов.')
         return
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title, file_id, user_id FROM films') as cursor:
-            rows = await cursor.fetchall()
-    df = pd.DataFrame(rows, columns=['id', 'title', 'file_id', 'user_id'])
-    excel_path = 'app/films_export.xlsx'
-    df.to_excel(excel_path, index=False)
-    await message.answer_document(types.FSInputFile(excel_path))
-    os.remove(excel_path)
+    # /export - Excel, /export csv - zip с CSV-файлами
+    parts = message.text.split(maxsplit=1)
+    export_format = parts[1].strip().lower() if len(parts) > 1 else 'xlsx'
+    if export_format not in EXPORT_FORMATS:
+        await message.answer(f'Неизвестный формат. Доступны: {", ".join(EXPORT_FORMATS)}')
+        return
+    await message.answer_document(await build_export(export_format))
+
+# --- Массовый импорт каталога (только для админов) ---
+# Telegram отдает ботам файлы размером до 20 МБ
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+IMPORT_HELP = ('Отправьте файл CSV, JSON (массив или JSON Lines) или XLSX.\n'
+               'Эпизоды: колонки series, season, episode, file_id.\n'
+               'Фильмы: колонки title, file_id.\n'
+               'Существующие записи с тем же названием и номерами обновляются.')
+
+@router.message(F.text.startswith('/import'))
+async def import_catalogue(message: types.Message, state: FSMContext):
+    uid = int(message.from_user.id)
+    if uid not in ADMIN_IDS:
+        await message.answer('Нет доступа. Ваш user_id не в списке админов.')
+        return
+    await message.answer(IMPORT_HELP)
+    await state.set_state(UploadFilm.waiting_for_import_file)
+
+@router.message(UploadFilm.waiting_for_import_file, F.document)
+async def handle_import_file(message: types.Message, state: FSMContext):
+    document = message.document
+    logger.debug("Получен файл для импорта: %s, %s байт", document.file_name, document.file_size)
+    file_format = manifest_format(document.file_name)
+    if file_format is None:
+        await message.answer(f'Неподдерживаемый формат файла. Доступны: {", ".join(MANIFEST_FORMATS)}')
+        return # Остаемся в состоянии ожидания файла
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await message.answer('Файл больше 20 МБ. Разбейте его на несколько частей.')
+        return
+    await state.clear()
+    buffer = await message.bot.download(document)
+    summary = await import_manifest(buffer.getvalue(), file_format, message.from_user.id)
+    if summary.inserted or summary.updated:
+        await load_indexes()
+        page_cache.invalidate('films')
+        page_cache.invalidate('series')
+        series_cache.clear()
+        # Новые серии существующих сериалов уже поставлены в очередь рассылки подписчикам
+        notification_worker.wake()
+    logger.info("Импорт: %s", summary)
+    await message.answer(summary.format())
+    is_admin = int(message.from_user.id) in ADMIN_IDS
+    await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
+
+# --- Уровень логирования во время работы (только для админов) ---
+@router.message(F.text.startswith('/loglevel'))
+async def change_log_level(message: types.Message):
+    if int(message.from_user.id) not in ADMIN_IDS:
+        await message.answer('Нет доступа. Ваш user_id не в списке админов.')
+        return
+    # /loglevel DEBUG - для всего бота, /loglevel WARNING aiogram - для отдельного логгера
+    parts = message.text.split()
+    if len(parts) < 2:
+        await message.answer(f'Текущий уровень: {logging.getLevelName(logging.getLogger().level)}\nИспользование: /loglevel <DEBUG|INFO|WARNING|ERROR> [логгер]')
+        return
+    logger_name = parts[2] if len(parts) > 2 else None
+    try:
+        level = set_level(parts[1], logger_name)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    logger.warning('Уровень логирования %s изменен на %s', logger_name or 'root', level)
+    await message.answer(f'Уровень логирования {logger_name or "бота"}: {level}')
+
+# --- Статистика кэша навигации по сериалам (только для админов) ---
+@router.message(F.text == '/cache_stats')
+async def cache_stats(message: types.Message):
+    if int(message.from_user.id) not in ADMIN_IDS:
+        await message.answer('Нет доступа. Ваш user_id не в списке админов.')
+        return
+    stats = series_cache.stats()
+    await message.answer(f"Кэш сериалов: {stats['series']} шт.\nПопадания: {stats['hits']}\nПромахи: {stats['misses']}\nДоля попаданий: {stats['hit_rate']:.1%}")
 
 # --- Список фильмов (только для админов) ---
 @router.message(F.text.startswith('/list'))
@@ -240,70 +291,85 @@ async def list_films(message: types.Message):
     if uid not in ADMIN_IDS:
         await message.answer('Нет доступа. Ваш user_id не в списке админов.')
         return
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title FROM films') as cursor:
-            rows = await cursor.fetchall()
-    if not rows:
-        await message.answer('База пуста.')
-        return
-    text = '\n'.join([f'{r[0]}. {r[1]}' for r in rows])
-    await message.answer(f'Список фильмов:\n{text}')
+    await send_page(message, 'films')
 
 # --- Проверка содержимого базы (отладка) ---
 @router.message(F.text.startswith('/check'))
 async def check_db(message: types.Message):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title, file_id, user_id FROM films') as cursor:
-            rows = await cursor.fetchall()
-    if not rows:
-        await message.answer('[ТЕСТ] База пуста.')
-    else:
-        text = '\n'.join([f'id: {r[0]}, title: {r[1]}, file_id: {r[2]}, user_id: {r[3]}' for r in rows])
-        await message.answer(f'[ТЕСТ] Содержимое базы:\n{text}')
+    await send_page(message, 'check')
+
+# --- Постраничный вывод списков ---
+async def send_page(message: types.Message, kind: str):
+    # Отправляет первую страницу списка с кнопками навигации
+    page = await get_page(kind)
+    text, keyboard = render_page(kind, page)
+    await message.answer(text, reply_markup=keyboard)
+
+@callbacks.on(ListPage)
+async def cb_page(callback: types.CallbackQuery, callback_data: ListPage):
+    if callback_data.kind not in PAGE_SOURCES:
+        await callback.answer('Некорректная страница.')
+        return
+    kind = callback_data.kind
+    page = await get_page(kind, callback_data.cursor, callback_data.forward)
+    text, keyboard = render_page(kind, page)
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except Exception as e:
+        pass # Игнорируем ошибку, если содержимое не изменилось или сообщение удалено
+    await callback.answer()
 
 # --- Инициализация при старте ---
 async def on_startup():
-    await init_db()
-
-def get_main_menu(is_admin=False):
-    print(f"[ТЕСТ] Построение меню. Пользователь админ: {is_admin}")
-    all_buttons = [
-        InlineKeyboardButton(text='Найти фильм', callback_data='find_film'),
-        InlineKeyboardButton(text='Список фильмов', callback_data='list_films'),
-        InlineKeyboardButton(text='Список сериалов', callback_data='list_series'),
-        InlineKeyboardButton(text='Найти сериал', callback_data='find_series'),
-    ]
-    if is_admin:
-        admin_buttons = [
-            InlineKeyboardButton(text='Добавить сериал', callback_data='add_series'),
-            InlineKeyboardButton(text='Добавить видео', callback_data='add_video'),
-            InlineKeyboardButton(text='Отправить по file_id', callback_data='send_fileid'),
-            InlineKeyboardButton(text='Экспорт в Excel', callback_data='export_db'),
-            InlineKeyboardButton(text='Удалить фильм по названию', callback_data='delete_film_by_title'),
-            InlineKeyboardButton(text='Проверить базу', callback_data='check_db'),
-        ]
-        all_buttons = admin_buttons + all_buttons
-
-    # Группируем кнопки по две
-    grouped_buttons = []
-    for i in range(0, len(all_buttons), 2):
-        grouped_buttons.append(all_buttons[i:i+2])
-
-    return InlineKeyboardMarkup(inline_keyboard=grouped_buttons)
+    await db.connect()
+    await db.init_db()
+    await load_indexes()
+
+async def on_shutdown():
+    await db.close()
 
 @router.message(F.text == '/start')
 async def start_menu(message: types.Message):
     uid = int(message.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Команда /start. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Команда /start. Пользователь %s является админом: %s", uid, is_admin)
     await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
+@router.message(F.text.startswith('/start '))
+async def start_deep_link(message: types.Message, state: FSMContext):
+    # Переход по ссылке из inline-результата: t.me/<бот>?start=series_<id>
+    series_id = parse_series_start_parameter(message.text.split(maxsplit=1)[1])
+    tree = await series_cache.get_series(series_id) if series_id is not None else None
+    is_admin = int(message.from_user.id) in ADMIN_IDS
+    if tree is None:
+        await message.answer('Сериал не найден.')
+        await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
+        return
+    await state.clear()
+    await state.update_data(found_series_id=tree.series_id, found_series_title=tree.title)
+    subscribed = await db.is_subscribed(tree.series_id, message.from_user.id)
+    await message.answer(f'Сериал "{tree.title}" найден. Выберите действие:', reply_markup=get_series_actions_keyboard(tree.series_id, subscribed))
+    await state.set_state(UploadFilm.waiting_for_series_action)
+
+# --- Inline-режим ---
+@router.inline_query()
+async def inline_search_query(inline_query: types.InlineQuery):
+    if not inline_query.query.strip():
+        await inline_query.answer([], cache_time=Config.INLINE_CACHE_TIME, is_personal=False)
+        return
+    results = inline_search.get(inline_search.key(inline_query.query))
+    if results is None:
+        # Пока пользователь печатает, поиск ждет паузу в фоновой задаче, а не в обработчике
+        inline_search.submit(inline_query)
+        return
+    await answer_page(inline_query, results)
+
 # --- Inline кнопки и их обработка ---
-@router.callback_query(F.data == 'add_video')
+@callbacks.exact('add_video')
 async def cb_add_video(callback: types.CallbackQuery, state: FSMContext):
     uid = int(callback.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Кнопка 'Добавить видео'. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Кнопка 'Добавить видео'. Пользователь %s является админом: %s", uid, is_admin)
     if not is_admin:
         await callback.message.answer('Нет доступа.')
         return
@@ -319,132 +385,144 @@ async def handle_video_after_button(message: types.Message, state: FSMContext):
     await state.set_state(UploadFilm.waiting_for_title)
     await state.update_data(file_id=file_id, user_id=message.from_user.id)
 
-@router.callback_query(F.data == 'find_film')
+@callbacks.exact('find_film')
 async def cb_find_film(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'Найти фильм'")
-    # Доступно всем пользователям, нет проверки на админа
+    logger.debug("Нажата кнопка 'Найти фильм'")
     await callback.message.answer('Введите название фильма для поиска:')
     await state.set_state(UploadFilm.waiting_for_find_title)
 
-@router.callback_query(F.data == 'send_fileid')
+@callbacks.exact('send_fileid')
 async def cb_send_fileid(callback: types.CallbackQuery, state: FSMContext):
     uid = int(callback.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Кнопка 'Отправить по file_id'. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Кнопка 'Отправить по file_id'. Пользователь %s является админом: %s", uid, is_admin)
     if not is_admin:
         await callback.message.answer('Нет доступа.')
         return
     await callback.message.answer('Введите file_id для отправки видео:')
     await state.set_state(UploadFilm.waiting_for_send_fileid)
 
-@router.callback_query(F.data == 'list_films')
+@callbacks.exact('list_films')
 async def cb_list_films(callback: types.CallbackQuery):
-    print("[ТЕСТ] Нажата кнопка 'Список фильмов'")
+    logger.debug("Нажата кнопка 'Список фильмов'")
     uid = int(callback.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Кнопка 'Список фильмов'. Пользователь {uid} является админом: {is_admin}")
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title FROM films') as cursor:
-            rows = await cursor.fetchall()
-    if not rows:
-        await callback.message.answer('База пуста.')
-    else:
-        text = '\n'.join([f'{r[0]}. {r[1]}' for r in rows])
-        await callback.message.answer(f'Список фильмов:\n{text}')
+    logger.debug("Кнопка 'Список фильмов'. Пользователь %s является админом: %s", uid, is_admin)
+    await send_page(callback.message, 'films')
     await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
-@router.callback_query(F.data == 'list_series')
+@callbacks.exact('list_series')
 async def cb_list_series(callback: types.CallbackQuery):
-    print("[ТЕСТ] Нажата кнопка 'Список сериалов'")
+    logger.debug("Нажата кнопка 'Список сериалов'")
     uid = int(callback.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Кнопка 'Список сериалов'. Пользователь {uid} является админом: {is_admin}")
-    # Проверка на админа здесь не нужна, так как кнопка доступна всем
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title FROM series') as cursor:
-            rows = await cursor.fetchall()
-    if not rows:
-        await callback.message.answer('База сериалов пуста.')
-    else:
-        text = '\n'.join([f'{r[0]}. {r[1]}' for r in rows])
-        await callback.message.answer(f'Список сериалов:\n{text}')
+    logger.debug("Кнопка 'Список сериалов'. Пользователь %s является админом: %s", uid, is_admin)
+    await send_page(callback.message, 'series')
     await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
-@router.callback_query(F.data == 'find_series')
+@callbacks.exact('find_series')
 async def cb_find_series(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'Найти сериал'")
-    # Доступно всем пользователям, нет проверки на админа
+    logger.debug("Нажата кнопка 'Найти сериал'")
     await callback.message.answer('Введите название сериала для поиска:')
     await state.set_state(UploadFilm.waiting_for_find_series_title)
 
 @router.message(UploadFilm.waiting_for_find_series_title, F.text)
 async def process_find_series_title(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод для поиска сериала в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод для поиска сериала в FSM: %s", message.text)
     series_title_to_find = message.text.strip()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Поиск по точному совпадению (нечувствительный к регистру)
-        async with db.execute('SELECT id, title FROM series WHERE title = ? COLLATE NOCASE', (series_title_to_find,)) as cursor:
-            exact_match = await cursor.fetchone()
+    # Поиск по точному совпадению нормализованного названия (без обращения к базе)
+    exact_match = series_index.find_exact(series_title_to_find)
 
     if exact_match:
         series_id = exact_match[0]
         found_title = exact_match[1]
-        print(f'[ТЕСТ] Сериал "{found_title}" найден, id: {series_id}') # Отладочное сообщение
+        logger.debug('Сериал "%s" найден, id: %s', found_title, series_id)
         # Сохраняем найденный сериал и предлагаем действия
         await state.update_data(found_series_id=series_id, found_series_title=found_title)
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text='Начать просмотр', callback_data=f'view_series:{series_id}')],
-            [InlineKeyboardButton(text='Подписаться на новые серии', callback_data=f'subscribe_series:{series_id}')],
-            [InlineKeyboardButton(text='<< Назад к списку сериалов', callback_data='back_to_series_list')]
-        ])
-        await message.answer(f'Сериал "{found_title}" найден. Выберите действие:', reply_markup=keyboard)
+        subscribed = await db.is_subscribed(series_id, message.from_user.id)
+        await message.answer(f'Сериал "{found_title}" найден. Выберите действие:', reply_markup=get_series_actions_keyboard(series_id, subscribed))
+        await state.set_state(UploadFilm.waiting_for_series_action)
+        return
+
+    # Если точное совпадение не найдено, ищем названия по началу, затем похожие с rapidfuzz
+    similar_results = await series_index.suggest(
+        series_title_to_find,
+        limit=Config.SERIES_SEARCH_LIMIT,
+        score_cutoff=Config.SERIES_SEARCH_CUTOFF,
+        scorer=SERIES_SEARCH_SCORER,
+        workers=Config.SEARCH_WORKERS,
+    )
+    logger.debug("Результаты нечеткого поиска сериалов для '%s' (порог %s): %s", series_title_to_find, Config.SERIES_SEARCH_CUTOFF, similar_results)
+
+    if similar_results:
+        # Кандидаты по убыванию сходства, по нажатию показываем меню действий с сериалом
+        keyboard_buttons = []
+        for (series_id, title), score in similar_results:
+            keyboard_buttons.append([InlineKeyboardButton(text=title, callback_data=FoundSeries(series_id=series_id).pack())])
+        keyboard_buttons.append([InlineKeyboardButton(text='<< Назад к списку сериалов', callback_data='back_to_series_list')])
+        keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+        await message.answer('Сериал с таким названием не найден. Возможно, вы имели в виду:', reply_markup=keyboard)
         await state.set_state(UploadFilm.waiting_for_series_action)
     else:
-        # TODO: Добавить нечеткий поиск по rapidfuzz, как для фильмов
         await message.answer(f'Сериал с названием "{series_title_to_find}" не найден.')
         await state.clear()
         is_admin = int(message.from_user.id) in ADMIN_IDS
         await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
-@router.callback_query(F.data == 'export_db')
+@callbacks.on(FoundSeries)
+async def cb_found_series(callback: types.CallbackQuery, state: FSMContext, callback_data: FoundSeries):
+    logger.debug("Выбран сериал из результатов нечеткого поиска")
+    await callback.message.delete() # Удаляем сообщение со списком кандидатов
+    series_id = callback_data.series_id
+
+    tree = await series_cache.get_series(series_id)
+    found_title = tree.title if tree else None
+    if not found_title:
+        await callback.message.answer('Сериал не найден.')
+        await state.clear()
+        is_admin = int(callback.from_user.id) in ADMIN_IDS
+        await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
+        return
+
+    await state.update_data(found_series_id=series_id, found_series_title=found_title)
+    subscribed = await db.is_subscribed(series_id, callback.from_user.id)
+    await callback.message.answer(f'Сериал "{found_title}" найден. Выберите действие:', reply_markup=get_series_actions_keyboard(series_id, subscribed))
+    await state.set_state(UploadFilm.waiting_for_series_action)
+
+@callbacks.exact('export_db')
 async def cb_export_db(callback: types.CallbackQuery):
     uid = int(callback.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Кнопка 'Экспорт в Excel'. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Кнопка 'Экспорт в Excel'. Пользователь %s является админом: %s", uid, is_admin)
     if not is_admin:
         await callback.message.answer('Нет доступа.')
         return
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title, file_id, user_id FROM films') as cursor:
-            rows = await cursor.fetchall()
-    df = pd.DataFrame(rows, columns=['id', 'title', 'file_id', 'user_id'])
-    excel_path = 'app/films_export.xlsx'
-    df.to_excel(excel_path, index=False)
-    await callback.message.answer_document(types.FSInputFile(excel_path))
-    os.remove(excel_path)
+    await callback.message.answer_document(await build_export('xlsx'))
     await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
-@router.callback_query(F.data == 'check_db')
+@callbacks.exact('import_catalogue')
+async def cb_import_catalogue(callback: types.CallbackQuery, state: FSMContext):
+    uid = int(callback.from_user.id)
+    if uid not in ADMIN_IDS:
+        await callback.message.answer('Нет доступа.')
+        return
+    await callback.message.answer(IMPORT_HELP)
+    await state.set_state(UploadFilm.waiting_for_import_file)
+    await callback.answer()
+
+@callbacks.exact('check_db')
 async def cb_check_db(callback: types.CallbackQuery):
-    print("[ТЕСТ] Нажата кнопка 'Проверить базу'")
+    logger.debug("Нажата кнопка 'Проверить базу'")
     is_admin = int(callback.from_user.id) in ADMIN_IDS
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title, file_id, user_id FROM films') as cursor:
-            rows = await cursor.fetchall()
-    if not rows:
-        await callback.message.answer('[ТЕСТ] База пуста.')
-    else:
-        text = '\n'.join([f'id: {r[0]}, title: {r[1]}, file_id: {r[2]}, user_id: {r[3]}' for r in rows])
-        await callback.message.answer(f'[ТЕСТ] Содержимое базы:\n{text}')
+    await send_page(callback.message, 'check')
     await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
-@router.callback_query(F.data == 'delete_film_by_title')
+@callbacks.exact('delete_film_by_title')
 async def cb_delete_film_by_title(callback: types.CallbackQuery, state: FSMContext):
     uid = int(callback.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Кнопка 'Удалить фильм по названию'. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Кнопка 'Удалить фильм по названию'. Пользователь %s является админом: %s", uid, is_admin)
     if not is_admin:
         await callback.message.answer('Нет доступа.')
         return
@@ -455,7 +533,7 @@ async def cb_delete_film_by_title(callback: types.CallbackQuery, state: FSMConte
 async def process_delete_title(message: types.Message, state: FSMContext):
     uid = int(message.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Удаление фильма. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Удаление фильма. Пользователь %s является админом: %s", uid, is_admin)
     if not is_admin:
         await message.answer('Нет доступа.')
         await state.clear()
@@ -463,10 +541,11 @@ async def process_delete_title(message: types.Message, state: FSMContext):
         return
 
     title_to_delete = message.text.strip()
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute('DELETE FROM films WHERE title = ?', (title_to_delete,))
-        await db.commit()
-        deleted_count = cursor.rowcount
+    deleted_ids = await db.delete_films_by_title(title_to_delete)
+    for film_id in deleted_ids:
+        film_index.remove(film_id)
+    page_cache.invalidate('films')
+    deleted_count = len(deleted_ids)
 
     if deleted_count > 0:
         await message.answer(f'Удалено {deleted_count} фильм(а/ов) с названием "{title_to_delete}".')
@@ -475,10 +554,7 @@ async def process_delete_title(message: types.Message, state: FSMContext):
         await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
     else:
         # Если точное совпадение не найдено, ищем похожие названия
-        search_term = f'%{title_to_delete}%'
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute('SELECT DISTINCT title FROM films WHERE title LIKE ?', (search_term,)) as cursor:
-                similar_titles = [row[0] for row in await cursor.fetchall()]
+        similar_titles = await db.find_film_titles_like(title_to_delete)
 
         if similar_titles:
             text = 'Фильм с таким названием не найден. Возможно, вы имели в виду:\n'
@@ -498,7 +574,7 @@ async def process_delete_title(message: types.Message, state: FSMContext):
 async def process_delete_selection(message: types.Message, state: FSMContext):
     uid = int(message.from_user.id)
     is_admin = uid in ADMIN_IDS
-    print(f"[ТЕСТ] Выбор фильмов для удаления. Пользователь {uid} является админом: {is_admin}")
+    logger.debug("Выбор фильмов для удаления. Пользователь %s является админом: %s", uid, is_admin)
     if not is_admin:
         await message.answer('Нет доступа.')
         await state.clear()
@@ -535,13 +611,13 @@ async def process_delete_selection(message: types.Message, state: FSMContext):
     deleted_titles = []
 
     if selection_indices:
-        async with aiosqlite.connect(DB_PATH) as db:
-            for index in sorted(list(set(selection_indices))): # Удаляем дубликаты индексов и сортируем
-                title_to_delete = similar_titles[index]
-                cursor = await db.execute('DELETE FROM films WHERE title = ?', (title_to_delete,))
-                await db.commit()
-                if cursor.rowcount > 0:
-                     deleted_titles.append(title_to_delete)
+        titles_to_delete = [similar_titles[index] for index in sorted(list(set(selection_indices)))] # Удаляем дубликаты индексов и сортируем
+        deleted_rows = await db.delete_films_by_titles(titles_to_delete)
+        for film_id, title in deleted_rows:
+            film_index.remove(film_id)
+            if title not in deleted_titles:
+                deleted_titles.append(title)
+        page_cache.invalidate('films')
 
     response_text = ''
     if deleted_titles:
@@ -563,7 +639,7 @@ async def process_delete_selection(message: types.Message, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_find_selection, F.text)
 async def process_find_selection(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод для выбора фильма в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод для выбора фильма в FSM: %s", message.text)
     user_input = message.text.strip()
 
     # Получаем данные состояния
@@ -593,28 +669,28 @@ async def process_find_selection(message: types.Message, state: FSMContext):
              invalid_inputs.append(item)
 
     sent_titles = []
+    failed = []
 
     if selection_indices:
-        for index in sorted(list(set(selection_indices))): # Удаляем дубликаты индексов и сортируем
-            title_to_send = similar_find_results[index][0]
-            file_id_to_send = similar_find_results[index][1]
-            try:
-                await message.answer_video(file_id_to_send)
-                await message.answer(f'Отправляю фильм "{title_to_send}".')
-                sent_titles.append(title_to_send)
-            except Exception as e:
-                await message.answer(f'[ТЕСТ] Ошибка при отправке видео "{title_to_send}": {e}')
+        # Выбранные фильмы уходят альбомами по 10 видео (название - в подписи), а не по одному
+        items = [tuple(similar_find_results[index]) for index in sorted(set(selection_indices))] # Удаляем дубликаты индексов и сортируем
+        sent_titles, failed = await send_videos(message.bot, message.chat.id, items)
 
     response_text = ''
     if sent_titles:
         response_text += 'Отправлены фильмы:\n' + '\n'.join([f'- {title}' for title in sent_titles])
 
+    if failed:
+        if response_text:
+            response_text += '\n\n'
+        response_text += 'Не удалось отправить:\n' + '\n'.join([f'- {title}: {error}' for title, error in failed])
+
     if invalid_inputs:
         if response_text:
             response_text += '\n\n'
         response_text += 'Некорректные номера или ввод:\n' + ', '.join(invalid_inputs)
 
-    if not sent_titles and not invalid_inputs:
+    if not sent_titles and not failed and not invalid_inputs:
          response_text = 'Не удалось найти или отправить фильмы. Введены некорректные данные или фильмы не найдены по номерам.'
 
     await message.answer(response_text)
@@ -623,9 +699,9 @@ async def process_find_selection(message: types.Message, state: FSMContext):
     is_admin = int(message.from_user.id) in ADMIN_IDS
     await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
-@router.callback_query(F.data == 'add_series')
+@callbacks.exact('add_series')
 async def cb_add_series(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'Добавить сериал'")
+    logger.debug("Нажата кнопка 'Добавить сериал'")
     uid = int(callback.from_user.id)
     if uid not in ADMIN_IDS:
         await callback.message.answer('Нет доступа.')
@@ -635,15 +711,13 @@ async def cb_add_series(callback: types.CallbackQuery, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_series_title, F.text)
 async def handle_series_title(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод названия сериала в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод названия сериала в FSM: %s", message.text)
     series_title = message.text.strip()
     if not series_title:
         await message.answer('Название сериала не может быть пустым. Попробуйте снова.')
         return # Остаемся в текущем состоянии
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id FROM series WHERE title = ? COLLATE NOCASE', (series_title,)) as cursor:
-            existing_series = await cursor.fetchone()
+    existing_series = await db.find_series_exact(series_title)
 
     if existing_series:
         series_id = existing_series[0]
@@ -661,7 +735,7 @@ async def handle_series_title(message: types.Message, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_number_of_seasons, F.text)
 async def handle_number_of_seasons(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод количества сезонов в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод количества сезонов в FSM: %s", message.text)
     try:
         total_seasons = int(message.text.strip())
         if total_seasons <= 0:
@@ -678,7 +752,7 @@ async def handle_number_of_seasons(message: types.Message, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_number_of_episodes, F.text)
 async def handle_number_of_episodes(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод количества эпизодов в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод количества эпизодов в FSM: %s", message.text)
     data = await state.get_data()
     current_season = data.get('current_season')
     series_title = data.get('series_title')
@@ -701,7 +775,7 @@ async def handle_number_of_episodes(message: types.Message, state: FSMContext):
 
 @router.message(UploadFilm.waiting_for_episode_file_id, F.text | F.video)
 async def handle_episode_file_id(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен ввод file_id/видео эпизода в FSM: {message.text or message.video.file_id}")
+    logger.debug("Получен ввод file_id/видео эпизода в FSM: %s", message.text or message.video.file_id)
     data = await state.get_data()
     series_title = data.get('series_title')
     total_seasons = data.get('total_seasons')
@@ -737,33 +811,29 @@ async def handle_episode_file_id(message: types.Message, state: FSMContext):
         await state.set_state(UploadFilm.waiting_for_number_of_episodes)
     else:
         # Все сезоны и эпизоды введены
-        print(f'[ТЕСТ] Все данные для сериала "{series_title}" собраны. Данные: {seasons_data}') # Выводим собранные данные для отладки
+        logger.debug('Все данные для сериала "%s" собраны. Данные: %s', series_title, seasons_data)
         # Сохранение в базу данных
         user_id = message.from_user.id
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Вставляем запись о сериале
-            cursor = await db.execute('INSERT INTO series (title, user_id) VALUES (?, ?)', (series_title, user_id))
-            series_id = cursor.lastrowid
-            await db.commit()
-
-            # Вставляем записи о сезонах и эпизодах
-            for season_number, season_data_item in seasons_data.items(): # Изменено название переменной
-                cursor = await db.execute('INSERT INTO seasons (series_id, season_number) VALUES (?, ?)', (series_id, season_number))
-                season_id = cursor.lastrowid
-                await db.commit()
-
-                for episode_number, file_id in season_data_item['episodes'].items(): # Изменено название переменной
-                    await db.execute('INSERT INTO episodes (season_id, episode_number, file_id, user_id) VALUES (?, ?, ?, ?)', (season_id, episode_number, file_id, user_id))
-                await db.commit()
-
-        await message.answer(f'Сериал "{series_title}" и его эпизоды успешно добавлены в базу данных!')
+        try:
+            stats = await db.add_series(series_title, user_id, seasons_data)
+        except ValueError as e:
+            await message.answer(f'Не удалось сохранить сериал: {e}')
+            await state.clear()
+            return
+        series_index.add(stats.series_id, series_title, (stats.series_id, series_title))
+        page_cache.invalidate('series')
+        series_cache.invalidate(stats.series_id)
+        logger.info('Сериал "%s" сохранен: %s строк за %.1f мс (%.0f строк/с)', series_title, stats.rows, stats.seconds * 1000, stats.rows_per_second)
+
+        await message.answer(f'Сериал "{series_title}" и его эпизоды успешно добавлены в базу данных! '
+                             f'Сезонов: {stats.seasons}, эпизодов: {stats.episodes} ({stats.seconds * 1000:.0f} мс).')
         await state.clear()
         is_admin = int(message.from_user.id) in ADMIN_IDS
         await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
 
 @router.message(UploadFilm.waiting_for_add_series_confirm, F.text)
 async def handle_add_series_confirm(message: types.Message, state: FSMContext):
-    print(f"[ТЕСТ] Получен текстовый ввод подтверждения добавления сериала в FSM: {message.text}")
+    logger.debug("Получен текстовый ввод подтверждения добавления сериала в FSM: %s", message.text)
     data = await state.get_data()
     confirm = message.text.strip()
     if confirm.lower() != 'да':
@@ -775,145 +845,120 @@ async def handle_add_series_confirm(message: types.Message, state: FSMContext):
     is_admin = int(message.from_user.id) in ADMIN_IDS
     await message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin)) 
 
-@router.callback_query(F.data.startswith('view_series:'))
-async def cb_view_series(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'Начать просмотр'")
+@callbacks.on(ViewSeries)
+async def cb_view_series(callback: types.CallbackQuery, state: FSMContext, callback_data: ViewSeries):
+    logger.debug("Нажата кнопка 'Начать просмотр'")
     await callback.message.delete() # Удаляем предыдущее сообщение с кнопками действий сериала
-    series_id = int(callback.data.split(':')[1])
-
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем название сериала (для отображения пользователю)
-        async with db.execute('SELECT title FROM series WHERE id = ?', (series_id,)) as cursor:
-            series_row = await cursor.fetchone()
-            series_title = series_row[0] if series_row else 'Неизвестный сериал'
+    series_id = callback_data.series_id
 
-        # Получаем все сезоны для данного сериала
-        async with db.execute('SELECT id, season_number FROM seasons WHERE series_id = ? ORDER BY season_number', (series_id,)) as cursor:
-            seasons = await cursor.fetchall()
-
-    if not seasons:
+    # Название сериала и его сезоны берем из кэша навигации
+    tree = await series_cache.get_series(series_id)
+    series_title = tree.title if tree else 'Неизвестный сериал'
+    if not tree or not tree.seasons:
         await callback.message.answer(f'Для сериала "{series_title}" сезоны не найдены.')
         await state.clear()
         is_admin = int(callback.from_user.id) in ADMIN_IDS
         await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
         return
 
-    # Формируем кнопки для выбора сезона
-    keyboard_buttons = []
-    for season_id, season_number in seasons:
-        keyboard_buttons.append([InlineKeyboardButton(text=f'{season_number}. Сезон', callback_data=f'select_season:{season_id}')])
-
-    # Добавляем кнопку назад
-    keyboard_buttons.append([InlineKeyboardButton(text='<< Назад', callback_data='back_to_series_actions')])
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nТеперь выберите сезон из списка ниже:', reply_markup=keyboard)
+    # Клавиатура сезонов собирается один раз на версию сериала
+    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nТеперь выберите сезон из списка ниже:', reply_markup=seasons_keyboard(tree))
 
     # Сохраняем ID сериала в состоянии для дальнейшего использования
     await state.update_data(current_series_id=series_id)
 
     await state.set_state(UploadFilm.waiting_for_season_selection)
 
-@router.callback_query(F.data.startswith('subscribe_series:'))
-async def cb_subscribe_series(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'Подписаться на новые серии'")
-    await callback.message.delete() # Удаляем предыдущее сообщение с кнопками действий сериала
-    series_id = int(callback.data.split(':')[1])
-    # TODO: Реализовать логику подписки
-    await callback.message.answer(f'[ТЕСТ] Логика подписки на сериал ID {series_id} пока не реализована.')
-    await state.clear()
-    is_admin = int(callback.from_user.id) in ADMIN_IDS
-    await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
+@callbacks.on(SubscribeSeries)
+async def cb_subscribe_series(callback: types.CallbackQuery, callback_data: SubscribeSeries):
+    logger.debug("Нажата кнопка 'Подписаться на новые серии'")
+    series_id = callback_data.series_id
+    tree = await series_cache.get_series(series_id)
+    if tree is None:
+        await callback.answer('Сериал не найден.', show_alert=True)
+        return
+    await db.subscribe(series_id, callback.from_user.id)
+    await callback.answer(f'Вы подписались на новые серии "{tree.title}".')
+    # Меняем кнопку подписки на "Отписаться" в том же сообщении
+    try:
+        await callback.message.edit_reply_markup(reply_markup=get_series_actions_keyboard(series_id, True))
+    except Exception:
+        pass # Клавиатура уже такая или сообщение удалено
+
+@callbacks.on(UnsubscribeSeries)
+async def cb_unsubscribe_series(callback: types.CallbackQuery, callback_data: UnsubscribeSeries):
+    logger.debug("Нажата кнопка 'Отписаться от новых серий'")
+    series_id = callback_data.series_id
+    if await db.unsubscribe(series_id, callback.from_user.id):
+        await callback.answer('Вы отписались от новых серий.')
+    else:
+        await callback.answer('Вы не были подписаны на этот сериал.')
+    try:
+        await callback.message.edit_reply_markup(reply_markup=get_series_actions_keyboard(series_id, False))
+    except Exception:
+        pass
 
-@router.callback_query(F.data == 'back_to_series_actions')
+@callbacks.exact('back_to_series_actions')
 async def cb_back_to_series_actions(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка '<< Назад к действиям с сериалом'")
+    logger.debug("Нажата кнопка '<< Назад к действиям с сериалом'")
     await callback.message.delete() # Удаляем текущее сообщение с кнопками сезонов
 
     # Получаем ID сериала из состояния, чтобы отобразить его название при возврате
     data = await state.get_data()
     series_id = data.get('current_series_id')
-    print(f"[ТЕСТ] cb_back_to_series_actions: state_data={data}, series_id={series_id}") # Отладочное сообщение
+    logger.debug("cb_back_to_series_actions: state_data=%s, series_id=%s", data, series_id)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем название сериала (для отображения пользователю)
-        async with db.execute('SELECT title FROM series WHERE id = ?', (series_id,)) as cursor:
-            series_row = await cursor.fetchone()
-            series_title = series_row[0] if series_row else 'Неизвестный сериал'
+    # Получаем название сериала (для отображения пользователю)
+    tree = await series_cache.get_series(series_id) if series_id else None
+    if tree is None:
+        # Состояние истекло или сброшено (кнопка из старого сообщения) - возвращаем к списку сериалов
+        await send_page(callback.message, 'series')
+        await state.clear()
+        is_admin = int(callback.from_user.id) in ADMIN_IDS
+        await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
+        await callback.answer()
+        return
 
     # Восстанавливаем предыдущее меню действий с сериалом
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text='Начать просмотр', callback_data=f'view_series:{series_id}')],
-        [InlineKeyboardButton(text='Подписаться на новые серии', callback_data=f'subscribe_series:{series_id}')],
-        [InlineKeyboardButton(text='<< Назад к списку сериалов', callback_data='back_to_series_list')]
-    ])
-
-    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nВыберите действие из списка ниже:', reply_markup=keyboard)
+    subscribed = await db.is_subscribed(series_id, callback.from_user.id)
+    await callback.message.answer(f'Вы выбрали:\nСериал: {tree.title}\nВыберите действие из списка ниже:', reply_markup=get_series_actions_keyboard(series_id, subscribed))
     await state.set_state(UploadFilm.waiting_for_series_action) # Возвращаемся в предыдущее состояние
 
-@router.callback_query(F.data.startswith('select_season:'))
-async def cb_select_season(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка выбора сезона")
+@callbacks.on(SelectSeason)
+async def cb_select_season(callback: types.CallbackQuery, state: FSMContext, callback_data: SelectSeason):
+    logger.debug("Нажата кнопка выбора сезона")
     await callback.message.delete() # Удаляем предыдущее сообщение с кнопками сезонов
+    season_id = callback_data.season_id
 
-    # Извлекаем ID сезона из callback_data кнопки
-    season_id_str = callback.data.split(':')[1]
-    try:
-        season_id = int(season_id_str)
-    except ValueError:
-        await callback.message.answer('[ТЕСТ] Ошибка обработки выбора сезона. Некорректный ID сезона.')
+    # Получаем сезон вместе с сериалом и списком серий из кэша навигации
+    season_data = await series_cache.get_season(season_id)
+    if not season_data:
+        await callback.message.answer('Сезон не найден.')
         await state.clear()
         is_admin = int(callback.from_user.id) in ADMIN_IDS
         await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
         return
+    tree, season = season_data
+    season_number, series_id, series_title = season.season_number, tree.series_id, tree.title
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем номер сезона и ID сериала
-        async with db.execute('SELECT season_number, series_id FROM seasons WHERE id = ?', (season_id,)) as cursor:
-            season_data = await cursor.fetchone()
-            if not season_data:
-                await callback.message.answer('Сезон не найден.')
-                await state.clear()
-                is_admin = int(callback.from_user.id) in ADMIN_IDS
-                await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-                return
-            season_number, series_id = season_data
-
-        # Получаем название сериала
-        async with db.execute('SELECT title FROM series WHERE id = ?', (series_id,)) as cursor:
-            series_row = await cursor.fetchone()
-            series_title = series_row[0] if series_row else 'Неизвестный сериал'
-
-        # Получаем все эпизоды для данного сезона
-        async with db.execute('SELECT id, episode_number FROM episodes WHERE season_id = ? ORDER BY episode_number', (season_id,)) as cursor:
-            episodes = await cursor.fetchall()
-
-    if not episodes:
+    if not season.episodes:
         await callback.message.answer(f'В {season_number} сезоне сериала "{series_title}" эпизоды не найдены.')
         await state.clear()
         is_admin = int(callback.from_user.id) in ADMIN_IDS
         await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
         return
 
-    # Формируем кнопки для выбора эпизода
-    keyboard_buttons = []
-    for episode_id, episode_number in episodes:
-        keyboard_buttons.append([InlineKeyboardButton(text=f'{episode_number}. Серия', callback_data=f'select_episode:{episode_id}')])
-
-    # Добавляем кнопку назад
-    keyboard_buttons.append([InlineKeyboardButton(text='<< Назад к выбору сезона', callback_data='back_to_season_selection')])
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nСезон: {season_number}\nТеперь выберите серию из списка ниже:', reply_markup=keyboard)
+    # Клавиатура серий кэшируется по (сезон, версия сериала); большие сезоны - постранично
+    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nСезон: {season_number}\nТеперь выберите серию из списка ниже:', reply_markup=episodes_keyboard(tree, season))
 
     # Сохраняем ID сезона и сериала в состоянии для дальнейшего использования
     await state.update_data(current_season_id=season_id, current_series_id=series_id)
 
     await state.set_state(UploadFilm.waiting_for_episode_selection)
 
-@router.callback_query(F.data == 'back_to_season_selection')
+@callbacks.exact('back_to_season_selection')
 async def cb_back_to_season_selection(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка '<< Назад к выбору сезона'")
+    logger.debug("Нажата кнопка '<< Назад к выбору сезона'")
     await callback.message.delete() # Удаляем текущее сообщение с кнопками эпизодов
 
     # Получаем ID сериала из состояния
@@ -928,240 +973,156 @@ async def cb_back_to_season_selection(callback: types.CallbackQuery, state: FSMC
         return
 
     # Повторно вызываем логику отображения сезонов
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем название сериала
-        async with db.execute('SELECT title FROM series WHERE id = ?', (series_id,)) as cursor:
-            series_row = await cursor.fetchone()
-            series_title = series_row[0] if series_row else 'Неизвестный сериал'
-
-        # Получаем все сезоны для данного сериала
-        async with db.execute('SELECT id, season_number FROM seasons WHERE series_id = ? ORDER BY season_number', (series_id,)) as cursor:
-            seasons = await cursor.fetchall()
-
-    if not seasons:
+    tree = await series_cache.get_series(series_id)
+    series_title = tree.title if tree else 'Неизвестный сериал'
+    if not tree or not tree.seasons:
         await callback.message.answer(f'Для сериала "{series_title}" сезоны не найдены.')
         await state.clear()
         is_admin = int(callback.from_user.id) in ADMIN_IDS
         await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
         return
 
-    # Формируем кнопки для выбора сезона
-    keyboard_buttons = []
-    for season_id, season_number in seasons:
-        keyboard_buttons.append([InlineKeyboardButton(text=f'{season_number}. Сезон', callback_data=f'select_season:{season_id}')])
+    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nТеперь выберите сезон из списка ниже:', reply_markup=seasons_keyboard(tree))
 
-    # Добавляем кнопку назад
-    keyboard_buttons.append([InlineKeyboardButton(text='<< Назад', callback_data='back_to_series_actions')]) # Возвращаемся к действиям с сериалом
+    await state.set_state(UploadFilm.waiting_for_season_selection) # Возвращаемся в состояние выбора сезона
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-    await callback.message.answer(f'Вы выбрали:\nСериал: {series_title}\nТеперь выберите сезон из списка ниже:', reply_markup=keyboard)
+@callbacks.on(EpisodesPage)
+async def cb_episodes_page(callback: types.CallbackQuery, callback_data: EpisodesPage):
+    # Листание серий большого сезона: меняем только клавиатуру у того же сообщения
+    season_data = await series_cache.get_season(callback_data.season_id)
+    if not season_data:
+        await callback.answer('Сезон не найден.')
+        return
+    tree, season = season_data
+    try:
+        await callback.message.edit_reply_markup(reply_markup=episodes_keyboard(tree, season, callback_data.page))
+    except Exception as e:
+        pass # Игнорируем ошибку, если клавиатура не изменилась или сообщение удалено
+    await callback.answer()
+
+@callbacks.on(SendSeason)
+async def cb_send_season(callback: types.CallbackQuery, callback_data: SendSeason):
+    logger.debug("Нажата кнопка 'Отправить весь сезон'")
+    season_data = await series_cache.get_season(callback_data.season_id)
+    if not season_data or not season_data[1].episodes:
+        await callback.answer('Серии сезона не найдены.', show_alert=True)
+        return
+    tree, season = season_data
+    # Отвечаем сразу: отправка большого сезона альбомами идет в темпе лимитов Telegram
+    # в фоновой задаче, чтобы не занимать обработчик апдейтов
+    await callback.answer(f'Отправляю {len(season.episodes)} серий альбомами...')
+    items = [(f'{tree.title}. Сезон {season.season_number}, серия {episode_number}', file_id)
+             for _, episode_number, file_id in season.episodes]
+    task = asyncio.create_task(send_season(callback.message, tree.title, season.season_number, items))
+    season_sends.add(task)
+    task.add_done_callback(season_sends.discard)
+
+# Фоновые отправки сезонов; ссылки держим, чтобы задачи не собрал сборщик мусора
+season_sends = set()
+
+async def send_season(message: types.Message, series_title: str, season_number: int, items):
+    try:
+        # Сезон целиком - массовая отправка: уступает интерактивным ответам в очереди лимитов
+        with bulk_sends():
+            sent, failed = await send_videos(message.bot, message.chat.id, items)
+            text = f'Сезон {season_number} сериала "{series_title}": отправлено серий {len(sent)} из {len(items)}.'
+            if failed:
+                text += '\nНе удалось отправить:\n' + '\n'.join([f'- {caption}: {error}' for caption, error in failed])
+            await message.answer(text)
+    except Exception:
+        logger.exception('Ошибка отправки сезона %s сериала "%s"', season_number, series_title)
 
-    await state.set_state(UploadFilm.waiting_for_season_selection) # Возвращаемся в состояние выбора сезона
+@callbacks.exact('noop')
+async def cb_noop(callback: types.CallbackQuery):
+    await callback.answer()
 
-@router.callback_query(F.data.startswith('select_episode:'))
-async def cb_select_episode(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка выбора серии")
-    # Удаляем предыдущее сообщение только если это не первый вход в эту функцию (например, после навигации)
+async def show_episode(callback: types.CallbackQuery, state: FSMContext, episode_id: int):
+    # Снимаем "часики" с кнопки сразу, до запросов к базе и Telegram
+    await callback.answer()
     data = await state.get_data()
     previous_message_id = data.get('last_episode_message_id')
     chat_id = callback.message.chat.id
-    if previous_message_id:
-        try:
-            await callback.bot.delete_message(chat_id, previous_message_id)
-        except Exception as e:
-            pass # Игнорируем ошибку, если сообщение уже удалено или не найдено
 
-    episode_id_str = callback.data.split(':')[1]
-    try:
-        episode_id = int(episode_id_str)
-    except ValueError:
-        await callback.message.answer('[ТЕСТ] Ошибка обработки выбора серии. Некорректный ID серии.')
-        await state.clear()
-        is_admin = int(callback.from_user.id) in ADMIN_IDS
-        await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-        return
+    # Один запрос: file_id эпизода, данные сезона и сериала, количество серий и соседние серии
+    episode_view = await series_cache.get_episode_view(episode_id)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем file_id эпизода и его номер, а также данные сезона и сериала
-        async with db.execute('''
-            SELECT
-                e.file_id,
-                e.episode_number,
-                s.season_number,
-                ser.title,
-                s.id, -- Получаем ID сезона
-                ser.id -- Получаем ID сериала
-            FROM episodes e
-            JOIN seasons s ON e.season_id = s.id
-            JOIN series ser ON s.series_id = ser.id
-            WHERE e.id = ?
-        ''', (episode_id,)) as cursor:
-            episode_data = await cursor.fetchone()
-
-    if not episode_data:
+    if not episode_view:
         await callback.message.answer('Эпизод не найден в базе данных.')
         await state.clear()
         is_admin = int(callback.from_user.id) in ADMIN_IDS
         await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
         return
 
-    file_id, episode_number, season_number, series_title, season_id, series_id = episode_data
-
-    # Получаем общее количество эпизодов в сезоне
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT COUNT(*) FROM episodes WHERE season_id = ?', (season_id,)) as cursor:
-            total_episodes_in_season = (await cursor.fetchone())[0]
+    # Сериал и сезон - в текстовом сообщении (отправляется один раз), номер серии - в подписи к видео
+    caption = f'Серия в сезоне: {episode_view.episode_number} из {episode_view.total_episodes}'
 
-    # Формируем текст сообщения
-    message_text = f'Вы смотрите:\nСериал: {series_title}\nСезон: {season_number}\nСерия в сезоне: {episode_number} из {total_episodes_in_season}'
+    # Кнопки навигации: "Пред."/"К сезонам" слева, "След."/"К сезонам" справа
+    keyboard = episode_navigation_keyboard(episode_view.prev_id, episode_view.next_id)
 
-    # Определяем кнопки навигации
-    buttons = []
-    # Кнопка "Пред." или "К сезонам" слева
-    if episode_number == 1:
-        buttons.append(InlineKeyboardButton(text='<< К сезонам', callback_data='back_to_season_selection'))
-    else:
-        # Находим ID предыдущего эпизода
-        async with aiosqlite.connect(DB_PATH) as db:
-             async with db.execute('SELECT id FROM episodes WHERE season_id = ? AND episode_number = ?', (season_id, episode_number - 1)) as cursor:
-                 prev_episode_row = await cursor.fetchone()
-                 if prev_episode_row:
-                     buttons.append(InlineKeyboardButton(text='<< Пред.', callback_data=f'prev_episode:{prev_episode_row[0]}'))
-
-    # Кнопка "След." или "К сезонам" справа
-    if episode_number < total_episodes_in_season:
-        # Находим ID следующего эпизода
-        async with aiosqlite.connect(DB_PATH) as db:
-             async with db.execute('SELECT id FROM episodes WHERE season_id = ? AND episode_number = ?', (season_id, episode_number + 1)) as cursor:
-                 next_episode_row = await cursor.fetchone()
-                 if next_episode_row:
-                     buttons.append(InlineKeyboardButton(text='След. >>', callback_data=f'next_episode:{next_episode_row[0]}'))
-
-    # Добавляем кнопку "К сезонам" справа, если это последняя серия
-    if episode_number == total_episodes_in_season:
-         buttons.append(InlineKeyboardButton(text='К сезонам >>', callback_data='back_to_season_selection'))
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons])
-
-    # Отправляем сообщение с описанием и видео с кнопками
-    try:
-        await callback.message.answer(message_text)
-        sent_message = await callback.message.answer_video(file_id, reply_markup=keyboard)
-        # Сохраняем ID отправленного сообщения с видео для последующего удаления при навигации
-        await state.update_data(last_episode_message_id=sent_message.message_id)
-    except Exception as e:
-        await callback.message.answer(f'[ТЕСТ] Ошибка при отправке видео эпизода или сообщения: {e}')
-
-    # Сохраняем текущий episode_id, season_id и series_id в состоянии для навигации
-    await state.update_data(current_episode_id=episode_id, current_season_id=season_id, current_series_id=series_id)
-
-@router.callback_query(F.data.startswith('prev_episode:'))
-async def cb_previous_episode(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'Пред.'")
-    # Удаляем предыдущее сообщение с видео и кнопками
-    # await callback.message.delete() # Убрано, так как cb_select_episode удаляет предыдущее сообщение
-    
-    # Получаем текущий episode_id из состояния
-    data = await state.get_data()
-    current_episode_id = data.get('current_episode_id')
-    
-    if not current_episode_id:
-        await callback.message.answer('[ТЕСТ] Ошибка. Не могу определить текущий эпизод.')
-        await state.clear()
-        is_admin = int(callback.from_user.id) in ADMIN_IDS
-        await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-        return
-
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем номер текущего эпизода и ID сезона
-        async with db.execute('SELECT episode_number, season_id FROM episodes WHERE id = ?', (current_episode_id,)) as cursor:
-            current_episode_data = await cursor.fetchone()
-            if not current_episode_data:
-                await callback.message.answer('[ТЕСТ] Ошибка. Данные текущего эпизода не найдены.')
-                await state.clear()
-                is_admin = int(callback.from_user.id) in ADMIN_IDS
-                await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-                return
-            current_episode_number, season_id = current_episode_data
-
-        # Находим ID предыдущего эпизода в том же сезоне
-        async with db.execute('SELECT id FROM episodes WHERE season_id = ? AND episode_number = ?', (season_id, current_episode_number - 1)) as cursor:
-             prev_episode_row = await cursor.fetchone()
-
-    if prev_episode_row:
-        prev_episode_id = prev_episode_row[0]
-        # Вызываем логику отображения эпизода с новым ID
-        # Создаем фиктивный callback объект с нужными данными
-        fake_callback = types.CallbackQuery(id=callback.id, from_user=callback.from_user, chat_instance=callback.chat_instance, data=f'select_episode:{prev_episode_id}', message=callback.message)
-        await cb_select_episode(fake_callback, state)
-    else:
-        # Если предыдущего эпизода нет (текущий - первый), остаемся на первом или возвращаемся к сезонам
-        # В текущей логике кнопка "Пред." не показывается для первого эпизода, но добавим обработку на всякий случай
-        await callback.answer("Это первый эпизод сезона.") # Оставляем ответ на callback кнопку
-        # Можно отправить текущий эпизод еще раз, если нужно
-        # await cb_select_episode(types.CallbackQuery(id=callback.id, from_user=callback.from_user, chat_instance=callback.chat_instance, data=f'select_episode:{current_episode_id}', message=callback.message), state)
-
-@router.callback_query(F.data.startswith('next_episode:'))
-async def cb_next_episode(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка 'След.'")
-    # Удаляем предыдущее сообщение с видео и кнопками
-    # await callback.message.delete() # Убрано, так как cb_select_episode удаляет предыдущее сообщение
-    
-    # Получаем текущий episode_id из состояния
-    data = await state.get_data()
-    current_episode_id = data.get('current_episode_id')
-
-    if not current_episode_id:
-        await callback.message.answer('[ТЕСТ] Ошибка. Не могу определить текущий эпизод.')
-        await state.clear()
-        is_admin = int(callback.from_user.id) in ADMIN_IDS
-        await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-        return
-
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем номер текущего эпизода и ID сезона
-        async with db.execute('SELECT episode_number, season_id FROM episodes WHERE id = ?', (current_episode_id,)) as cursor:
-            current_episode_data = await cursor.fetchone()
-            if not current_episode_data:
-                await callback.message.answer('[ТЕСТ] Ошибка. Данные текущего эпизода не найдены.')
-                await state.clear()
-                is_admin = int(callback.from_user.id) in ADMIN_IDS
-                await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-                return
-            current_episode_number, season_id = current_episode_data
-
-        # Находим ID следующего эпизода в том же сезоне
-        async with db.execute('SELECT id FROM episodes WHERE season_id = ? AND episode_number = ?', (season_id, current_episode_number + 1)) as cursor:
-             next_episode_row = await cursor.fetchone()
-
-    if next_episode_row:
-        next_episode_id = next_episode_row[0]
-        # Вызываем логику отображения эпизода с новым ID
-        fake_callback = types.CallbackQuery(id=callback.id, from_user=callback.from_user, chat_instance=callback.chat_instance, data=f'select_episode:{next_episode_id}', message=callback.message)
-        await cb_select_episode(fake_callback, state)
-    else:
-        # Если следующего эпизода нет (текущий - последний)
-        await callback.answer("Это последний эпизод сезона.") # Оставляем ответ на callback кнопку
-        # Кнопка "К сезонам >>" должна быть доступна для перехода
-        # Можно отправить текущий эпизод еще раз, если нужно
-        # await cb_select_episode(types.CallbackQuery(id=callback.id, from_user=callback.from_user, chat_instance=callback.chat_instance, data=f'select_episode:{current_episode_id}', message=callback.message), state)
+    sent_message_id = None
+    if previous_message_id and callback.message.message_id == previous_message_id:
+        # "Пред."/"След." под видео: меняем видео, подпись и кнопки в том же сообщении одним запросом
+        try:
+            await callback.bot.edit_message_media(
+                media=InputMediaVideo(media=episode_view.file_id, caption=caption),
+                chat_id=chat_id, message_id=previous_message_id, reply_markup=keyboard,
+            )
+            sent_message_id = previous_message_id
+        except TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                sent_message_id = previous_message_id
+            else:
+                logger.debug('Не удалось изменить сообщение с серией, отправляю новое: %s', e)
 
-@router.callback_query(F.data == 'back_to_series_list')
+    if sent_message_id is None:
+        # Первый показ серии из списка: убираем видео прошлого просмотра и отправляем описание и видео
+        if previous_message_id:
+            try:
+                await callback.bot.delete_message(chat_id, previous_message_id)
+            except Exception as e:
+                pass # Игнорируем ошибку, если сообщение уже удалено или не найдено
+        message_text = f'Вы смотрите:\nСериал: {episode_view.series_title}\nСезон: {episode_view.season_number}'
+        try:
+            await callback.message.answer(message_text)
+            sent_message = await callback.message.answer_video(episode_view.file_id, caption=caption, reply_markup=keyboard)
+            sent_message_id = sent_message.message_id
+        except Exception as e:
+            await callback.message.answer(f'[ТЕСТ] Ошибка при отправке видео эпизода или сообщения: {e}')
+
+    # Сохраняем ID сообщения с видео и текущие episode_id, season_id, series_id для навигации
+    await state.update_data(last_episode_message_id=sent_message_id, current_episode_id=episode_id,
+                            current_season_id=episode_view.season_id, current_series_id=episode_view.series_id)
+
+@callbacks.on(SelectEpisode)
+async def cb_select_episode(callback: types.CallbackQuery, state: FSMContext, callback_data: SelectEpisode):
+    logger.debug("Нажата кнопка выбора серии")
+    await show_episode(callback, state, callback_data.episode_id)
+
+# Кнопки "Пред." и "След." уже содержат ID соседней серии (посчитан в get_episode_view),
+# поэтому повторно искать соседа по номеру не нужно
+@callbacks.on(PrevEpisode)
+async def cb_previous_episode(callback: types.CallbackQuery, state: FSMContext, callback_data: PrevEpisode):
+    logger.debug("Нажата кнопка 'Пред.'")
+    await show_episode(callback, state, callback_data.episode_id)
+
+@callbacks.on(NextEpisode)
+async def cb_next_episode(callback: types.CallbackQuery, state: FSMContext, callback_data: NextEpisode):
+    logger.debug("Нажата кнопка 'След.'")
+    await show_episode(callback, state, callback_data.episode_id)
+
+@callbacks.exact('back_to_series_list')
 async def cb_back_to_series_list(callback: types.CallbackQuery, state: FSMContext):
-    print("[ТЕСТ] Нажата кнопка '<< Назад к списку сериалов'")
+    logger.debug("Нажата кнопка '<< Назад к списку сериалов'")
     await callback.message.delete() # Удаляем текущее сообщение
 
     # Показываем список сериалов
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('SELECT id, title FROM series') as cursor:
-            rows = await cursor.fetchall()
-    if not rows:
-        await callback.message.answer('База сериалов пуста.')
-    else:
-        text = '\n'.join([f'{r[0]}. {r[1]}' for r in rows])
-        await callback.message.answer(f'Список сериалов:\n{text}')
+    await send_page(callback.message, 'series')
 
     await state.clear() # Очищаем состояние FSM, связанное с поиском/просмотром сериала
     is_admin = int(callback.from_user.id) in ADMIN_IDS
     await callback.message.answer('Выберите действие:', reply_markup=get_main_menu(is_admin))
-    await callback.answer() 
\ No newline at end of file
+    await callback.answer() 
+# Кнопка, которой нет в таблице маршрутов (например, из очень старого сообщения) - снимаем "часики"
+@router.callback_query()
+async def cb_unknown(callback: types.CallbackQuery):
+    await callback.answer('Кнопка устарела, откройте меню заново.')
@@ -0,0 +1,102 @@
+import importlib.abc
+import sys
+import time
+from typing import List, Tuple
+
+# Отчет о времени импорта модулей при старте (аналог python -X importtime, но внутри процесса).
+# Включается переменной окружения IMPORT_TIME_REPORT=1, см. __main__.py
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, timer: "ImportTimer", name: str):
+        self._loader = loader
+        self._timer = timer
+        self._name = name
+
+    def create_module(self, spec):
+        create_module = getattr(self._loader, 'create_module', None)
+        return create_module(spec) if create_module else None
+
+    def exec_module(self, module):
+        # Возвращаем модулю настоящий загрузчик, чтобы прокси не оставался после импорта
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._timer._enter(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer._exit()
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Модули бота, загруженные до установки замера (как минимум сам app.importtime)
+        self.preloaded = sorted(name for name in sys.modules if name == 'app' or name.startswith('app.'))
+        # (модуль, собственное время, общее время с вложенными импортами, глубина) в микросекундах
+        self.timings: List[Tuple[str, int, int, int]] = []
+        self._stack = []
+
+    def find_spec(self, fullname, path, target=None):
+        # Ищем модуль остальными finder'ами и подменяем загрузчик на замеряющий
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            find_spec = getattr(finder, 'find_spec', None)
+            if find_spec is None:
+                continue
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self, fullname)
+        return spec
+
+    def _enter(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self):
+        name, started, children = self._stack.pop()
+        cumulative = time.perf_counter() - started
+        if self._stack:
+            self._stack[-1][2] += cumulative
+        self.timings.append((name, int((cumulative - children) * 1e6), int(cumulative * 1e6), len(self._stack)))
+
+    def report(self, top: int = 20) -> str:
+        total = time.perf_counter() - self.started
+        lines = [f'Импорт модулей: {len(self.timings)} шт., {total * 1000:.0f} мс с начала замера']
+        if self.preloaded:
+            lines.append(f'Не замерены (загружены до начала замера): {", ".join(self.preloaded)}')
+        lines.append('import time: self [us] | cumulative | imported package')
+        for name, self_us, cumulative_us, depth in sorted(self.timings, key=lambda t: t[2], reverse=True)[:top]:
+            lines.append(f'import time: {self_us:>9} | {cumulative_us:>10} | {"  " * depth}{name}')
+        return '\n'.join(lines)
+
+
+_timer = None
+
+
+def install() -> ImportTimer:
+    global _timer
+    if _timer is None:
+        _timer = ImportTimer()
+        sys.meta_path.insert(0, _timer)
+    return _timer
+
+
+def uninstall():
+    global _timer
+    if _timer is not None and _timer in sys.meta_path:
+        sys.meta_path.remove(_timer)
+
+
+def report(top: int = 20) -> str:
+    if _timer is None:
+        return 'Замер времени импорта не включен (IMPORT_TIME_REPORT=1)'
+    return _timer.report(top)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup, InlineQuery, InlineQueryResult, InlineQueryResultArticle,
+    InlineQueryResultCachedVideo, InputTextMessageContent,
+)
+
+from app.callbacks import to_base36
+from app.config import Config
+from app.search import film_index, series_index, get_scorer, normalize_title
+
+# Inline-режим (@бот запрос): поиск по названиям фильмов и сериалов прямо в поле ввода любого чата.
+# Запрос обычно недописан, поэтому сначала берутся подсказки по началу названия (TitleIndex.suggest).
+# Фильмы возвращаются как InlineQueryResultCachedVideo по сохраненному file_id, сериалы - карточкой
+# со ссылкой на бота (t.me/<бот>?start=series_<id>), где открывается меню сериала.
+# Telegram присылает inline-запрос на каждое нажатие клавиши, поэтому:
+# - поиск запускается в фоновой задаче после паузы INLINE_DEBOUNCE, обработчик апдейта не ждет ее.
+#   Более новый запрос того же пользователя отменяет задачу старого, и тот остается без ответа
+#   (клиент его все равно уже не покажет);
+# - полный список результатов кэшируется по нормализованному запросу на INLINE_CACHE_TTL секунд,
+#   следующие страницы (next_offset) отдаются из кэша без повторного поиска;
+# - ответ помечен как общий для всех пользователей (is_personal=False) и кэшируется самим Telegram
+#   на INLINE_CACHE_TIME секунд
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает не больше 50 результатов в одном ответе на inline-запрос
+INLINE_PAGE_SIZE = 50
+
+INLINE_SEARCH_SCORER = get_scorer(Config.INLINE_SEARCH_SCORER)
+
+
+def series_start_parameter(series_id: int) -> str:
+    # Параметр deep link: только латиница, цифры и "_"
+    return f'series_{to_base36(series_id)}'
+
+
+def parse_series_start_parameter(parameter: str) -> Optional[int]:
+    prefix, _, encoded = parameter.partition('_')
+    if prefix != 'series' or not encoded:
+        return None
+    try:
+        return int(encoded, 36)
+    except ValueError:
+        return None
+
+
+class InlineSearch:
+    def __init__(self, cache_size: int = 1024, ttl: float = 60.0, debounce: float = 0.3, max_results: int = 200):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.debounce = debounce
+        self.max_results = max_results
+        self.hits = 0
+        self.misses = 0
+        # (запрос, версии индексов) -> (истекает, результаты)
+        self._cache: "OrderedDict[Tuple[str, int, int], Tuple[float, List[InlineQueryResult]]]" = OrderedDict()
+        # user_id -> фоновая задача поиска по последнему запросу пользователя
+        self._pending: Dict[int, asyncio.Task] = {}
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0, 'queries': len(self._cache)}
+
+    def key(self, query: str) -> Tuple[str, int, int]:
+        # После добавления или удаления названий версии индексов меняются, и старые записи просто не находятся
+        return normalize_title(query), film_index.version, series_index.version
+
+    def get(self, key) -> Optional[List[InlineQueryResult]]:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, results: List[InlineQueryResult]):
+        self._cache[key] = (time.monotonic() + self.ttl, results)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def submit(self, inline_query: InlineQuery):
+        # Запрос без готового результата: ищем и отвечаем в фоне после паузы в наборе
+        user_id = inline_query.from_user.id
+        previous = self._pending.get(user_id)
+        if previous is not None:
+            previous.cancel()
+        self._pending[user_id] = asyncio.create_task(self._answer_later(inline_query))
+
+    async def _answer_later(self, inline_query: InlineQuery):
+        try:
+            await asyncio.sleep(self.debounce)
+            key = self.key(inline_query.query)
+            results = await self.search(inline_query.query, (await inline_query.bot.me()).username)
+            self.put(key, results)
+            await answer_page(inline_query, results)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception('Ошибка ответа на inline-запрос')
+        finally:
+            if self._pending.get(inline_query.from_user.id) is asyncio.current_task():
+                del self._pending[inline_query.from_user.id]
+
+    async def close(self):
+        tasks = list(self._pending.values())
+        self._pending.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def search(self, query: str, bot_username: str) -> List[InlineQueryResult]:
+        films = await film_index.suggest(query, limit=self.max_results, score_cutoff=Config.INLINE_SEARCH_CUTOFF,
+                                      scorer=INLINE_SEARCH_SCORER, workers=Config.SEARCH_WORKERS)
+        series = await series_index.suggest(query, limit=self.max_results, score_cutoff=Config.INLINE_SEARCH_CUTOFF,
+                                         scorer=INLINE_SEARCH_SCORER, workers=Config.SEARCH_WORKERS)
+        # Подсказки по префиксу (сходство 100/90) идут первыми, дальше найденное нечетким поиском.
+        # Фильмы и сериалы вперемешку по убыванию сходства; при равенстве фильмы раньше
+        ranked = sorted([(score, 0, index, payload) for index, (payload, score) in enumerate(films)] +
+                        [(score, 1, index, payload) for index, (payload, score) in enumerate(series)],
+                        key=lambda item: (-item[0], item[1], item[2]))[:self.max_results]
+        results: List[InlineQueryResult] = []
+        for position, (_, kind, _, payload) in enumerate(ranked):
+            if kind == 0:
+                title, file_id = payload
+                results.append(InlineQueryResultCachedVideo(id=f'f{position}', video_file_id=file_id, title=title, caption=title))
+            else:
+                series_id, title = payload
+                link = f'https://t.me/{bot_username}?start={series_start_parameter(series_id)}'
+                results.append(InlineQueryResultArticle(
+                    id=f's{position}',
+                    title=title,
+                    description='Сериал',
+                    input_message_content=InputTextMessageContent(message_text=f'Сериал "{title}"'),
+                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text='Смотреть', url=link)]]),
+                ))
+        return results
+
+
+def results_page(results: List[InlineQueryResult], offset: str) -> Tuple[List[InlineQueryResult], str]:
+    # offset - позиция в полном списке результатов; пустой next_offset - страниц больше нет
+    try:
+        start = max(0, int(offset or 0))
+    except ValueError:
+        start = 0
+    end = start + INLINE_PAGE_SIZE
+    return results[start:end], str(end) if end < len(results) else ''
+
+
+async def answer_page(inline_query: InlineQuery, results: List[InlineQueryResult]):
+    page, next_offset = results_page(results, inline_query.offset)
+    await inline_query.answer(page, cache_time=Config.INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset)
+
+
+inline_search = InlineSearch(Config.INLINE_CACHE_SIZE, Config.INLINE_CACHE_TTL, Config.INLINE_DEBOUNCE, Config.INLINE_MAX_RESULTS)
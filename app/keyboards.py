@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, Optional
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.callbacks import (
+    ViewSeries, SubscribeSeries, UnsubscribeSeries, SelectSeason, SendSeason, EpisodesPage,
+    SelectEpisode, PrevEpisode, NextEpisode,
+)
+from app.config import Config
+from app.series_cache import SeasonNode, SeriesTree
+
+# Готовые клавиатуры. Модели aiogram неизменяемые (frozen), поэтому одну и ту же клавиатуру
+# можно отдавать во все ответы, а не собирать заново на каждый апдейт.
+# Клавиатуры сезонов и серий кэшируются по (id, версия сериала) из series_cache:
+# после изменения сериала версия меняется, и старые клавиатуры просто перестают запрашиваться
+
+
+class KeyboardCache:
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._keyboards: "OrderedDict[Hashable, InlineKeyboardMarkup]" = OrderedDict()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+        keyboard = self._keyboards.get(key)
+        if keyboard is not None:
+            self.hits += 1
+            self._keyboards.move_to_end(key)
+            return keyboard
+        self.misses += 1
+        keyboard = build()
+        self._keyboards[key] = keyboard
+        while len(self._keyboards) > self.maxsize:
+            self._keyboards.popitem(last=False)
+        return keyboard
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0, 'keyboards': len(self._keyboards)}
+
+
+keyboard_cache = KeyboardCache(Config.KEYBOARD_CACHE_SIZE)
+
+
+# --- Главное меню ---
+@lru_cache(maxsize=2)
+def get_main_menu(is_admin=False):
+    all_buttons = [
+        InlineKeyboardButton(text='Найти фильм', callback_data='find_film'),
+        InlineKeyboardButton(text='Список фильмов', callback_data='list_films'),
+        InlineKeyboardButton(text='Список сериалов', callback_data='list_series'),
+        InlineKeyboardButton(text='Найти сериал', callback_data='find_series'),
+    ]
+    if is_admin:
+        admin_buttons = [
+            InlineKeyboardButton(text='Добавить сериал', callback_data='add_series'),
+            InlineKeyboardButton(text='Добавить видео', callback_data='add_video'),
+            InlineKeyboardButton(text='Отправить по file_id', callback_data='send_fileid'),
+            InlineKeyboardButton(text='Экспорт в Excel', callback_data='export_db'),
+            InlineKeyboardButton(text='Импорт каталога', callback_data='import_catalogue'),
+            InlineKeyboardButton(text='Удалить фильм по названию', callback_data='delete_film_by_title'),
+            InlineKeyboardButton(text='Проверить базу', callback_data='check_db'),
+        ]
+        all_buttons = admin_buttons + all_buttons
+
+    # Группируем кнопки по две
+    grouped_buttons = []
+    for i in range(0, len(all_buttons), 2):
+        grouped_buttons.append(all_buttons[i:i+2])
+
+    return InlineKeyboardMarkup(inline_keyboard=grouped_buttons)
+
+
+# --- Сериалы ---
+def get_series_actions_keyboard(series_id: int, subscribed: bool = False) -> InlineKeyboardMarkup:
+    def build():
+        if subscribed:
+            subscription_button = InlineKeyboardButton(text='Отписаться от новых серий', callback_data=UnsubscribeSeries(series_id=series_id).pack())
+        else:
+            subscription_button = InlineKeyboardButton(text='Подписаться на новые серии', callback_data=SubscribeSeries(series_id=series_id).pack())
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text='Начать просмотр', callback_data=ViewSeries(series_id=series_id).pack())],
+            [subscription_button],
+            [InlineKeyboardButton(text='<< Назад к списку сериалов', callback_data='back_to_series_list')]
+        ])
+    return keyboard_cache.get_or_build(('actions', series_id, subscribed), build)
+
+
+def seasons_keyboard(tree: SeriesTree) -> InlineKeyboardMarkup:
+    def build():
+        keyboard_buttons = [
+            [InlineKeyboardButton(text=f'{season.season_number}. Сезон', callback_data=SelectSeason(season_id=season.season_id).pack())]
+            for season in tree.seasons
+        ]
+        keyboard_buttons.append([InlineKeyboardButton(text='<< Назад', callback_data='back_to_series_actions')])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    return keyboard_cache.get_or_build(('seasons', tree.series_id, tree.version), build)
+
+
+def episode_pages(season: SeasonNode) -> int:
+    return max(1, -(-len(season.episodes) // Config.EPISODES_PER_PAGE))
+
+
+def episodes_keyboard(tree: SeriesTree, season: SeasonNode, page: int = 0) -> InlineKeyboardMarkup:
+    # До EPISODES_PER_PAGE серий - по одной кнопке в строке, как раньше. В больших сезонах
+    # (у Telegram ограничение ~100 кнопок на сообщение) серии идут страницами по 5 в строке
+    pages = episode_pages(season)
+    page = min(max(page, 0), pages - 1)
+
+    def build():
+        if pages == 1:
+            keyboard_buttons = [
+                [InlineKeyboardButton(text=f'{episode_number}. Серия', callback_data=SelectEpisode(episode_id=episode_id).pack())]
+                for episode_id, episode_number, _ in season.episodes
+            ]
+        else:
+            start = page * Config.EPISODES_PER_PAGE
+            chunk = season.episodes[start:start + Config.EPISODES_PER_PAGE]
+            buttons = [InlineKeyboardButton(text=str(episode_number), callback_data=SelectEpisode(episode_id=episode_id).pack()) for episode_id, episode_number, _ in chunk]
+            keyboard_buttons = [buttons[i:i + 5] for i in range(0, len(buttons), 5)]
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton(text='<< Пред.', callback_data=EpisodesPage(season_id=season.season_id, page=page - 1).pack()))
+            navigation.append(InlineKeyboardButton(text=f'{page + 1}/{pages}', callback_data='noop'))
+            if page + 1 < pages:
+                navigation.append(InlineKeyboardButton(text='След. >>', callback_data=EpisodesPage(season_id=season.season_id, page=page + 1).pack()))
+            keyboard_buttons.append(navigation)
+        keyboard_buttons.append([InlineKeyboardButton(text='Отправить весь сезон', callback_data=SendSeason(season_id=season.season_id).pack())])
+        keyboard_buttons.append([InlineKeyboardButton(text='<< Назад к выбору сезона', callback_data='back_to_season_selection')])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    return keyboard_cache.get_or_build(('episodes', season.season_id, tree.version, page), build)
+
+
+def episode_navigation_keyboard(prev_id: Optional[int], next_id: Optional[int]) -> InlineKeyboardMarkup:
+    def build():
+        buttons = []
+        # Кнопка "Пред." или "К сезонам" слева
+        if prev_id:
+            buttons.append(InlineKeyboardButton(text='<< Пред.', callback_data=PrevEpisode(episode_id=prev_id).pack()))
+        else:
+            buttons.append(InlineKeyboardButton(text='<< К сезонам', callback_data='back_to_season_selection'))
+        # Кнопка "След." или "К сезонам" справа
+        if next_id:
+            buttons.append(InlineKeyboardButton(text='След. >>', callback_data=NextEpisode(episode_id=next_id).pack()))
+        else:
+            buttons.append(InlineKeyboardButton(text='К сезонам >>', callback_data='back_to_season_selection'))
+        return InlineKeyboardMarkup(inline_keyboard=[buttons])
+    return keyboard_cache.get_or_build(('navigation', prev_id, next_id), build)
@@ -0,0 +1,150 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.config import Config
+
+# Логирование бота. Обработчики пишут в logging как обычно, а в очередь попадает только запись:
+# форматирование и вывод в stdout делает QueueListener в отдельном потоке, поэтому медленный
+# stdout (например, в Docker) не блокирует event loop.
+# Каждая запись получает id апдейта и пользователя из contextvars (их выставляет UpdateContextMiddleware),
+# так что все строки одного апдейта можно найти по update_id
+
+# Контекст текущего апдейта: {'update_id': ..., 'user_id': ...}
+update_context: "contextvars.ContextVar[Optional[Dict[str, Any]]]" = contextvars.ContextVar('update_context', default=None)
+
+# Стандартные атрибуты LogRecord - всё остальное считается дополнительными полями (extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class UpdateContextFilter(logging.Filter):
+    # Запускается в потоке, который пишет лог (в event loop), до передачи записи в очередь
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = update_context.get()
+        if context:
+            for key, value in context.items():
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != 'context' and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    # Человекочитаемый формат для локальной отладки
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s%(context)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        update_id = getattr(record, 'update_id', None)
+        record.context = f' [update {update_id}]' if update_id is not None else ''
+        return super().format(record)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Подставляем аргументы в сообщение здесь, пока объекты не изменились (в очередь уходит готовая строка),
+        # но в отличие от базового prepare не форматируем всю запись - это делает поток слушателя
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    # "app.handlers=DEBUG,aiogram=WARNING" -> {'app.handlers': 'DEBUG', 'aiogram': 'WARNING'}
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def set_level(level: str, logger_name: Optional[str] = None) -> str:
+    # Смена уровня во время работы (например, командой /loglevel). Возвращает установленный уровень
+    level = level.upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f'Неизвестный уровень логирования: {level}')
+    logging.getLogger(logger_name).setLevel(level)
+    return level
+
+
+def setup_logging(level: str = 'INFO', log_format: str = 'json', levels: str = ''):
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = _ContextQueueHandler(log_queue)
+    queue_handler.addFilter(UpdateContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    set_level(level)
+    for name, logger_level in parse_levels(levels).items():
+        set_level(logger_level, name)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    # При выходе дописываем всё, что осталось в очереди
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    # Outer-middleware на апдейты: выставляет контекст для логов и пишет время обработки апдейта.
+    # Исключения обработчиков логирует сам aiogram (логгер aiogram.event) - уже с этим контекстом
+    def __init__(self):
+        self.logger = logging.getLogger('app.updates')
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get('event_from_user')
+        context = {'update_id': event.update_id if isinstance(event, Update) else None, 'user_id': user.id if user else None}
+        token = update_context.set(context)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug('Апдейт обработан', extra={'event_type': getattr(event, 'event_type', None), 'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)})
+            update_context.reset(token)
+
+
+def configure_from_env():
+    setup_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_LEVELS)
@@ -0,0 +1,218 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.config import Config
+from app.database import db
+
+# Массовый импорт каталога из файла-манифеста (CSV, JSON/JSON Lines, XLSX).
+# Строка эпизода: series, season, episode, file_id. Строка фильма: title, file_id.
+# Файл читается построчно в отдельном потоке и записывается в базу порциями по IMPORT_CHUNK_SIZE строк,
+# каждая порция - одна транзакция
+
+MANIFEST_FORMATS = ('csv', 'json', 'jsonl', 'xlsx')
+# Сколько ошибок показывать в ответе админу
+MAX_REPORTED_ERRORS = 10
+
+# Допустимые названия колонок -> поле манифеста
+COLUMN_ALIASES = {
+    'series': 'series', 'series_title': 'series', 'сериал': 'series',
+    'season': 'season', 'season_number': 'season', 'сезон': 'season',
+    'episode': 'episode', 'episode_number': 'episode', 'эпизод': 'episode', 'серия': 'episode',
+    'title': 'title', 'film': 'title', 'film_title': 'title', 'фильм': 'title', 'название': 'title',
+    'file_id': 'file_id', 'fileid': 'file_id',
+}
+
+
+class ImportSummary(NamedTuple):
+    # errors - первые MAX_REPORTED_ERRORS отклоненных строк и ошибка разбора файла, если была
+    inserted: int
+    updated: int
+    unchanged: int
+    rejected: int
+    errors: List[str]
+    seconds: float
+
+    def format(self) -> str:
+        lines = [
+            f'Импорт завершен за {self.seconds:.2f} с.',
+            f'Добавлено: {self.inserted}',
+            f'Обновлено: {self.updated}',
+            f'Без изменений: {self.unchanged}',
+            f'Отклонено: {self.rejected}',
+        ]
+        if self.errors:
+            lines.append('')
+            lines.extend(self.errors)
+            if self.rejected > MAX_REPORTED_ERRORS:
+                lines.append(f'... и еще {self.rejected - MAX_REPORTED_ERRORS}')
+        return '\n'.join(lines)
+
+
+def manifest_format(filename: Optional[str]) -> Optional[str]:
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    return extension if extension in MANIFEST_FORMATS else None
+
+
+def _normalize_row(row: Dict[Any, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for key, value in row.items():
+        field = COLUMN_ALIASES.get(str(key).strip().lower()) if key is not None else None
+        if field is not None and value is not None and str(value).strip() != '':
+            normalized[field] = value
+    return normalized
+
+
+def _iter_csv(data: bytes) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+    header = text.readline()
+    # Excel с русской локалью сохраняет CSV с разделителем ";"
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    fieldnames = next(csv.reader([header], delimiter=delimiter), [])
+    reader = csv.DictReader(text, fieldnames=fieldnames, delimiter=delimiter)
+    for line_number, row in enumerate(reader, start=2):
+        yield line_number, row
+
+
+def _iter_json(data: bytes) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    # Массив объектов разбирается по одному элементу через raw_decode, без построения всего списка;
+    # всё остальное считается JSON Lines (один объект на строку)
+    text = data.decode('utf-8-sig')
+    decoder = json.JSONDecoder()
+    position = len(text) - len(text.lstrip())
+    if text.startswith('[', position):
+        position += 1
+        number = 0
+        while True:
+            while position < len(text) and text[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(text) or text[position] == ']':
+                return
+            number += 1
+            try:
+                item, position = decoder.raw_decode(text, position)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Некорректный JSON в элементе {number}: {e.msg}')
+            yield number, item
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Некорректный JSON в строке {line_number}: {e.msg}')
+
+
+def _iter_xlsx(data: bytes) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    # read-only книга openpyxl читает лист потоково. Каждый лист со своей строкой заголовков,
+    # так что фильмы и эпизоды можно положить на разные листы
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            for line_number, values in enumerate(rows, start=2):
+                yield line_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+PARSERS = {
+    'csv': _iter_csv,
+    'json': _iter_json,
+    'jsonl': _iter_json,
+    'xlsx': _iter_xlsx,
+}
+
+
+def _to_number(value: Any) -> int:
+    # Числа из Excel приходят как float (3.0)
+    number = float(str(value).strip())
+    if not number.is_integer() or number < 1:
+        raise ValueError
+    return int(number)
+
+
+def parse_manifest_row(row: Any):
+    # ('film', title, file_id) | ('episode', series, season, episode, file_id); ValueError - строка отклонена
+    if not isinstance(row, dict):
+        raise ValueError('ожидается объект с полями')
+    row = _normalize_row(row)
+    file_id = str(row.get('file_id', '')).strip()
+    if not file_id:
+        raise ValueError('нет file_id')
+    if 'series' in row:
+        try:
+            season, episode = _to_number(row.get('season')), _to_number(row.get('episode'))
+        except (TypeError, ValueError):
+            raise ValueError('номер сезона и эпизода должны быть целыми числами больше 0')
+        return 'episode', str(row['series']).strip(), season, episode, file_id
+    if 'title' in row:
+        return 'film', str(row['title']).strip(), file_id
+    raise ValueError('нет названия сериала или фильма')
+
+
+def _read_batch(rows: Iterator[Tuple[int, Any]], size: int):
+    # Выполняется в отдельном потоке, чтобы разбор большого файла не блокировал event loop.
+    # Возвращает ([(номер строки, разобранная строка или ValueError)], ошибка разбора файла, файл закончился)
+    batch: List[Tuple[int, Any]] = []
+    while len(batch) < size:
+        try:
+            line_number, row = next(rows)
+        except StopIteration:
+            return batch, None, True
+        except Exception as e:
+            return batch, str(e), True
+        try:
+            batch.append((line_number, parse_manifest_row(row)))
+        except ValueError as e:
+            batch.append((line_number, e))
+    return batch, None, False
+
+
+async def import_manifest(data: bytes, file_format: str, user_id: int) -> ImportSummary:
+    started = time.perf_counter()
+    chunk_size = max(1, Config.IMPORT_CHUNK_SIZE)
+    inserted = updated = unchanged = rejected = 0
+    errors: List[str] = []
+    films: List[Tuple[str, str]] = []
+    episodes: List[Tuple[str, int, int, str]] = []
+
+    async def flush():
+        nonlocal inserted, updated, unchanged
+        if films or episodes:
+            counts = await db.upsert_catalogue(films, episodes, user_id)
+            inserted += counts[0]
+            updated += counts[1]
+            unchanged += counts[2]
+            films.clear()
+            episodes.clear()
+
+    # Генераторы ленивые: файл (в том числе распаковка XLSX) читается только в _read_batch, в потоке
+    rows = PARSERS[file_format](data)
+    finished = False
+    while not finished:
+        batch, failure, finished = await asyncio.to_thread(_read_batch, rows, chunk_size)
+        for line_number, item in batch:
+            if isinstance(item, ValueError):
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f'Строка {line_number}: {item}')
+                continue
+            if item[0] == 'film':
+                films.append(item[1:])
+            else:
+                episodes.append(item[1:])
+            if len(films) + len(episodes) >= chunk_size:
+                await flush()
+        if failure is not None:
+            # Файл поврежден дальше этой точки: уже записанные порции остаются в базе
+            errors.append(f'Разбор файла остановлен: {failure}')
+    await flush()
+    return ImportSummary(inserted, updated, unchanged, rejected, errors, time.perf_counter() - started)
@@ -0,0 +1,224 @@
+import bisect
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.event.bases import CancelHandler, SkipHandler
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from app.config import Config
+
+# Метрики бота в формате Prometheus (text exposition 0.0.4) без внешних зависимостей:
+# счетчики и гистограммы по меткам живут в памяти процесса, /metrics отдает их текстом.
+# Все изменения метрик происходят в event loop, поэтому блокировки не нужны
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                labels = _format_labels(self.labels, label_values, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {count}')
+        return lines
+
+
+class CacheCollector:
+    # Счетчики попаданий и промахов кэшей: значения берутся из stats() самих кэшей в момент запроса /metrics
+    def __init__(self):
+        self._caches: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def register(self, name: str, stats: Callable[[], Dict[str, float]]):
+        self._caches[name] = stats
+
+    def render(self) -> List[str]:
+        lines = []
+        for metric, key, kind, documentation in (
+            ('bot_cache_hits_total', 'hits', 'counter', 'Попадания в кэш'),
+            ('bot_cache_misses_total', 'misses', 'counter', 'Промахи кэша'),
+            ('bot_cache_hit_ratio', 'hit_rate', 'gauge', 'Доля попаданий в кэш'),
+        ):
+            lines.extend([f'# HELP {metric} {documentation}', f'# TYPE {metric} {kind}'])
+            for name, stats in self._caches.items():
+                lines.append(f'{metric}{{cache="{name}"}} {float(stats()[key])}')
+        return lines
+
+
+HANDLER_LATENCY = Histogram('bot_handler_duration_seconds', 'Время работы обработчика', ('handler',))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Исключения в обработчиках', ('handler',))
+UPDATE_LATENCY = Histogram('bot_update_duration_seconds', 'Полное время обработки апдейта', ('event_type',))
+UPDATE_DB_OPERATIONS = Histogram('bot_update_db_operations', 'Обращений к базе за один апдейт', (), COUNT_BUCKETS)
+UPDATE_DB_TIME = Histogram('bot_update_db_seconds', 'Время работы с базой за один апдейт')
+DB_OPERATIONS = Counter('bot_db_operations_total', 'Обращения к базе (захваты соединения из пула)')
+DB_TIME = Counter('bot_db_seconds_total', 'Суммарное время работы с базой')
+API_LATENCY = Histogram('bot_telegram_api_duration_seconds', 'Время запросов к Telegram Bot API', ('method',))
+API_ERRORS = Counter('bot_telegram_api_errors_total', 'Ошибки запросов к Telegram Bot API', ('method',))
+CACHES = CacheCollector()
+
+METRICS = [HANDLER_LATENCY, HANDLER_ERRORS, UPDATE_LATENCY, UPDATE_DB_OPERATIONS, UPDATE_DB_TIME, DB_OPERATIONS, DB_TIME, API_LATENCY, API_ERRORS, CACHES]
+
+# Счетчик работы с базой текущего апдейта: [обращения, секунды]
+_update_db: "contextvars.ContextVar[Optional[List[float]]]" = contextvars.ContextVar('update_db', default=None)
+
+
+def observe_db(seconds: float):
+    # Вызывается из Database.acquire после каждого обращения к базе
+    DB_OPERATIONS.inc()
+    DB_TIME.inc(amount=seconds)
+    current = _update_db.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += seconds
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    # Outer-middleware на апдейты: полное время апдейта и работа с базой за апдейт
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        db_usage = [0, 0.0]
+        token = _update_db.set(db_usage)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, getattr(event, 'event_type', 'unknown'))
+            UPDATE_DB_OPERATIONS.observe(db_usage[0])
+            UPDATE_DB_TIME.observe(db_usage[1])
+            _update_db.reset(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Inner-middleware на события роутера: в data['handler'] уже выбранный обработчик.
+    # Callback-запросы идут через общий dispatch_callback - для них берем обработчик из таблицы маршрутов
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('callback_route') or data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except (SkipHandler, CancelHandler):
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    # Middleware сессии бота: время каждого вызова Bot API по имени метода
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_ERRORS.inc(name)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, name)
+
+
+def setup_metrics(dp, bot):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Inner-middleware диспетчера применяются и к обработчикам вложенных роутеров
+    for event_name, observer in dp.observers.items():
+        if event_name not in ('update', 'error'):
+            observer.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+
+def add_metrics_route(app: web.Application):
+    app.router.add_get('/metrics', _metrics_handler)
+
+
+_runner: Optional[web.AppRunner] = None
+
+
+async def start_metrics_server():
+    # Отдельный локальный HTTP-сервер для /metrics (по умолчанию 127.0.0.1:9100)
+    global _runner
+    if _runner is not None:
+        return
+    app = web.Application()
+    add_metrics_route(app)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host=Config.METRICS_HOST, port=Config.METRICS_PORT).start()
+    logger.info('Метрики доступны на http://%s:%s/metrics', Config.METRICS_HOST, Config.METRICS_PORT)
+
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import sys
+from typing import Dict, List, Tuple
+
+from app import queries
+from app.text import normalize_title
+
+logger = logging.getLogger(__name__)
+
+# Версионные миграции схемы. Номер примененной версии хранится в PRAGMA user_version,
+# каждая миграция выполняется в своей транзакции вместе с обновлением версии.
+# Миграции написаны так, чтобы их можно было применить и к базам, созданным старым init_db
+# (user_version = 0, но часть таблиц уже есть)
+
+# Таблицы, для названий которых ведется триграммный FTS5-индекс <table>_fts
+TITLE_FTS_TABLES = ('films', 'series')
+
+# Колонки, добавленные в таблицы после первой версии схемы: таблица -> ((колонка, тип), ...)
+REQUIRED_COLUMNS = {
+    'series': (('user_id', 'INTEGER'),),
+    'episodes': (('user_id', 'INTEGER'),),
+}
+
+
+async def _base_schema(conn):
+    await conn.execute('''CREATE TABLE IF NOT EXISTS films (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL
+    )''')
+    # Таблицы для сериалов
+    await conn.execute('''CREATE TABLE IF NOT EXISTS series (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL
+    )''')
+    await conn.execute('''CREATE TABLE IF NOT EXISTS seasons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        series_id INTEGER NOT NULL,
+        season_number INTEGER NOT NULL,
+        FOREIGN KEY (series_id) REFERENCES series(id)
+    )''')
+    await conn.execute('''CREATE TABLE IF NOT EXISTS episodes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        season_id INTEGER NOT NULL,
+        episode_number INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        FOREIGN KEY (season_id) REFERENCES seasons(id)
+    )''')
+    # Добавляем колонки, которых нет в базах, созданных старыми версиями бота
+    for table, columns in REQUIRED_COLUMNS.items():
+        async with conn.execute(f'PRAGMA table_info({table})') as cursor:
+            existing = {col[1] for col in await cursor.fetchall()}
+        for column, column_type in columns:
+            if column not in existing:
+                await conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+async def _title_fts(conn):
+    # Триграммные FTS5-индексы по названиям фильмов и сериалов (external content),
+    # синхронизируются с основными таблицами триггерами
+    for table in TITLE_FTS_TABLES:
+        fts = f'{table}_fts'
+        async with conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)) as cursor:
+            exists = await cursor.fetchone()
+        await conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(title, content='{table}', content_rowid='id', tokenize='trigram')")
+        await conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, title) VALUES (new.id, new.title);
+        END''')
+        await conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, old.title);
+        END''')
+        await conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF title ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, old.title);
+            INSERT INTO {fts}(rowid, title) VALUES (new.id, new.title);
+        END''')
+        if not exists:
+            # Индекс только что создан - заполняем его уже существующими названиями
+            await conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+async def _lookup_indexes(conn):
+    # Перед созданием UNIQUE-индексов разбираем дубли, которые могли накопиться без ограничений.
+    # Повторяющиеся сезоны сливаются без потерь: их эпизоды переносятся в самый ранний сезон
+    # с тем же номером. Повторяющиеся эпизоды молча не удаляем - какой file_id верный, решает админ,
+    # поэтому миграция прерывается (и откатывается целиком) со списком дублей
+    async with conn.execute('SELECT COUNT(*) FROM seasons WHERE id NOT IN (SELECT MIN(id) FROM seasons GROUP BY series_id, season_number)') as cursor:
+        merged_seasons = (await cursor.fetchone())[0]
+    await conn.execute('''
+        UPDATE episodes SET season_id = (
+            SELECT MIN(s2.id) FROM seasons s1
+            JOIN seasons s2 ON s2.series_id = s1.series_id AND s2.season_number = s1.season_number
+            WHERE s1.id = episodes.season_id
+        )
+        WHERE season_id IN (SELECT id FROM seasons WHERE id NOT IN (SELECT MIN(id) FROM seasons GROUP BY series_id, season_number))
+    ''')
+    await conn.execute('DELETE FROM seasons WHERE id NOT IN (SELECT MIN(id) FROM seasons GROUP BY series_id, season_number)')
+    if merged_seasons:
+        logger.warning('Миграция: объединено повторяющихся сезонов: %s (эпизоды перенесены в первый сезон с тем же номером)', merged_seasons)
+    async with conn.execute('''
+        SELECT ser.title, s.season_number, e.episode_number, GROUP_CONCAT(e.id, ', ')
+        FROM episodes e
+        LEFT JOIN seasons s ON s.id = e.season_id
+        LEFT JOIN series ser ON ser.id = s.series_id
+        WHERE e.season_id IS NOT NULL
+        GROUP BY e.season_id, e.episode_number
+        HAVING COUNT(*) > 1
+    ''') as cursor:
+        duplicates = await cursor.fetchall()
+    if duplicates:
+        examples = '; '.join(f'"{title}" сезон {season} серия {episode} (id {ids})' for title, season, episode, ids in duplicates[:10])
+        raise RuntimeError(
+            f'В базе {len(duplicates)} эпизодов с одинаковыми сезоном и номером: {examples}. '
+            f'Удалите лишние записи из таблицы episodes и запустите бота снова'
+        )
+    await conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_seasons_series_number ON seasons(series_id, season_number)')
+    await conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_episodes_season_number ON episodes(season_id, episode_number)')
+    # Поиск по точному названию без учета регистра
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_films_title_nocase ON films(title COLLATE NOCASE)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_series_title_nocase ON series(title COLLATE NOCASE)')
+
+
+async def _subscriptions(conn):
+    # Подписки на новые серии: ключ (series_id, user_id), подписчики сериала читаются
+    # по порядку user_id прямо из первичного ключа
+    await conn.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
+        series_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        PRIMARY KEY (series_id, user_id)
+    ) WITHOUT ROWID''')
+    # Очередь рассылок о новых сериях. last_user_id - последний подписчик, которому рассылка уже ушла:
+    # после перезапуска рассылка продолжается с него, а не с начала
+    await conn.execute('''CREATE TABLE IF NOT EXISTS notification_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        series_id INTEGER NOT NULL,
+        episodes INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL,
+        finished_at INTEGER
+    )''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_notification_jobs_status ON notification_jobs(status, id)')
+
+
+async def _fsm_storage(conn):
+    # FSM-состояния пользователей (app/storage.py), data - JSON. Раньше таблицу с той же схемой
+    # создавало само хранилище при запуске, поэтому IF NOT EXISTS: сохраненные диалоги остаются
+    await conn.execute('''CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at REAL NOT NULL
+    )''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at)')
+
+
+async def _notification_attempts(conn):
+    # Число неудачных попыток рассылки: задание, которое падает раз за разом, уходит в конец очереди,
+    # а после NOTIFY_MAX_ATTEMPTS попыток получает статус 'failed' и больше не выбирается
+    async with conn.execute('PRAGMA table_info(notification_jobs)') as cursor:
+        existing = {col[1] for col in await cursor.fetchall()}
+    if 'attempts' not in existing:
+        await conn.execute('ALTER TABLE notification_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+
+
+async def _normalized_title_fts(conn):
+    # Триграммные индексы строятся по normalize_title(title) - тому же виду, в котором сравнивает
+    # нечеткий поиск (ё -> е, без пунктуации), иначе "елка" не находит "Ёлка!". Индекс contentless:
+    # текст хранится только в основной таблице, триггеры передают в FTS нормализованное название
+    for table in TITLE_FTS_TABLES:
+        fts = f'{table}_fts'
+        for suffix in ('ai', 'ad', 'au'):
+            await conn.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+        await conn.execute(f'DROP TABLE IF EXISTS {fts}')
+        await conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5(title, content='', tokenize='trigram')")
+        await conn.execute(f'''CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, title) VALUES (new.id, normalize_title(new.title));
+        END''')
+        await conn.execute(f'''CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, normalize_title(old.title));
+        END''')
+        await conn.execute(f'''CREATE TRIGGER {fts}_au AFTER UPDATE OF title ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, normalize_title(old.title));
+            INSERT INTO {fts}(rowid, title) VALUES (new.id, normalize_title(new.title));
+        END''')
+        await conn.execute(f'INSERT INTO {fts}(rowid, title) SELECT id, normalize_title(title) FROM {table}')
+
+
+# (версия, описание, функция). Новые миграции добавляются только в конец списка
+MIGRATIONS = [
+    (1, 'базовая схема и колонки user_id', _base_schema),
+    (2, 'FTS5-индексы названий', _title_fts),
+    (3, 'индексы поиска и UNIQUE для сезонов и эпизодов', _lookup_indexes),
+    (4, 'подписки на сериалы и очередь рассылок', _subscriptions),
+    (5, 'таблица FSM-состояний', _fsm_storage),
+    (6, 'счетчик попыток рассылок', _notification_attempts),
+    (7, 'FTS5-индексы нормализованных названий', _normalized_title_fts),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn) -> int:
+    async with conn.execute('PRAGMA user_version') as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def register_functions(conn):
+    # SQL-функции, которые вызывают триггеры схемы. Регистрируются на каждом соединении,
+    # которое пишет в films и series (пул Database, migrate): без них запись в эти таблицы падает
+    await conn.create_function('normalize_title', 1, normalize_title, deterministic=True)
+
+
+async def migrate(conn) -> List[Tuple[int, str]]:
+    # Применяет недостающие миграции, возвращает список примененных (версия, описание)
+    await register_functions(conn)
+    current = await get_schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f'Версия схемы базы ({current}) новее, чем поддерживает бот ({SCHEMA_VERSION})')
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        # Явный BEGIN, чтобы DDL тоже попал в транзакцию и миграция применялась целиком или никак
+        await conn.execute('BEGIN')
+        try:
+            await migration(conn)
+            await conn.execute(f'PRAGMA user_version = {int(version)}')
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+# --- Проверка планов запросов ---
+# Горячие запросы обработчиков (те же строки SQL, что выполняет Database) с типичными параметрами.
+# Ни один из них не должен читать таблицу каталога целиком (SCAN), только через индекс или первичный ключ
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    'find_film_exact': (queries.FIND_FILM_EXACT, ('x',)),
+    'find_film_titles_like': (queries.FIND_FILM_TITLES_FTS, ('"xyz"',)),
+    'film_ids_by_title': (queries.FILM_IDS_BY_TITLE, ('x', 'x')),
+    'delete_films_by_title': (queries.DELETE_FILMS_BY_TITLE, ('x', 'x')),
+    'find_series_exact': (queries.FIND_SERIES_EXACT, ('x',)),
+    'get_series_title': (queries.GET_SERIES_TITLE, (1,)),
+    'list_seasons': (queries.LIST_SEASONS, (1,)),
+    'get_season': (queries.GET_SEASON, (1,)),
+    'load_series_tree': (queries.LOAD_SERIES_TREE, (1,)),
+    'list_episodes': (queries.LIST_EPISODES, (1,)),
+    'get_episode_view': (queries.GET_EPISODE_VIEW, (1, 1)),
+    'is_subscribed': (queries.IS_SUBSCRIBED, (1, 1)),
+    'subscribers_after': (queries.SUBSCRIBERS_AFTER, (1, 0, 100)),
+    'delete_subscription': (queries.DELETE_SUBSCRIPTION, (1, 1)),
+    'merge_pending_notification': (queries.MERGE_PENDING_NOTIFICATION, (1, 1)),
+    'claim_notification_job': (queries.CLAIM_NOTIFICATION_JOB, ()),
+    'get_fsm_record': (queries.GET_FSM_RECORD, ('1:1:1::default',)),
+    'delete_fsm_record': (queries.DELETE_FSM_RECORD, ('1:1:1::default',)),
+    'purge_fsm_records': (queries.PURGE_FSM_RECORDS, (0.0,)),
+}
+for _table in TITLE_FTS_TABLES:
+    HOT_QUERIES[f'match_title_trigrams_{_table}'] = (queries.MATCH_TITLE_TRIGRAMS.format(fts=f'{_table}_fts'), ('"xyz"', 200))
+for _kind, _page in queries.PAGE_QUERIES.items():
+    HOT_QUERIES[f'fetch_page_{_kind}_after'] = (_page.after, (0, 30))
+    HOT_QUERIES[f'fetch_page_{_kind}_before'] = (_page.before, (100, 30))
+    HOT_QUERIES[f'fetch_page_{_kind}_exists_before'] = (_page.exists_before, (1,))
+    HOT_QUERIES[f'fetch_page_{_kind}_exists_after'] = (_page.exists_after, (1,))
+
+
+async def explain_hot_queries(conn) -> Dict[str, List[str]]:
+    plans = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        async with conn.execute(f'EXPLAIN QUERY PLAN {sql}', params) as cursor:
+            plans[name] = [row[3] for row in await cursor.fetchall()]
+    return plans
+
+
+def _is_table_scan(detail: str) -> bool:
+    # "SCAN films" / "SCAN e USING COVERING INDEX ..." - полный проход по таблице (в плане может стоять
+    # псевдоним из запроса). Проход по FTS-индексу, подзапросу или одной константной строке - не проблема
+    if not detail.startswith('SCAN '):
+        return False
+    return not (detail.startswith(('SCAN (', 'SCAN CONSTANT ROW')) or 'VIRTUAL TABLE' in detail)
+
+
+def find_table_scans(plans: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    scans = {}
+    for name, details in plans.items():
+        bad = [detail for detail in details if _is_table_scan(detail)]
+        if bad:
+            scans[name] = bad
+    return scans
+
+
+async def _main() -> int:
+    # python -m app.migrations - применить миграции к DB_PATH и проверить планы горячих запросов.
+    # Код возврата 1, если какой-то запрос читает таблицу целиком (для проверки в CI)
+    from app.database import db
+
+    await db.connect()
+    try:
+        # Миграции и EXPLAIN на одном соединении: другие соединения пула могут держать старую схему
+        async with db.acquire() as conn:
+            for version, description in await migrate(conn):
+                print(f'Применена миграция схемы {version}: {description}')
+            print(f'Версия схемы: {await get_schema_version(conn)}')
+            plans = await explain_hot_queries(conn)
+        for name, details in plans.items():
+            print(f'{name}: {"; ".join(details)}')
+        scans = find_table_scans(plans)
+        for name, details in scans.items():
+            print(f'ПОЛНЫЙ ПРОСМОТР ТАБЛИЦЫ в {name}: {"; ".join(details)}')
+        return 1 if scans else 0
+    finally:
+        await db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.callbacks import ViewSeries, UnsubscribeSeries
+from app.config import Config
+from app.database import db
+from app.ratelimit import bulk_sends
+
+# Фоновая рассылка о новых сериях подписчикам сериала. Задания кладет в notification_jobs
+# импорт каталога (в одной транзакции с сериями), воркер забирает их по одному и отправляет
+# уведомления порциями по NOTIFY_CHUNK_SIZE подписчиков: порция читается из SQLite по ключу,
+# сообщения уходят через планировщик отправок с низким приоритетом (bulk), после каждой порции
+# в базе сохраняется последний обработанный user_id. После перезапуска рассылка продолжается
+# с него - повторно уведомление может получить не больше одной порции. Если задание падает
+# с ошибкой, попытка учитывается (attempts) и оно уходит в конец очереди; после NOTIFY_MAX_ATTEMPTS
+# попыток задание получает статус 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def notification_text(series_title: str, episodes: int) -> str:
+    return f'В сериале "{series_title}" новые серии: {episodes}.'
+
+
+def notification_keyboard(series_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='Смотреть', callback_data=ViewSeries(series_id=series_id).pack())],
+        [InlineKeyboardButton(text='Отписаться', callback_data=UnsubscribeSeries(series_id=series_id).pack())],
+    ])
+
+
+class NotificationWorker:
+    def __init__(self, chunk_size: int = 100, poll_interval: float = 30.0, max_attempts: int = 5):
+        self.chunk_size = max(1, chunk_size)
+        # Как часто проверять очередь без явного wake() (например, задания от другого процесса)
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self, bot: Bot):
+        if self._task is not None:
+            return
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        # Вызывается после импорта, добавившего серии
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            job = None
+            try:
+                job = await db.claim_notification_job()
+                if job is not None:
+                    await self._process(*job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Ошибка рассылки о новых сериях')
+                if job is not None:
+                    await self._fail(job[0])
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fail(self, job_id: int):
+        try:
+            if await db.fail_notification_job(job_id, self.max_attempts):
+                logger.error('Рассылка %s остановлена после %s неудачных попыток', job_id, self.max_attempts)
+        except Exception:
+            logger.exception('Не удалось сохранить неудачную попытку рассылки %s', job_id)
+
+    async def _send(self, user_id: int, text: str, keyboard: InlineKeyboardMarkup) -> Optional[bool]:
+        # True - доставлено, False - пользователь недоступен (подписку надо удалить), None - другая ошибка
+        try:
+            await self._bot.send_message(user_id, text, reply_markup=keyboard)
+            return True
+        except TelegramForbiddenError:
+            return False
+        except TelegramBadRequest as e:
+            if 'chat not found' in str(e).lower():
+                return False
+            logger.warning('Не удалось отправить уведомление пользователю %s: %s', user_id, e)
+        except Exception as e:
+            logger.warning('Не удалось отправить уведомление пользователю %s: %s', user_id, e)
+        return None
+
+    async def _process(self, job_id: int, series_id: int, episodes: int, last_user_id: int, sent: int):
+        title = await db.get_series_title(series_id)
+        if title is None:
+            await db.finish_notification_job(job_id)
+            return
+        text = notification_text(title, episodes)
+        keyboard = notification_keyboard(series_id)
+        logger.info('Рассылка о новых сериях "%s" (задание %s, с user_id > %s)', title, job_id, last_user_id)
+        while True:
+            user_ids = await db.subscribers_after(series_id, last_user_id, self.chunk_size)
+            if not user_ids:
+                break
+            # Порция отправляется параллельно: темп задает планировщик отправок,
+            # а ответы пользователям обгоняют рассылку за счет низкого приоритета
+            with bulk_sends():
+                results = await asyncio.gather(*(self._send(user_id, text, keyboard) for user_id in user_ids))
+            gone: List[int] = [user_id for user_id, result in zip(user_ids, results) if result is False]
+            if gone:
+                await db.remove_subscribers(series_id, gone)
+            sent += sum(1 for result in results if result)
+            last_user_id = user_ids[-1]
+            await db.advance_notification_job(job_id, last_user_id, sent)
+        await db.finish_notification_job(job_id)
+        logger.info('Рассылка %s завершена: отправлено %s', job_id, sent)
+
+
+notification_worker = NotificationWorker(Config.NOTIFY_CHUNK_SIZE, Config.NOTIFY_POLL_INTERVAL, Config.NOTIFY_MAX_ATTEMPTS)
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.callbacks import ListPage
+from app.config import Config
+from app.database import db, Page, PAGE_SOURCES
+
+# Лимит длины текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+# Заголовки, пустые списки и формат строки для каждого вида списка
+PAGE_TITLES = {
+    'films': ('Список фильмов:', 'База пуста.'),
+    'series': ('Список сериалов:', 'База сериалов пуста.'),
+    'check': ('[ТЕСТ] Содержимое базы:', '[ТЕСТ] База пуста.'),
+}
+
+
+def format_row(kind: str, row) -> str:
+    if kind == 'check':
+        return f'id: {row[0]}, title: {row[1]}, file_id: {row[2]}, user_id: {row[3]}'
+    return f'{row[0]}. {row[1]}'
+
+
+def page_size(kind: str) -> int:
+    # В строках отладочного списка есть file_id, поэтому страница меньше
+    return Config.CHECK_PAGE_SIZE if kind == 'check' else Config.LIST_PAGE_SIZE
+
+
+class PageCache:
+    # Небольшой LRU-кэш страниц по ключу (вид списка, направление, курсор).
+    # Сбрасывается при любом изменении соответствующей таблицы каталога
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._pages: "OrderedDict[Tuple[str, bool, int], Page]" = OrderedDict()
+
+    def get(self, key) -> Optional[Page]:
+        page = self._pages.get(key)
+        if page is not None:
+            self.hits += 1
+            self._pages.move_to_end(key)
+        else:
+            self.misses += 1
+        return page
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0, 'pages': len(self._pages)}
+
+    def put(self, key, page: Page):
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.maxsize:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, table: str):
+        for key in [key for key in self._pages if PAGE_SOURCES[key[0]][1] == table]:
+            del self._pages[key]
+
+
+page_cache = PageCache(Config.PAGE_CACHE_SIZE)
+
+
+async def get_page(kind: str, cursor: int = 0, forward: bool = True) -> Page:
+    key = (kind, forward, cursor)
+    page = page_cache.get(key)
+    if page is None:
+        page = await db.fetch_page(kind, cursor, forward, page_size(kind))
+        page_cache.put(key, page)
+    return page
+
+
+def render_page(kind: str, page: Page) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    title, empty_text = PAGE_TITLES[kind]
+    if not page.rows:
+        return empty_text, None
+
+    text = f'{title}\n' + '\n'.join(format_row(kind, row) for row in page.rows)
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 1] + '…'
+
+    buttons = []
+    if page.has_prev:
+        buttons.append(InlineKeyboardButton(text='<< Пред.', callback_data=ListPage(kind=kind, forward=False, cursor=page.rows[0][0]).pack()))
+    if page.has_next:
+        buttons.append(InlineKeyboardButton(text='След. >>', callback_data=ListPage(kind=kind, forward=True, cursor=page.rows[-1][0]).pack()))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return text, keyboard
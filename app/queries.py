@@ -0,0 +1,117 @@
+from typing import Dict, NamedTuple
+
+# SQL запросов Database. Строки общие для app/database.py и проверки планов в app/migrations.py
+# (HOT_QUERIES), поэтому проверяется ровно то, что выполняет бот
+
+# Источники постраничных списков: вид списка -> (колонки, таблица)
+PAGE_SOURCES = {
+    'films': ('id, title', 'films'),
+    'series': ('id, title', 'series'),
+    'check': ('id, title, file_id, user_id', 'films'),
+}
+
+# --- Поиск по названиям ---
+# {fts} - триграммный FTS5-индекс таблицы (<table>_fts)
+MATCH_TITLE_TRIGRAMS = 'SELECT rowid FROM {fts} WHERE {fts} MATCH ? ORDER BY rank LIMIT ?'
+
+# --- Фильмы ---
+FIND_FILM_EXACT = 'SELECT file_id, title FROM films WHERE title = ? COLLATE NOCASE'
+LIST_FILMS_FULL = 'SELECT id, title, file_id, user_id FROM films'
+# Подстрока короче триграммы: индексом не найти, остается LIKE по всей таблице
+FIND_FILM_TITLES_SHORT = 'SELECT DISTINCT title FROM films WHERE title LIKE ?'
+FIND_FILM_TITLES_FTS = '''
+    SELECT DISTINCT f.title
+    FROM films_fts
+    JOIN films f ON f.id = films_fts.rowid
+    WHERE films_fts MATCH ?
+'''
+# Сравнение с NOCASE позволяет использовать индекс idx_films_title_nocase, второе - точное
+FILM_IDS_BY_TITLE = 'SELECT id FROM films WHERE title = ? COLLATE NOCASE AND title = ?'
+DELETE_FILMS_BY_TITLE = 'DELETE FROM films WHERE title = ? COLLATE NOCASE AND title = ?'
+
+
+# --- Постраничные списки ---
+class PageQueries(NamedTuple):
+    # Keyset-пагинация по id: страница после/перед курсором и есть ли записи с другой стороны
+    after: str
+    before: str
+    exists_before: str
+    exists_after: str
+
+
+PAGE_QUERIES: Dict[str, PageQueries] = {
+    kind: PageQueries(
+        f'SELECT {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+        f'SELECT {columns} FROM {table} WHERE id < ? ORDER BY id DESC LIMIT ?',
+        f'SELECT EXISTS(SELECT 1 FROM {table} WHERE id < ?)',
+        f'SELECT EXISTS(SELECT 1 FROM {table} WHERE id > ?)',
+    )
+    for kind, (columns, table) in PAGE_SOURCES.items()
+}
+
+# --- Сериалы ---
+LIST_SERIES = 'SELECT id, title FROM series'
+FIND_SERIES_EXACT = 'SELECT id, title FROM series WHERE title = ? COLLATE NOCASE'
+GET_SERIES_TITLE = 'SELECT title FROM series WHERE id = ?'
+LIST_SEASONS = 'SELECT id, season_number FROM seasons WHERE series_id = ? ORDER BY season_number'
+GET_SEASON = '''
+    SELECT s.season_number, s.series_id, ser.title
+    FROM seasons s
+    LEFT JOIN series ser ON s.series_id = ser.id
+    WHERE s.id = ?
+'''
+LOAD_SERIES_TREE = '''
+    SELECT ser.title, s.id, s.season_number, e.id, e.episode_number, e.file_id
+    FROM series ser
+    LEFT JOIN seasons s ON s.series_id = ser.id
+    LEFT JOIN episodes e ON e.season_id = s.id
+    WHERE ser.id = ?
+    ORDER BY s.season_number, s.id, e.episode_number, e.id
+'''
+
+# --- Эпизоды ---
+LIST_EPISODES = 'SELECT id, episode_number FROM episodes WHERE season_id = ? ORDER BY episode_number'
+# Параметры: (episode_id, episode_id)
+GET_EPISODE_VIEW = '''
+    SELECT file_id, episode_number, season_number, series_title, season_id, series_id, total, prev_id, next_id
+    FROM (
+        SELECT
+            e.id,
+            e.file_id,
+            e.episode_number,
+            s.season_number,
+            ser.title AS series_title,
+            s.id AS season_id,
+            ser.id AS series_id,
+            COUNT(*) OVER () AS total,
+            LAG(e.id) OVER (ORDER BY e.episode_number, e.id) AS prev_id,
+            LEAD(e.id) OVER (ORDER BY e.episode_number, e.id) AS next_id
+        FROM episodes e
+        JOIN seasons s ON e.season_id = s.id
+        JOIN series ser ON s.series_id = ser.id
+        WHERE e.season_id = (SELECT season_id FROM episodes WHERE id = ?)
+    )
+    WHERE id = ?
+'''
+
+# --- Подписки ---
+IS_SUBSCRIBED = 'SELECT 1 FROM subscriptions WHERE series_id = ? AND user_id = ?'
+SUBSCRIBERS_AFTER = 'SELECT user_id FROM subscriptions WHERE series_id = ? AND user_id > ? ORDER BY user_id LIMIT ?'
+DELETE_SUBSCRIPTION = 'DELETE FROM subscriptions WHERE series_id = ? AND user_id = ?'
+
+# --- Рассылки о новых сериях ---
+MERGE_PENDING_NOTIFICATION = "UPDATE notification_jobs SET episodes = episodes + ? WHERE series_id = ? AND status = 'pending'"
+# Задания с неудачными попытками идут после остальных, чтобы не задерживать очередь
+CLAIM_NOTIFICATION_JOB = '''
+    SELECT id, series_id, episodes, last_user_id, sent FROM notification_jobs
+    WHERE status IN ('running', 'pending') ORDER BY attempts, status = 'pending', id LIMIT 1
+'''
+
+# --- FSM-состояния (app/storage.py) ---
+GET_FSM_RECORD = 'SELECT state, data, updated_at FROM fsm_storage WHERE key = ?'
+UPSERT_FSM_RECORD = '''
+    INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+'''
+DELETE_FSM_RECORD = 'DELETE FROM fsm_storage WHERE key = ?'
+PURGE_FSM_RECORDS = 'DELETE FROM fsm_storage WHERE updated_at < ?'
@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.config import Config
+
+# Планировщик исходящих сообщений на уровне сессии бота. Каждый вызов Bot API, отправляющий
+# сообщение в чат, сначала получает разрешение у двух token bucket: общего (~30 сообщений/с на бота)
+# и бакета чата (~1 сообщение/с в личке с небольшим запасом на ответ из 2-3 сообщений, ~20 в минуту в группах).
+# Ожидающие отправки выстраиваются по приоритету: ответы пользователям (INTERACTIVE) идут раньше
+# массовых рассылок (BULK). На 429 Too Many Requests чат ставится на паузу на retry_after,
+# и запрос повторяется автоматически
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+# Приоритет отправок текущей задачи; рассылки оборачиваются в bulk_sends()
+send_priority: "contextvars.ContextVar[int]" = contextvars.ContextVar('send_priority', default=INTERACTIVE)
+
+# Методы, на которые распространяются лимиты Telegram на сообщения
+LIMITED_PREFIXES = ('Send', 'Copy', 'Forward', 'Edit')
+UNLIMITED_METHODS = {'SendChatAction'}
+
+
+@contextmanager
+def bulk_sends():
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    # Токены пополняются со скоростью rate в секунду до capacity. Отправка разрешена, пока есть
+    # хотя бы один токен, и списывает cost токенов (альбом в общем бакете может увести баланс в минус)
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        # now мог быть прочитан раньше создания бакета: время назад не идет, баланс не уменьшается
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now: float, cost: float = 1.0):
+        self._refill(now)
+        self.tokens -= cost
+
+    def block(self, now: float, seconds: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chats: Dict[int, TokenBucket] = {}
+        # (приоритет, порядковый номер, chat_id, стоимость, future)
+        self._waiters: List[Tuple[int, int, int, float, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Бакеты давно молчащих чатов полны - их можно забыть без потери точности
+                now = time.monotonic()
+                for idle_chat in [key for key, value in self._chats.items() if value.idle(now)]:
+                    del self._chats[idle_chat]
+            # Отрицательный chat_id - группа или канал: там лимит ~20 сообщений в минуту
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1.0)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'waiting': sum(1 for *_, future in self._waiters if not future.done()),
+            'waiting_bulk': sum(1 for priority, *_, future in self._waiters if priority == BULK and not future.done()),
+            'chats': len(self._chats),
+        }
+
+    async def acquire(self, chat_id: int, cost: float = 1.0, priority: Optional[int] = None):
+        # cost списывается с общего лимита (альбом из 10 видео - 10 сообщений), а в бакете чата
+        # любая отправка стоит 1: иначе альбом на несколько секунд задерживает следующий ответ в этом чате
+        priority = send_priority.get() if priority is None else priority
+        chat = self._chat_bucket(chat_id)
+        now = time.monotonic()
+        # Быстрый путь: очереди нет и оба бакета готовы
+        if not self._waiters and chat.wait_time(now) == 0 and self.global_bucket.wait_time(now) == 0:
+            chat.consume(now)
+            self.global_bucket.consume(now, cost)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), chat_id, cost, future))
+        self._ensure_pump()
+        self._wakeup.set()
+        await future
+
+    def _ensure_pump(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+
+    def _grant_ready(self) -> Optional[float]:
+        # Выдает разрешения по порядку приоритета. Чат, упершийся в свой лимит, не задерживает
+        # остальные чаты; общий лимит соблюдается строго по очереди.
+        # Возвращает, через сколько секунд проверить снова (None - очередь пуста)
+        now = time.monotonic()
+        next_check = None
+        remaining = []
+        blocked_chats = set()
+        while self._waiters:
+            item = heapq.heappop(self._waiters)
+            priority, _, chat_id, cost, future = item
+            if future.done():
+                continue
+            chat = self._chat_bucket(chat_id)
+            chat_wait = chat.wait_time(now) if chat_id not in blocked_chats else None
+            if chat_wait:
+                next_check = chat_wait if next_check is None else min(next_check, chat_wait)
+            if chat_wait is None or chat_wait > 0:
+                # Более ранний запрос этого чата еще ждет - сохраняем порядок сообщений в чате
+                blocked_chats.add(chat_id)
+                remaining.append(item)
+                continue
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                next_check = global_wait if next_check is None else min(next_check, global_wait)
+                remaining.append(item)
+                break
+            chat.consume(now)
+            self.global_bucket.consume(now, cost)
+            future.set_result(None)
+        for item in remaining:
+            heapq.heappush(self._waiters, item)
+        if self._waiters and next_check is None:
+            next_check = 0.0
+        return next_check
+
+    async def _pump(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._grant_ready()
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def block_chat(self, chat_id: int, seconds: float):
+        self._chat_bucket(chat_id).block(time.monotonic(), seconds)
+
+    async def close(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for *_, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        chat_id = getattr(method, 'chat_id', None)
+        if not name.startswith(LIMITED_PREFIXES) or name in UNLIMITED_METHODS or not isinstance(chat_id, int):
+            return await make_request(bot, method)
+        cost = len(method.media) if name == 'SendMediaGroup' else 1
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, cost)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning('Telegram ограничил отправку в чат %s, повтор через %s с', chat_id, e.retry_after,
+                               extra={'method': name, 'attempt': attempt})
+                self.block_chat(chat_id, e.retry_after)
+
+
+send_scheduler = SendScheduler(
+    global_rate=Config.SEND_GLOBAL_RATE,
+    chat_rate=Config.SEND_CHAT_RATE,
+    chat_burst=Config.SEND_CHAT_BURST,
+    group_rate=Config.SEND_GROUP_RATE,
+    max_retries=Config.SEND_MAX_RETRIES,
+)
@@ -0,0 +1,238 @@
+import bisect
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from rapidfuzz import process, fuzz
+
+from app.config import Config
+from app.database import db
+from app.text import normalize_title
+
+# Доступные функции сходства (имя в настройках -> scorer rapidfuzz)
+SCORERS = {
+    'ratio': fuzz.ratio,
+    'WRatio': fuzz.WRatio,
+    'token_set_ratio': fuzz.token_set_ratio,
+    'token_sort_ratio': fuzz.token_sort_ratio,
+    'partial_ratio': fuzz.partial_ratio,
+}
+
+
+def get_scorer(name: str):
+    try:
+        return SCORERS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестная функция сходства: {name}. Доступны: {', '.join(SCORERS)}")
+
+
+class PrefixIndex:
+    # Подсказки по началу названия ("игра пр" -> "Игра престолов"): два отсортированных массива
+    # (нормализованный ключ, id) и bisect. В первом - названия целиком, во втором - хвосты названий,
+    # начиная с каждого следующего слова, поэтому находятся и совпадения с середины ("престолов").
+    # Поиск - O(log n + limit), вставка и удаление - O(log n) плюс сдвиг массива
+    def __init__(self):
+        self._titles: List[Tuple[str, int]] = []
+        self._words: List[Tuple[str, int]] = []
+
+    @staticmethod
+    def _word_keys(normalized: str) -> List[str]:
+        keys = []
+        space = normalized.find(' ')
+        while space != -1:
+            keys.append(normalized[space + 1:])
+            space = normalized.find(' ', space + 1)
+        return keys
+
+    def build(self, items):
+        # items: итерируемое (id, нормализованное название); сортировка один раз дешевле вставок по одной
+        self._titles = sorted((normalized, item_id) for item_id, normalized in items if normalized)
+        self._words = sorted((key, item_id) for normalized, item_id in self._titles for key in self._word_keys(normalized))
+
+    def insert(self, item_id: int, normalized: str):
+        if not normalized:
+            return
+        bisect.insort(self._titles, (normalized, item_id))
+        for key in self._word_keys(normalized):
+            bisect.insort(self._words, (key, item_id))
+
+    @staticmethod
+    def _delete(keys: List[Tuple[str, int]], entry: Tuple[str, int]):
+        position = bisect.bisect_left(keys, entry)
+        if position < len(keys) and keys[position] == entry:
+            del keys[position]
+
+    def delete(self, item_id: int, normalized: str):
+        if not normalized:
+            return
+        self._delete(self._titles, (normalized, item_id))
+        for key in self._word_keys(normalized):
+            self._delete(self._words, (key, item_id))
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Tuple[int, bool]]:
+        # [(id, совпадение с начала названия), ...]: сначала названия, начинающиеся с prefix,
+        # затем названия со словом, начинающимся с prefix; внутри групп - по алфавиту
+        found: List[Tuple[int, bool]] = []
+        seen = set()
+        if not prefix or limit <= 0:
+            return found
+        for keys, from_start in ((self._titles, True), (self._words, False)):
+            position = bisect.bisect_left(keys, (prefix,))
+            while position < len(keys) and len(found) < limit:
+                key, item_id = keys[position]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in seen:
+                    seen.add(item_id)
+                    found.append((item_id, from_start))
+                position += 1
+        return found
+
+
+class TitleIndex:
+    # Индекс названий в памяти: загружается один раз при старте и обновляется на месте
+    # при добавлении/удалении записей, поэтому поиск не обращается к SQLite.
+    # Нормализованные названия лежат в одном плотном списке, который напрямую
+    # передается в rapidfuzz как choices без пересборки на каждый запрос.
+    def __init__(self, table: str):
+        # table - таблица каталога, по триграммному FTS-индексу которой отбираются кандидаты
+        self.table = table
+        self._ids: List[int] = []
+        self._titles: List[str] = []
+        self._payloads: List[Any] = []
+        self._positions: Dict[int, int] = {}
+        self._by_title: Dict[str, List[int]] = {}
+        self._prefix = PrefixIndex()
+        # Растет при каждом изменении индекса - по нему кэши результатов поиска узнают об устаревании
+        self.version = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def load(self, rows):
+        # rows: итерируемое (id, title, payload)
+        version = self.version
+        self.__init__(self.table)
+        self.version = version + 1
+        for item_id, title, payload in rows:
+            self._append(item_id, normalize_title(title), payload)
+        self._prefix.build(zip(self._ids, self._titles))
+
+    def add(self, item_id: int, title: str, payload: Any):
+        if item_id in self._positions:
+            self.remove(item_id)
+        normalized = normalize_title(title)
+        self._append(item_id, normalized, payload)
+        self._prefix.insert(item_id, normalized)
+
+    def _append(self, item_id: int, normalized: str, payload: Any):
+        self._positions[item_id] = len(self._ids)
+        self._ids.append(item_id)
+        self._titles.append(normalized)
+        self._payloads.append(payload)
+        self._by_title.setdefault(normalized, []).append(item_id)
+        self.version += 1
+
+    def remove(self, item_id: int) -> bool:
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return False
+        normalized = self._titles[position]
+        self._prefix.delete(item_id, normalized)
+        same_title = self._by_title.get(normalized, [])
+        same_title.remove(item_id)
+        if not same_title:
+            del self._by_title[normalized]
+
+        # Переносим последний элемент на место удаленного, чтобы не сдвигать массивы
+        last = len(self._ids) - 1
+        if position != last:
+            self._ids[position] = self._ids[last]
+            self._titles[position] = self._titles[last]
+            self._payloads[position] = self._payloads[last]
+            self._positions[self._ids[position]] = position
+        self._ids.pop()
+        self._titles.pop()
+        self._payloads.pop()
+        self.version += 1
+        return True
+
+    def find_exact(self, query: str) -> Optional[Any]:
+        item_ids = self._by_title.get(normalize_title(query))
+        if not item_ids:
+            return None
+        return self._payloads[self._positions[item_ids[0]]]
+
+    def complete(self, query: str, limit: int = 10) -> List[Tuple[Any, float]]:
+        # Подсказки по началу названия или слова в формате search: совпадение с начала названия
+        # получает 100, с начала слова - 90
+        return [(self._payloads[self._positions[item_id]], 100.0 if from_start else 90.0)
+                for item_id, from_start in self._prefix.complete(normalize_title(query), limit)]
+
+    def search(self, query: str, limit: int = 10, score_cutoff: float = 0, scorer=fuzz.ratio, workers: int = 1) -> List[Tuple[Any, float]]:
+        # Возвращает [(payload, score), ...] по убыванию сходства
+        normalized = normalize_title(query)
+        if not normalized or not self._titles:
+            return []
+
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        if workers == 1:
+            # Один поток: process.extract тоже считает все в C-коде и переиспользует
+            # предобработанный запрос для каждого названия
+            results = process.extract(normalized, self._titles, scorer=scorer, limit=limit, score_cutoff=score_cutoff)
+            return [(self._payloads[index], score) for _, score, index in results]
+
+        # Несколько потоков: cdist распараллеливает расчет по строкам матрицы, поэтому названия
+        # передаются как queries, а запрос - как единственный choice (матрица N x 1).
+        # numpy нужен только здесь, поэтому не импортируем его при старте
+        import numpy as np
+
+        scores = process.cdist(self._titles, [normalized], scorer=scorer, score_cutoff=score_cutoff or None, workers=workers)[:, 0]
+        candidates = np.flatnonzero(scores >= score_cutoff) if score_cutoff else np.arange(len(scores))
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self._payloads[index], float(scores[index])) for index in candidates]
+
+    def rank(self, query: str, item_ids: List[int], limit: int = 10, score_cutoff: float = 0, scorer=fuzz.ratio) -> List[Tuple[Any, float]]:
+        # То же, что search, но только среди переданных ID (кандидатов из FTS)
+        normalized = normalize_title(query)
+        positions = [self._positions[item_id] for item_id in item_ids if item_id in self._positions]
+        if not normalized or not positions:
+            return []
+        choices = [self._titles[position] for position in positions]
+        results = process.extract(normalized, choices, scorer=scorer, limit=limit, score_cutoff=score_cutoff)
+        return [(self._payloads[positions[index]], score) for _, score, index in results]
+
+    async def find(self, query: str, limit: int = 10, score_cutoff: float = 0, scorer=fuzz.ratio, workers: int = 1) -> List[Tuple[Any, float]]:
+        # Для большого каталога сначала берем короткий список кандидатов из триграммного
+        # FTS5-индекса и оцениваем только их. Для маленького полный проход по индексу
+        # в памяти дешевле, чем запрос к базе
+        if len(self) >= Config.SEARCH_PREFILTER_MIN_TITLES:
+            candidate_ids = await db.match_title_trigrams(self.table, query, Config.SEARCH_PREFILTER_CANDIDATES)
+            if candidate_ids is not None:
+                return self.rank(query, candidate_ids, limit=limit, score_cutoff=score_cutoff, scorer=scorer)
+        return self.search(query, limit=limit, score_cutoff=score_cutoff, scorer=scorer, workers=workers)
+
+    async def suggest(self, query: str, limit: int = 10, score_cutoff: float = 0, scorer=fuzz.ratio, workers: int = 1) -> List[Tuple[Any, float]]:
+        # Для недописанного запроса сначала подсказки по префиксу, нечеткий поиск
+        # только добирает недостающие варианты (и исправляет опечатки)
+        results = self.complete(query, limit)
+        if len(results) < limit:
+            seen = {payload for payload, _ in results}
+            for payload, score in await self.find(query, limit=limit, score_cutoff=score_cutoff, scorer=scorer, workers=workers):
+                if payload not in seen and len(results) < limit:
+                    seen.add(payload)
+                    results.append((payload, score))
+        return results
+
+# Индексы каталога: фильмы -> payload (title, file_id), сериалы -> payload (id, title)
+film_index = TitleIndex('films')
+series_index = TitleIndex('series')
+
+
+async def load_indexes():
+    films = await db.list_films_full()
+    film_index.load((film_id, title, (title, file_id)) for film_id, title, file_id, _ in films)
+    series = await db.list_series()
+    series_index.load((series_id, title, (series_id, title)) for series_id, title in series)
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.config import Config
+from app.database import db, EpisodeView
+
+
+class SeasonNode(NamedTuple):
+    season_id: int
+    season_number: int
+    # (episode_id, episode_number, file_id) по порядку номеров
+    episodes: Tuple[Tuple[int, int, str], ...]
+
+
+class SeriesTree(NamedTuple):
+    series_id: int
+    title: str
+    # Версия структуры сериала: меняется при каждой инвалидации, по ней можно кэшировать
+    # производные данные (например, клавиатуры выбора сезона и серии)
+    version: int
+    seasons: Tuple[SeasonNode, ...]
+
+    def season(self, season_id: int) -> Optional[SeasonNode]:
+        for season in self.seasons:
+            if season.season_id == season_id:
+                return season
+        return None
+
+
+class SeriesCache:
+    # Кэш деревьев сериал -> сезоны -> эпизоды для навигации по сериалам.
+    # LRU по сериалам, одно дерево загружается одним запросом. Одновременные промахи
+    # по одному сериалу ждут одну загрузку. Любое изменение сериала (загрузка, импорт)
+    # должно вызывать invalidate(series_id) или clear()
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._trees: "OrderedDict[int, SeriesTree]" = OrderedDict()
+        self._season_series: Dict[int, int] = {}
+        # episode_id -> (season_id, позиция в сезоне)
+        self._episode_index: Dict[int, Tuple[int, int]] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._counter = itertools.count(1)
+        self._base_version = 0
+        self._versions: Dict[int, int] = {}
+
+    def version(self, series_id: int) -> int:
+        return max(self._versions.get(series_id, 0), self._base_version)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'series': len(self._trees),
+        }
+
+    def _forget(self, series_id: int):
+        tree = self._trees.pop(series_id, None)
+        if tree is None:
+            return
+        for season in tree.seasons:
+            self._season_series.pop(season.season_id, None)
+            for episode_id, _, _ in season.episodes:
+                self._episode_index.pop(episode_id, None)
+
+    def _store(self, tree: SeriesTree):
+        self._forget(tree.series_id)
+        self._trees[tree.series_id] = tree
+        for season in tree.seasons:
+            self._season_series[season.season_id] = tree.series_id
+            for position, (episode_id, _, _) in enumerate(season.episodes):
+                self._episode_index[episode_id] = (season.season_id, position)
+        while len(self._trees) > self.maxsize:
+            self._forget(next(iter(self._trees)))
+
+    def invalidate(self, series_id: int):
+        self._versions[series_id] = next(self._counter)
+        self._forget(series_id)
+
+    def clear(self):
+        # Например, после массового импорта, когда неизвестно, какие сериалы изменились
+        self._base_version = next(self._counter)
+        self._versions.clear()
+        self._trees.clear()
+        self._season_series.clear()
+        self._episode_index.clear()
+
+    async def _load(self, series_id: int) -> Optional[SeriesTree]:
+        version = self.version(series_id)
+        rows = await db.load_series_tree(series_id)
+        if not rows:
+            return None
+        seasons = []
+        for _, season_id, season_number, episode_id, episode_number, file_id in rows:
+            if season_id is None:
+                continue
+            if not seasons or seasons[-1][0] != season_id:
+                seasons.append((season_id, season_number, []))
+            if episode_id is not None:
+                seasons[-1][2].append((episode_id, episode_number, file_id))
+        tree = SeriesTree(series_id, rows[0][0], version, tuple(SeasonNode(s_id, number, tuple(episodes)) for s_id, number, episodes in seasons))
+        # Если сериал изменился, пока шел запрос, результат уже устарел - не кэшируем его
+        if self.version(series_id) == version:
+            self._store(tree)
+        return tree
+
+    async def get_series(self, series_id: int) -> Optional[SeriesTree]:
+        tree = self._trees.get(series_id)
+        if tree is not None:
+            self.hits += 1
+            self._trees.move_to_end(series_id)
+            return tree
+        self.misses += 1
+        future = self._loading.get(series_id)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[series_id] = future
+        try:
+            tree = await self._load(series_id)
+            future.set_result(tree)
+            return tree
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже получит вызывающий, ожидающих нет - не даем asyncio ругаться
+            future.exception()
+            raise
+        finally:
+            del self._loading[series_id]
+
+    async def get_season(self, season_id: int) -> Optional[Tuple[SeriesTree, SeasonNode]]:
+        series_id = self._season_series.get(season_id)
+        if series_id is None:
+            season = await db.get_season(season_id)
+            if not season:
+                return None
+            series_id = season[1]
+        tree = await self.get_series(series_id)
+        if tree is None:
+            return None
+        season = tree.season(season_id)
+        return (tree, season) if season is not None else None
+
+    async def get_episode_view(self, episode_id: int) -> Optional[EpisodeView]:
+        # Экран серии строится из кэшированного дерева, если сериал уже открывали;
+        # иначе - одним запросом к базе, без загрузки всего дерева
+        location = self._episode_index.get(episode_id)
+        if location is None:
+            self.misses += 1
+            return await db.get_episode_view(episode_id)
+        self.hits += 1
+        season_id, position = location
+        tree = self._trees[self._season_series[season_id]]
+        self._trees.move_to_end(tree.series_id)
+        season = tree.season(season_id)
+        episodes = season.episodes
+        _, episode_number, file_id = episodes[position]
+        prev_id = episodes[position - 1][0] if position > 0 else None
+        next_id = episodes[position + 1][0] if position + 1 < len(episodes) else None
+        return EpisodeView(file_id, episode_number, season.season_number, tree.title, season_id,
+                           tree.series_id, len(episodes), prev_id, next_id)
+
+
+series_cache = SeriesCache(Config.SERIES_CACHE_SIZE)
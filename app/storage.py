@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app import queries
+
+logger = logging.getLogger(__name__)
+
+
+# --- Сериализация данных FSM ---
+# Данные хранятся в JSON. В seasons_data ключи - int, а результаты поиска - кортежи, и после
+# перезапуска они должны восстановиться в том же виде, поэтому такие значения помечаются:
+# {"__tuple__": [...]} и {"__items__": [[ключ, значение], ...]} для словарей с не-строковыми ключами
+def _encode(value):
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value) and '__tuple__' not in value and '__items__' not in value:
+            return {k: _encode(v) for k, v in value.items()}
+        return {'__items__': [[_encode(k), _encode(v)] for k, v in value.items()]}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and '__tuple__' in value:
+            return tuple(_decode(item) for item in value['__tuple__'])
+        if len(value) == 1 and '__items__' in value:
+            return {_decode(k): _decode(v) for k, v in value['__items__']}
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def dumps_data(data: Dict[str, Any]) -> str:
+    return json.dumps(_encode(data), ensure_ascii=False, separators=(',', ':'))
+
+
+def loads_data(raw: str) -> Dict[str, Any]:
+    return _decode(json.loads(raw))
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, touched: Optional[float] = None):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.touched = touched if touched is not None else time.time()
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище в SQLite на общем пуле соединений (app.database.db).
+    # Состояния живут в памяти, а изменения сбрасываются в базу пачкой раз в flush_interval
+    # секунд (write-behind), поэтому на каждый апдейт нет отдельного commit/fsync.
+    # При перезапуске теряются только изменения последнего интервала.
+    # Записи, которые не менялись дольше ttl секунд, считаются устаревшими и удаляются.
+    # Таблицу fsm_storage создает миграция (app/migrations.py), данные хранятся в JSON (dumps_data)
+    def __init__(self, database, flush_interval: float = 1.0, ttl: float = 7 * 24 * 3600, cache_idle: float = 3600, purge_interval: float = 600):
+        self._db = database
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache_idle = cache_idle
+        self.purge_interval = purge_interval
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._last_purge = 0.0
+
+    async def start(self):
+        # Lock создаем внутри работающего event loop (на Python 3.9 он привязывается к loop при создании)
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        await self.purge_expired()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f'{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ""}:{key.destiny}'
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        record_key = self._key(key)
+        now = time.time()
+        record = self._records.get(record_key)
+        if record is None:
+            row = await self._db.fetchone(queries.GET_FSM_RECORD, (record_key,))
+            # Пока ждали базу, запись могла появиться в памяти из другого апдейта
+            record = self._records.get(record_key)
+            if record is None:
+                if row and row[2] >= now - self.ttl:
+                    record = _Record(row[0], loads_data(row[1]) if row[1] else {}, row[2])
+                else:
+                    record = _Record(touched=now)
+                self._records[record_key] = record
+        elif now - record.touched > self.ttl:
+            record.state, record.data = None, {}
+            self._mark_dirty(record_key, record)
+        return record
+
+    def _mark_dirty(self, record_key: str, record: _Record):
+        record.touched = time.time()
+        self._dirty.add(record_key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(self._key(key), record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._mark_dirty(self._key(key), record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Обновляем словарь на месте: базовая реализация делает get_data + set_data (две лишние копии)
+        record = await self._get_record(key)
+        record.data.update(data)
+        self._mark_dirty(self._key(key), record)
+        return record.data.copy()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            upserts = []
+            deletes = []
+            for record_key in dirty:
+                record = self._records.get(record_key)
+                if record is None or (record.state is None and not record.data):
+                    deletes.append((record_key,))
+                else:
+                    upserts.append((record_key, record.state, dumps_data(record.data), record.touched))
+            try:
+                async with self._db.acquire() as conn:
+                    if upserts:
+                        await conn.executemany(queries.UPSERT_FSM_RECORD, upserts)
+                    if deletes:
+                        await conn.executemany(queries.DELETE_FSM_RECORD, deletes)
+                    await conn.commit()
+            except Exception:
+                # Не теряем изменения: попробуем записать их при следующем сбросе
+                self._dirty |= dirty
+                raise
+
+    async def purge_expired(self):
+        now = time.time()
+        self._last_purge = now
+        async with self._db.acquire() as conn:
+            await conn.execute(queries.PURGE_FSM_RECORDS, (now - self.ttl,))
+            await conn.commit()
+        # Из памяти выгружаем давно не менявшиеся записи, уже сохраненные в базе
+        for record_key in [k for k, r in self._records.items() if now - r.touched > self.cache_idle and k not in self._dirty]:
+            del self._records[record_key]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_purge >= self.purge_interval:
+                    await self.purge_expired()
+            except Exception:
+                logger.exception('Ошибка при сохранении FSM-состояний')
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
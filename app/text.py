@@ -0,0 +1,15 @@
+import re
+
+# Нормализация названий для поиска. Одна функция и для индексов в памяти (app/search.py),
+# и для триграммных FTS5-индексов в SQLite (SQL-функция normalize_title, см. app/migrations.py),
+# чтобы запрос и индекс всегда приводились к одному виду
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_title(title: str) -> str:
+    # casefold, ё -> е, без пунктуации и лишних пробелов
+    title = title.casefold().replace('ё', 'е')
+    title = _PUNCTUATION_RE.sub(' ', title).replace('_', ' ')
+    return _SPACES_RE.sub(' ', title).strip()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _shard_key(update: Dict[str, Any]) -> int:
+    # Апдейты одного пользователя всегда попадают в одну очередь, чтобы FSM-переходы
+    # обрабатывались по порядку. Ключ берем из первого объекта события (message, callback_query ...)
+    for field, event in update.items():
+        if field != 'update_id' and isinstance(event, dict):
+            user = event.get('from') or event.get('user')
+            if user and 'id' in user:
+                return int(user['id'])
+            chat = event.get('chat')
+            if chat and 'id' in chat:
+                return int(chat['id'])
+    return int(update.get('update_id', 0))
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    # Обработчик вебхука aiogram с ограниченной очередью апдейтов и фиксированным числом
+    # воркеров вместо отдельной задачи на каждый апдейт. У каждого пользователя своя очередь:
+    # его апдейты обрабатываются строго по порядку (FSM-переходы), но любой свободный воркер берет
+    # следующего готового пользователя. Поэтому медленный обработчик занимает один воркер и задерживает
+    # только своего пользователя, а не всех, кто попал бы с ним в один шард.
+    # Если принято queue_size необработанных апдейтов, отвечаем 503, и Telegram повторит доставку позже
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = 8, queue_size: int = 1000, secret_token: Optional[str] = None, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.workers = max(1, workers)
+        self.queue_size = max(self.workers, queue_size)
+        # Ключ пользователя -> его необработанные апдейты; ключ есть в словаре, пока очередь не пуста
+        self._pending: Dict[int, Deque[Dict[str, Any]]] = {}
+        self._size = 0
+        # Пользователи, чей следующий апдейт можно обрабатывать (каждый - не больше одного раза)
+        self._ready: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        if self._worker_tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            pending = self._pending[key]
+            update = pending.popleft()
+            try:
+                await self._background_feed_update(bot=self.bot, update=update)
+            except Exception:
+                logger.exception('Ошибка при обработке апдейта %s', update.get('update_id'))
+            finally:
+                self._size -= 1
+                if pending:
+                    # Следующий апдейт пользователя - в конец очереди готовых, чтобы не обгонять остальных
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                self._ready.task_done()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if self._size >= self.queue_size:
+            return web.Response(status=503, text='Update queue is full', headers={'Retry-After': '1'})
+        self._size += 1
+        key = _shard_key(update)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            # Предыдущий апдейт пользователя еще в работе или в очереди - этот пойдет следом
+            pending.append(update)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # Дожидаемся обработки уже принятых апдейтов, затем останавливаем воркеров
+        if self._ready is not None:
+            await self._ready.join()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        await super().close()
+
+
+async def _healthcheck(request: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    app = web.Application()
+    handler = QueuedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        workers=Config.WEBHOOK_WORKERS,
+        queue_size=Config.WEBHOOK_QUEUE_SIZE,
+        secret_token=Config.WEBHOOK_SECRET,
+    )
+    handler.register(app, path=Config.WEBHOOK_PATH)
+    app.router.add_get('/healthz', _healthcheck)
+    setup_application(app, dp, bot=bot)
+
+    async def start_workers(_app: web.Application):
+        await handler.start()
+
+    app.on_startup.append(start_workers)
+    app['webhook_handler'] = handler
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    # Запуск aiohttp-сервера для вебхука. Если WEBHOOK_URL не задан, вебхук в Telegram
+    # не регистрируется - так сервер можно проверить локально, отправляя сохраненные апдейты POST-запросом
+    app = create_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=Config.WEBHOOK_HOST, port=Config.WEBHOOK_PORT)
+    await site.start()
+    logger.info('Вебхук слушает %s:%s%s', Config.WEBHOOK_HOST, Config.WEBHOOK_PORT, Config.WEBHOOK_PATH)
+
+    if Config.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+            secret_token=Config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
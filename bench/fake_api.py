@@ -0,0 +1,100 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter as CallCounter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+# Заглушка Telegram Bot API для бенчмарка. Бот ходит в нее через обычную aiohttp-сессию,
+# поэтому в замер попадают сериализация запросов и разбор ответов aiogram.
+# Апдейты отдаются через getUpdates из очереди готовых апдейтов (см. Replay в run.py)
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+
+# Методы, которые возвращают True вместо сообщения
+BOOL_METHODS = {'answercallbackquery', 'deletemessage', 'deletewebhook', 'setwebhook', 'setmycommands', 'answerinlinequery'}
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.calls: CallCounter = CallCounter()
+        self._updates: List[Dict[str, Any]] = []
+        self._has_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        # chat_id -> message_id последнего отправленного или измененного ботом сообщения
+        self.last_messages: Dict[int, int] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ''
+
+    def push(self, update: Dict[str, Any]) -> int:
+        # Ставит апдейт в очередь getUpdates, возвращает присвоенный update_id
+        update['update_id'] = next(self._update_ids)
+        self._updates.append(update)
+        self._has_updates.set()
+        return update['update_id']
+
+    def _message(self, chat_id: Any, message_id: Any = None) -> Dict[str, Any]:
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            chat_id = 1
+        # edit* возвращает то же сообщение, send* - новое
+        message_id = int(message_id) if message_id else next(self._message_ids)
+        self.last_messages[chat_id] = message_id
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+
+    async def _get_updates(self, params) -> List[Dict[str, Any]]:
+        timeout = float(params.get('timeout') or 0)
+        if not self._updates and timeout:
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        updates, self._updates = self._updates[:limit], self._updates[limit:]
+        if not self._updates:
+            self._has_updates.clear()
+        return updates
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        params = await request.post()
+        self.calls[method] += 1
+        if method == 'getupdates':
+            result: Any = await self._get_updates(params)
+        elif method == 'getme':
+            result = BOT_USER
+        elif method in BOOL_METHODS:
+            result = True
+        elif method == 'sendmediagroup':
+            result = [self._message(params.get('chat_id')) for _ in json.loads(params.get('media') or '[]')]
+        elif method.startswith('edit'):
+            result = self._message(params.get('chat_id'), params.get('message_id'))
+        else:
+            # send*/copy*/forward* - отвечаем новым сообщением в тот же чат
+            result = self._message(params.get('chat_id'))
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        # Порт 0 - свободный порт, выбранный системой
+        bound_port = self._runner.addresses[0][1]
+        self.url = f'http://{host}:{bound_port}'
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
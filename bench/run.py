@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.callbacks import ViewSeries, SelectSeason, SelectEpisode, NextEpisode
+
+# Офлайн-бенчмарк бота: настоящие dp/router из app/bot.py работают в режиме polling против
+# локальной заглушки Bot API (bench/fake_api.py) на синтетических базах разного размера.
+#
+#   python -m bench.run                               - все сценарии на 1k/10k/100k, сравнение с базовой линией
+#   python -m bench.run --sizes 1000 --scale 0.2      - быстрый прогон
+#   python -m bench.run --save-baseline               - записать текущие результаты как базовую линию
+#
+# Код возврата 1, если какой-то сценарий медленнее базовой линии больше чем на --tolerance
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines.json')
+DEFAULT_SIZES = (1000, 10000, 100000)
+BENCH_TOKEN = '123456:bench-token'
+BENCH_USER_ID = 10_000_000
+
+
+# --- Синтетические апдейты ---
+class UpdateFactory:
+    def __init__(self):
+        self._ids = iter(range(1, 1 << 62))
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'is_bot': False, 'first_name': 'bench'}
+
+    def message(self, user_id: int, text: str) -> Dict[str, Any]:
+        return {'message': {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }}
+
+    def callback(self, user_id: int, data: str, last_message: bool = False) -> Dict[str, Any]:
+        # Нажатие кнопки под сообщением бота. last_message - под последним сообщением, которое бот
+        # отправил в этот чат: его id известен только во время прогона, и его подставляет Replay
+        return {'callback_query': {
+            'id': str(next(self._ids)),
+            'from': self._user(user_id),
+            'chat_instance': 'bench',
+            'data': data,
+            'message': {
+                'message_id': None if last_message else next(self._ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 123456, 'is_bot': True, 'first_name': 'bench'},
+                'text': 'bench',
+            },
+        }}
+
+
+def _typo(title: str, rng: random.Random) -> str:
+    # Опечатка: две соседние буквы меняются местами и одна пропадает
+    chars = list(title)
+    position = rng.randrange(1, len(chars) - 2)
+    chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    del chars[rng.randrange(len(chars))]
+    return ''.join(chars)
+
+
+# --- Сценарии ---
+# Сценарий строит одну пользовательскую сессию - последовательность апдейтов одного пользователя.
+# Следующий апдейт сессии отправляется только после обработки предыдущего, как у живого пользователя
+def film_search(updates: UpdateFactory, catalogue, rng: random.Random, user_id: int) -> List[dict]:
+    return [updates.callback(user_id, 'find_film'), updates.message(user_id, rng.choice(catalogue['films']))]
+
+
+def fuzzy_miss(updates: UpdateFactory, catalogue, rng: random.Random, user_id: int) -> List[dict]:
+    # Точного совпадения нет - нечеткий поиск, затем отмена выбора из предложенных
+    return [
+        updates.callback(user_id, 'find_film'),
+        updates.message(user_id, _typo(rng.choice(catalogue['films']), rng)),
+        updates.message(user_id, 'отмена'),
+    ]
+
+
+def series_navigation(updates: UpdateFactory, catalogue, rng: random.Random, user_id: int) -> List[dict]:
+    series_id, title, season_id, episode_ids = rng.choice(catalogue['series'])
+    steps = [
+        updates.callback(user_id, 'find_series'),
+        updates.message(user_id, title),
+        updates.callback(user_id, ViewSeries(series_id=series_id).pack()),
+        updates.callback(user_id, SelectSeason(season_id=season_id).pack()),
+        updates.callback(user_id, SelectEpisode(episode_id=episode_ids[0]).pack()),
+    ]
+    # "Следующая серия" нажимается под отправленным видео - бот меняет его через editMessageMedia
+    steps.extend(updates.callback(user_id, NextEpisode(episode_id=episode_id).pack(), last_message=True)
+                 for episode_id in episode_ids[1:3])
+    return steps
+
+
+def admin_export(updates: UpdateFactory, catalogue, rng: random.Random, user_id: int) -> List[dict]:
+    return [updates.callback(catalogue['admin_id'], 'export_db')]
+
+
+# имя -> (сессия, число сессий при --scale 1, одновременных пользователей)
+SCENARIOS: Dict[str, tuple] = {
+    'film_search': (film_search, 400, 20),
+    'fuzzy_miss': (fuzzy_miss, 200, 20),
+    'series_navigation': (series_navigation, 100, 20),
+    'admin_export': (admin_export, 3, 1),
+}
+
+
+class Replay:
+    # Раздает сессии сценария через очередь getUpdates, держа concurrency сессий в работе,
+    # и собирает задержку каждого апдейта: от постановки в очередь до конца обработки
+    def __init__(self, api, sessions: List[List[dict]], concurrency: int):
+        self.api = api
+        self.concurrency = max(1, concurrency)
+        self.latencies: List[float] = []
+        self.done = asyncio.Event()
+        self._pending: Deque[Deque[dict]] = deque(deque(session) for session in sessions)
+        self._in_flight: Dict[int, tuple] = {}
+        self.started = self.finished = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        if not self._pending:
+            self.done.set()
+        for _ in range(min(self.concurrency, len(self._pending))):
+            self._release(self._pending.popleft())
+
+    def _release(self, steps: Deque[dict]):
+        update = steps.popleft()
+        message = update.get('callback_query', {}).get('message')
+        if message is not None and message['message_id'] is None:
+            message['message_id'] = self.api.last_messages.get(message['chat']['id'], 1)
+        update_id = self.api.push(update)
+        self._in_flight[update_id] = (steps, time.perf_counter())
+
+    def finish(self, update_id: int):
+        item = self._in_flight.pop(update_id, None)
+        if item is None:
+            return
+        steps, queued_at = item
+        self.latencies.append(time.perf_counter() - queued_at)
+        if steps:
+            self._release(steps)
+        elif self._pending:
+            self._release(self._pending.popleft())
+        elif not self._in_flight:
+            self.finished = time.perf_counter()
+            self.done.set()
+
+
+def percentile(values: List[float], percent: float) -> float:
+    # Ближайший ранг: p99 из 100 значений - 99-е по возрастанию
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+# --- Процесс-исполнитель: один размер базы ---
+async def _load_catalogue(db) -> Dict[str, Any]:
+    films = [row[0] for row in await db.fetchall('SELECT title FROM films ORDER BY id')]
+    rows = await db.fetchall('''
+        SELECT ser.id, ser.title, s.id, e.id FROM series ser
+        JOIN seasons s ON s.series_id = ser.id
+        JOIN episodes e ON e.season_id = s.id
+        WHERE s.season_number = 1
+        ORDER BY ser.id, e.episode_number
+    ''')
+    series: Dict[int, tuple] = {}
+    for series_id, title, season_id, episode_id in rows:
+        series.setdefault(series_id, (series_id, title, season_id, []))[3].append(episode_id)
+    return {'films': films, 'series': [item for item in series.values() if len(item[3]) >= 3]}
+
+
+async def _run_worker(scenario_names: List[str], scale: float, seed: int) -> Dict[str, Any]:
+    from aiogram import BaseMiddleware
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from bench.fake_api import FakeBotApi
+    import app.bot as appbot
+    from app.database import db
+    from app.handlers import ADMIN_IDS
+
+    api = FakeBotApi()
+    await api.start()
+    appbot.bot.session.api = TelegramAPIServer.from_base(api.url)
+    replay: Optional[Replay] = None
+
+    class ReplayMiddleware(BaseMiddleware):
+        async def __call__(self, handler, event, data):
+            try:
+                return await handler(event, data)
+            finally:
+                if replay is not None:
+                    replay.finish(event.update_id)
+
+    appbot.dp.update.outer_middleware(ReplayMiddleware())
+    await appbot.startup()
+    polling = asyncio.create_task(appbot.dp.start_polling(appbot.bot, handle_signals=False, close_bot_session=False, polling_timeout=1))
+    results = {}
+    try:
+        catalogue = await _load_catalogue(db)
+        catalogue['admin_id'] = next(iter(ADMIN_IDS))
+        updates = UpdateFactory()
+        rng = random.Random(seed)
+        user_ids = iter(range(BENCH_USER_ID, BENCH_USER_ID * 2))
+        for name in scenario_names:
+            build, sessions, concurrency = SCENARIOS[name]
+            count = max(1, int(sessions * scale))
+            # Прогрев: кэши, ленивые импорты (openpyxl), подготовленные выражения SQLite
+            for measured, total in ((False, max(1, count // 10)), (True, count)):
+                replay = Replay(api, [build(updates, catalogue, rng, next(user_ids)) for _ in range(total)], concurrency)
+                calls_before = sum(api.calls.values()) - api.calls['getupdates']
+                replay.start()
+                await replay.done.wait()
+            api_calls = sum(api.calls.values()) - api.calls['getupdates'] - calls_before
+            elapsed = replay.finished - replay.started
+            results[name] = {
+                'updates': len(replay.latencies),
+                'p50_ms': round(percentile(replay.latencies, 50) * 1000, 3),
+                'p99_ms': round(percentile(replay.latencies, 99) * 1000, 3),
+                'updates_per_sec': round(len(replay.latencies) / elapsed, 1) if elapsed else 0.0,
+                'api_calls_per_update': round(api_calls / len(replay.latencies), 2),
+            }
+            replay = None
+    finally:
+        await appbot.dp.stop_polling()
+        await polling
+        await appbot.shutdown()
+        await appbot.bot.session.close()
+        await api.stop()
+    return results
+
+
+# --- Запуск и сравнение с базовой линией ---
+def _seeded_database(data_dir: str, size: int, reseed: bool) -> str:
+    from bench.seed import seed_database
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'catalogue_{size}.db')
+    if reseed or not os.path.exists(path):
+        started = time.perf_counter()
+        asyncio.run(seed_database(path, size))
+        print(f'База на {size} названий создана за {time.perf_counter() - started:.1f} с: {path}')
+    return path
+
+
+def _run_size(args, size: int) -> Dict[str, Any]:
+    # Каждый размер - отдельный процесс: Config и пул соединений читают DB_PATH при импорте
+    seeded = _seeded_database(args.data_dir, size, args.reseed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'films.db')
+        shutil.copyfile(seeded, db_path)
+        # Лимиты отправки Telegram сняты: бенчмарк меряет обработку апдейтов, а не паузы планировщика
+        env = dict(os.environ, DB_PATH=db_path, BOT_TOKEN=BENCH_TOKEN, BOT_MODE='polling',
+                   METRICS_ENABLED='0', IMPORT_TIME_REPORT='0',
+                   SEND_GLOBAL_RATE='1000000', SEND_CHAT_RATE='1000000', SEND_CHAT_BURST='1000000')
+        command = [sys.executable, '-m', 'bench.run', '--worker', '--scenarios', ','.join(args.scenarios),
+                   '--scale', str(args.scale), '--seed', str(args.seed)]
+        completed = subprocess.run(command, cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float, min_delta_ms: float) -> List[str]:
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] > min_delta_ms:
+                regressions.append(f'{key}: {metric} {base[metric]} -> {current[metric]}')
+        if current['updates_per_sec'] < base['updates_per_sec'] / (1 + tolerance):
+            regressions.append(f"{key}: updates_per_sec {base['updates_per_sec']} -> {current['updates_per_sec']}")
+    return regressions
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Офлайн-бенчмарк бота против заглушки Telegram Bot API')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='размеры каталога через запятую')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='сценарии через запятую')
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель числа сессий в сценариях')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='файл базовой линии')
+    parser.add_argument('--save-baseline', action='store_true', help='записать результаты как базовую линию')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимое ухудшение (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='меньшие изменения задержки не считаются регрессией')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'heartecho-bench'), help='каталог для сгенерированных баз')
+    parser.add_argument('--reseed', action='store_true', help='пересоздать базы')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}. Доступны: {', '.join(SCENARIOS)}")
+    args.sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    return args
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    if args.worker:
+        print(json.dumps(asyncio.run(_run_worker(args.scenarios, args.scale, args.seed))))
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        for name, stats in _run_size(args, size).items():
+            results[f'{name}@{size}'] = stats
+
+    print(f"{'сценарий':<28}{'апдейтов':>10}{'p50, мс':>10}{'p99, мс':>10}{'апд/с':>10}{'API/апд':>10}")
+    for key, stats in results.items():
+        print(f"{key:<28}{stats['updates']:>10}{stats['p50_ms']:>10}{stats['p99_ms']:>10}{stats['updates_per_sec']:>10}{stats['api_calls_per_update']:>10}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f'Базовая линия записана в {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('Базовой линии нет - сравнение пропущено (запустите с --save-baseline)')
+        return 0
+    with open(args.baseline, encoding='utf-8') as file:
+        regressions = compare(results, json.load(file), args.tolerance, args.min_delta_ms)
+    for line in regressions:
+        print(f'РЕГРЕССИЯ {line}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import itertools
+import os
+import random
+
+import aiosqlite
+
+from app.migrations import migrate
+
+# Синтетический каталог для бенчмарка: size фильмов, size / 10 сериалов
+# по SEASONS_PER_SERIES сезонов и EPISODES_PER_SEASON серий. Названия детерминированы (seed),
+# поэтому базы одного размера одинаковы между запусками и сравнимы с базовой линией
+
+SEASONS_PER_SERIES = 2
+EPISODES_PER_SEASON = 5
+SEED = 20240501
+
+_ADJECTIVES = (
+    'Темный', 'Последний', 'Тихий', 'Красный', 'Северный', 'Забытый', 'Звездный', 'Железный', 'Ночной', 'Далекий',
+    'Белый', 'Золотой', 'Старый', 'Новый', 'Дикий', 'Стальной', 'Ледяной', 'Огненный', 'Тайный', 'Большой',
+    'Маленький', 'Горячий', 'Холодный', 'Быстрый', 'Жестокий', 'Великий', 'Бешеный', 'Лунный', 'Солнечный', 'Морской',
+    'Лесной', 'Городской', 'Пустой', 'Черный', 'Синий', 'Зеленый', 'Серый', 'Вечный', 'Первый', 'Чужой',
+    'Русский', 'Морозный', 'Туманный', 'Пыльный', 'Каменный', 'Хрустальный', 'Медный', 'Южный', 'Восточный', 'Западный',
+)
+_NOUNS = (
+    'город', 'рассвет', 'берег', 'лес', 'океан', 'ветер', 'путь', 'остров', 'мост', 'поезд',
+    'замок', 'сад', 'дом', 'горизонт', 'корабль', 'капитан', 'детектив', 'рыцарь', 'охотник', 'пилот',
+    'доктор', 'шторм', 'огонь', 'лед', 'сон', 'след', 'код', 'сигнал', 'маяк', 'перевал',
+    'экспресс', 'патруль', 'бункер', 'форт', 'квартал', 'район', 'проспект', 'вокзал', 'порт', 'рейс',
+    'архив', 'свидетель', 'агент', 'приказ', 'закон', 'контракт', 'рубеж', 'фронт', 'полюс', 'меридиан',
+)
+_SUFFIXES = (
+    '', '2', '3', 'Возвращение', 'Начало', 'Наследие', 'Перезагрузка', 'Финал', 'Легенда', 'Хроники',
+    'Пробуждение', 'Восстание', 'Империя', 'Искупление', 'Возмездие', 'Эпилог', 'Пролог', 'Игра', 'Охота', 'Тень',
+    'Расплата', 'Граница', 'Исход', 'Рассвет', 'Закат', 'Ночь', 'День', 'Год', 'Зима', 'Лето',
+    'Осень', 'Весна', 'Код', 'Ключ', 'Выбор', 'Путь', 'Долг', 'Клятва', 'Тайна', 'Правда',
+    'Миф', 'Сага', 'Глава 1', 'Глава 2', 'Часть 1', 'Часть 2', 'Режиссерская версия', 'Ремейк', 'Сиквел', 'Спин-офф',
+)
+
+
+def catalogue_titles(count: int):
+    # count уникальных названий "Прилагательное существительное: Подзаголовок" в случайном порядке
+    combinations = list(itertools.product(_ADJECTIVES, _NOUNS, _SUFFIXES))
+    if count > len(combinations):
+        raise ValueError(f'Можно сгенерировать не больше {len(combinations)} названий')
+    random.Random(SEED).shuffle(combinations)
+    for adjective, noun, suffix in combinations[:count]:
+        yield f'{adjective} {noun}: {suffix}' if suffix else f'{adjective} {noun}'
+
+
+async def seed_database(path: str, size: int, chunk_size: int = 5000):
+    # Создает базу через те же миграции, что и бот, и заполняет ее пачками executemany
+    if os.path.exists(path):
+        os.remove(path)
+    series_count = max(1, size // 10)
+    titles = list(catalogue_titles(size + series_count))
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute('PRAGMA journal_mode=WAL')
+        await migrate(conn)
+        films = [(title, f'BAADAgAD_film_{i}', 1) for i, title in enumerate(titles[:size], 1)]
+        for start in range(0, len(films), chunk_size):
+            await conn.executemany('INSERT INTO films (title, file_id, user_id) VALUES (?, ?, ?)', films[start:start + chunk_size])
+        await conn.executemany('INSERT INTO series (id, title, user_id) VALUES (?, ?, 1)', enumerate(titles[size:], 1))
+        seasons = []
+        episodes = []
+        for series_id in range(1, series_count + 1):
+            for season_number in range(1, SEASONS_PER_SERIES + 1):
+                season_id = len(seasons) + 1
+                seasons.append((season_id, series_id, season_number))
+                for episode_number in range(1, EPISODES_PER_SEASON + 1):
+                    episodes.append((season_id, episode_number, f'BAADAgAD_ep_{season_id}_{episode_number}', 1))
+        await conn.executemany('INSERT INTO seasons (id, series_id, season_number) VALUES (?, ?, ?)', seasons)
+        for start in range(0, len(episodes), chunk_size):
+            await conn.executemany('INSERT INTO episodes (season_id, episode_number, file_id, user_id) VALUES (?, ?, ?, ?)', episodes[start:start + chunk_size])
+        await conn.commit()
+        await conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
@@ -0,0 +1,60 @@
+import asyncio
+
+import aiosqlite
+import pytest
+
+from app import queries
+from app.database import trigram_match_query
+from app.migrations import SCHEMA_VERSION, get_schema_version, migrate
+
+# База, созданная старым init_db: таблицы без ограничений уникальности, user_version = 0
+OLD_SCHEMA = '''
+    CREATE TABLE series (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL);
+    CREATE TABLE seasons (id INTEGER PRIMARY KEY AUTOINCREMENT, series_id INTEGER NOT NULL, season_number INTEGER NOT NULL);
+    CREATE TABLE episodes (id INTEGER PRIMARY KEY AUTOINCREMENT, season_id INTEGER NOT NULL, episode_number INTEGER NOT NULL, file_id TEXT NOT NULL);
+    INSERT INTO series (id, title) VALUES (1, 'Сериал');
+    INSERT INTO seasons (id, series_id, season_number) VALUES (1, 1, 1), (2, 1, 1);
+    INSERT INTO episodes (id, season_id, episode_number, file_id) VALUES (1, 1, 1, 'a'), (2, 2, 2, 'b'), (3, 2, 1, 'c');
+'''
+
+
+def test_duplicate_episodes_abort_migration(tmp_path):
+    async def run():
+        async with aiosqlite.connect(str(tmp_path / 'films.db')) as conn:
+            await conn.executescript(OLD_SCHEMA)
+            # Серия 1 есть в обоих повторяющихся сезонах: какой file_id оставить, решает админ
+            with pytest.raises(RuntimeError, match='"Сериал" сезон 1 серия 1'):
+                await migrate(conn)
+            async with conn.execute('SELECT id, season_id FROM episodes ORDER BY id') as cursor:
+                assert await cursor.fetchall() == [(1, 1), (2, 2), (3, 2)]
+
+            await conn.execute('DELETE FROM episodes WHERE id = 3')
+            await conn.commit()
+            await migrate(conn)
+            assert await get_schema_version(conn) == SCHEMA_VERSION
+            # Повторяющиеся сезоны слиты без потери эпизодов
+            async with conn.execute('SELECT id, season_id FROM episodes ORDER BY id') as cursor:
+                assert await cursor.fetchall() == [(1, 1), (2, 1)]
+            async with conn.execute('SELECT id FROM seasons') as cursor:
+                assert await cursor.fetchall() == [(1,)]
+    asyncio.run(run())
+
+
+def test_title_trigrams_match_normalized_titles(tmp_path):
+    # Триграммный индекс и запрос нормализуются одинаково: "е" находит "ё", пунктуация не мешает
+    async def run():
+        async with aiosqlite.connect(str(tmp_path / 'films.db')) as conn:
+            await migrate(conn)
+            await conn.execute("INSERT INTO films (title, file_id, user_id) VALUES ('Ёлки-палки!', 'f', 1)")
+
+            async def match(query):
+                sql = queries.MATCH_TITLE_TRIGRAMS.format(fts='films_fts')
+                async with conn.execute(sql, (trigram_match_query(query), 10)) as cursor:
+                    return [row[0] for row in await cursor.fetchall()]
+
+            assert await match('елки палки') == [1]
+            await conn.execute("UPDATE films SET title = 'Другое' WHERE id = 1")
+            assert await match('елки палки') == []
+            await conn.execute('DELETE FROM films WHERE id = 1')
+            assert await match('другое') == []
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import asyncio
+
+import aiosqlite
+
+from app import queries
+from app.migrations import HOT_QUERIES, SCHEMA_VERSION, explain_hot_queries, find_table_scans, get_schema_version, migrate
+
+
+def _plans(path):
+    async def run():
+        async with aiosqlite.connect(str(path)) as conn:
+            await migrate(conn)
+            assert await get_schema_version(conn) == SCHEMA_VERSION
+            return await explain_hot_queries(conn)
+    return asyncio.run(run())
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    # Горячие запросы не должны читать таблицы целиком на свежей базе после всех миграций
+    assert find_table_scans(_plans(tmp_path / 'films.db')) == {}
+
+
+def test_hot_queries_cover_repository_sql():
+    # Проверяются те же строки SQL, что выполняет Database
+    checked = {sql for sql, _ in HOT_QUERIES.values()}
+    assert queries.GET_EPISODE_VIEW in checked
+    assert queries.FIND_FILM_TITLES_FTS in checked
+    for page in queries.PAGE_QUERIES.values():
+        assert set(page) <= checked
+
+
+def test_table_scan_is_detected():
+    plans = {
+        'full': ['SCAN films'],
+        'alias': ['SCAN e USING COVERING INDEX ux_episodes_season_number'],
+        'fts': ['SCAN films_fts VIRTUAL TABLE INDEX 0:M1'],
+        'subquery': ['SCAN (subquery-1)', 'SCAN CONSTANT ROW'],
+    }
+    assert set(find_table_scans(plans)) == {'full', 'alias'}
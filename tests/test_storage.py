@@ -0,0 +1,13 @@
+from app.storage import dumps_data, loads_data
+
+
+def test_fsm_data_round_trip():
+    # Кортежи и словари с int-ключами должны восстановиться после перезапуска в том же виде
+    data = {
+        'similar_find_results': [('Фильм', 'fid1'), ('Другой', 'fid2')],
+        'seasons_data': {1: [('ep', 'fid')], 2: []},
+        'found_series_title': 'Сериал',
+        'nested': {'__tuple__': 'не метка'},
+        'count': 3,
+    }
+    assert loads_data(dumps_data(data)) == data